@@ -0,0 +1,149 @@
+"""
+analysis_index.py - Skip re-analyzing sweep trials that haven't changed
+
+analyze_sweep keeps each trial's metrics in analysis_index.json next to
+summary.csv, along with a fingerprint of the files they came from (the
+detail log, metrics.json and hashing.json): path, size, modification
+time and a content hash. On the next run a trial whose files still match
+is taken from the index, and only new or changed trials are read again.
+
+Checking a trial is cheap: if the size and modification time match the
+file isn't read at all. If only the modification time changed (e.g. the
+results were copied), the content hash decides. Inside a zip archive the
+CRC-32 the archive already stores is used as the hash.
+
+Entries also record the analysis duration and a hash of the analysis
+code, so changing either re-analyzes everything.
+"""
+import os
+import json
+import hashlib
+
+
+INDEX_FILE = "analysis_index.json"
+
+INDEX_VERSION = 1
+
+# Source files that decide what analyze_trial returns
+ANALYSIS_FILES = [
+    'analysis_index.py',
+    'analyze_sweep.py',
+    'event_log.py',
+    'metrics.py',
+    'results_io.py',
+]
+
+# Files a trial's metrics are read from (each may also be .gz or .zst)
+TRACKED_FILES = ["detail_log.npy", "detail_log.csv", "metrics.json", "hashing.json"]
+
+
+def analysis_version():
+    """Hash of the analysis source files"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for name in ANALYSIS_FILES:
+        path = os.path.join(here, name)
+        if os.path.exists(path):
+            digest.update(name.encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def trial_fingerprint(trial):
+    """
+    {file name: {'size', 'mtime', 'hash'}} for the files a trial's metrics come from
+
+    trial: ResultsDir or ResultsZip for the trial directory
+    """
+    fingerprint = {}
+    for base_name in TRACKED_FILES:
+        name = trial.find(base_name)
+        if name is None:
+            continue
+        size, mtime = trial.stat(name)
+        fingerprint[name] = {'size': size, 'mtime': mtime, 'hash': trial.content_hash(name)}
+    return fingerprint
+
+
+class AnalysisIndex:
+    """
+    Per-trial metrics from earlier analyze_sweep runs
+
+    path: The index file (analysis_index.json)
+    duration: Duration the trials are analyzed with; entries for another
+              duration don't match
+
+    hits, misses: How many trials lookup() found unchanged, and how many not
+    """
+    def __init__(self, path, duration):
+        self.path = path
+        self.duration = duration
+        self.version = analysis_version()
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._used = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    index = json.load(f)
+            except ValueError:
+                index = {}  # Unreadable (e.g. cut short) - start over
+            if index.get('version') == INDEX_VERSION and index.get('analysis_version') == self.version:
+                self.entries = index['trials']
+
+    def lookup(self, key, trial):
+        """
+        (metrics, hash CPU seconds) saved for a trial, or None if it has
+        to be analyzed again
+
+        key: The trial's name in the sweep (e.g. "trial_3")
+        trial: ResultsDir or ResultsZip for the trial directory
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry['duration'] != self.duration or not self._unchanged(entry['files'], trial):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._used[key] = entry
+        return entry['metrics'], entry['hash_cpu_seconds']
+
+    def _unchanged(self, files, trial):
+        present = [name for name in map(trial.find, TRACKED_FILES) if name is not None]
+        if sorted(present) != sorted(files):
+            return False
+        for name in present:
+            saved = files[name]
+            size, mtime = trial.stat(name)
+            if size != saved['size']:
+                return False
+            if mtime != saved['mtime']:
+                if trial.content_hash(name) != saved['hash']:
+                    return False
+                saved['mtime'] = mtime  # Same content, touched - skip hashing next time
+        return True
+
+    def store(self, key, fingerprint, metrics, hash_cpu_seconds):
+        """Record a freshly analyzed trial (fingerprint taken before it was read)"""
+        self._used[key] = {
+            'duration': self.duration,
+            'files': fingerprint,
+            'metrics': metrics,
+            'hash_cpu_seconds': hash_cpu_seconds,
+        }
+
+    def save(self):
+        """
+        Write the entries looked up or stored this run
+
+        Trials no longer in the sweep are dropped. Written to a temporary
+        file and renamed, so an interruption leaves the old index in place.
+        """
+        index = {'version': INDEX_VERSION, 'analysis_version': self.version, 'trials': self._used}
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
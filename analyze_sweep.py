@@ -3,121 +3,190 @@ analyze_sweep.py - Analyze parameter sweep results
 
 Computes metrics including time_to_compromise and throughput,
 then aggregates across seeds to get mean and std.
+
+Results can be read straight from a zip archive and from compressed
+logs (see results_io.py):
+
+    python analyze_sweep.py paper_results.zip/results
+
+Each trial's metrics are kept in analysis_index.json next to summary.csv
+(see analysis_index.py), so a re-run only reads trials that are new or
+whose logs changed. --full re-analyzes everything.
 """
 import os
 import csv
-import sys
+import json
+import argparse
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from metrics import TrialMetrics
+from event_log import event_log_metrics
+from results_io import open_results
+from analysis_index import AnalysisIndex, INDEX_FILE, trial_fingerprint
+
+
+def analyze_events(events, duration):
+    """
+    Compute trial metrics in one pass over an iterable of events
+    
+    events: Dicts keyed like detail_log.csv rows (timestamp, actor_name,
+            actor_type, username, result). Can be a csv reader or a
+            generator fed straight from a simulation.
+    """
+    metrics = TrialMetrics()
+    for row in events:
+        metrics.add_row(row)
+    return metrics.results(duration)
+
+
+@contextmanager
+def _trial_results(trial_dir):
+    """Results for a trial given as a location string (closed afterwards) or already open"""
+    if not isinstance(trial_dir, str):
+        yield trial_dir
+        return
+    with open_results(trial_dir) as trial:
+        yield trial
 
 
 def analyze_trial(trial_dir, duration):
     """
     Analyze one trial with enhanced metrics
     
+    trial_dir: The trial's directory (may be inside a zip archive), or a
+               results_io location for it. Logs can be gzip or zstd
+               compressed (detail_log.csv.gz, detail_log.csv.zst).
+    
     Returns dict with:
     - compromised, compromise_rate, time_to_compromise
     - block_rate, users_impacted
     - throughput
-    """
-    detail_log = os.path.join(trial_dir, "detail_log.csv")
     
-    # Read all events
-    events = []
-    with open(detail_log, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            events.append(row)
-    
-    # Separate attacker and user events
-    attacker_events = [e for e in events if e['actor_type'] == 'attacker']
-    user_events = [e for e in events if e['actor_type'] == 'user']
-    
-    # Did attackers succeed on victim account?
-    attacker_successes = [e for e in attacker_events if e['result'] == 'success' and e['username'] == 'victim']
-    compromised = 1 if len(attacker_successes) > 0 else 0
-    
-    # Also track non-victim compromises (credential stuffing)
-    non_victim_successes = [e for e in attacker_events if e['result'] == 'success' and e['username'] != 'victim']
-    non_victim_compromised = len(set([e['username'] for e in non_victim_successes]))
-    
-    # Time to compromise
-    if attacker_successes:
-        # Get earliest success timestamp
-        time_to_compromise = min([float(e['timestamp']) for e in attacker_successes])
-    else:
-        time_to_compromise = duration  # Never compromised
-    
-    # Compromise rate (fraction of attacker attempts that succeeded)
-    if len(attacker_events) > 0:
-        compromise_rate = len(attacker_successes) / len(attacker_events)
-    else:
-        compromise_rate = 0.0
-    
-    # User blocking
-    user_attempts = [e for e in user_events if e['result'] != '']
-    user_blocked = [e for e in user_attempts if e['result'] == 'blocked']
-    
-    if len(user_attempts) > 0:
-        block_rate = len(user_blocked) / len(user_attempts)
-    else:
-        block_rate = 0.0
-    
-    # Users impacted
-    blocked_users = set([e['actor_name'] for e in user_blocked])
-    all_users = set([e['actor_name'] for e in user_events])
-    
-    if len(all_users) > 0:
-        impacted_users_pct = len(blocked_users) / len(all_users)
-    else:
-        impacted_users_pct = 0.0
-    
-    # Throughput (total login attempts per second)
-    if duration > 0:
-        throughput = len(events) / duration
-    else:
-        throughput = 0.0
+    The log is streamed row by row, so memory use doesn't grow with trial length.
+    A binary detail_log.npy (log_format="npy") is read column by column
+    instead. Trials run with log_level="summary" have no detail log; their
+    metrics.json (collected during the run) is used instead.
+    """
+    with _trial_results(trial_dir) as trial:
+        event_log = trial.find("detail_log.npy")
+        detail_log = trial.find("detail_log.csv")
+        
+        if event_log is not None:
+            # Memory-mapped when it's a plain file, read into memory otherwise
+            path = trial.local_path(event_log)
+            if path is not None:
+                return event_log_metrics(path).results(duration)
+            return event_log_metrics(f"{trial}/{event_log}", trial.read_bytes(event_log)).results(duration)
+        if detail_log is None and trial.exists("metrics.json"):
+            with trial.open_text("metrics.json") as f:
+                return TrialMetrics.from_dict(json.load(f)).results(duration)
+        if detail_log is None:
+            raise FileNotFoundError(f"No detail log or metrics.json in {trial}")
+        
+        with trial.open_text(detail_log) as f:
+            return analyze_events(csv.DictReader(f), duration)
+
+
+def hashing_cpu_seconds(trial_dir):
+    """
+    CPU seconds the trial spent verifying passwords, from hashing.json
     
-    return {
-        'compromised': compromised,
-        'compromise_rate': compromise_rate,
-        'time_to_compromise': time_to_compromise,
-        'block_rate': block_rate,
-        'impacted_users_pct': impacted_users_pct,
-        'throughput': throughput,
-        'total_events': len(events),
-        'non_victim_compromised': non_victim_compromised
-    }
-
-
-def analyze_sweep(results_dir, duration=3600):
+    Returns None for trials run before hashing.json existed.
+    """
+    with _trial_results(trial_dir) as trial:
+        if not trial.exists("hashing.json"):
+            return None
+        with trial.open_text("hashing.json") as f:
+            return json.load(f)['verify_cpu_seconds']
+
+
+def _analyze_trial_job(trial_dir, duration):
+    """
+    (fingerprint, metrics, hash CPU seconds) for one trial. Top-level so
+    the process pool can pickle it; trial_dir is a location string for
+    the pool. The fingerprint is taken before the files are read, so a
+    log rewritten meanwhile shows up as changed on the next run.
+    """
+    with _trial_results(trial_dir) as trial:
+        fingerprint = trial_fingerprint(trial)
+        return fingerprint, analyze_trial(trial, duration), hashing_cpu_seconds(trial)
+
+
+def analyze_sweep(results_dir, duration=3600, output_dir=None, workers=1, incremental=True):
     """
     Analyze all trials from sweep and aggregate by (defense, param_value, attacker_model)
+    
+    results_dir: Sweep results - a directory, or one inside a zip archive
+                 (e.g. "paper_results.zip/results")
+    output_dir: Where to write summary.csv and summary_aggregated.csv
+                (default: results_dir, or next to the archive for a zip,
+                e.g. paper_results/results)
+    workers: How many processes to analyze trials in (1 = in this process).
+             Results are merged in trial order, so the output files are
+             the same for any number of workers.
+    incremental: Take unchanged trials' metrics from analysis_index.json
+                 in output_dir instead of reading them again. With False
+                 every trial is analyzed; the index is rebuilt either way.
     """
     print(f"Analyzing sweep results in {results_dir}/")
-    
-    # Load metadata
-    metadata_file = os.path.join(results_dir, "sweep_metadata.csv")
-    if not os.path.exists(metadata_file):
-        print("Error: sweep_metadata.csv not found!")
-        print("Make sure you ran sweep.py first")
-        return
-    
-    with open(metadata_file, 'r') as f:
-        reader = csv.DictReader(f)
-        metadata = list(reader)
-    
-    # Analyze each trial
-    all_results = []
-    for meta in metadata:
-        trial_id = meta['trial_id']
-        trial_dir = os.path.join(results_dir, f"trial_{trial_id}")
+    # A zip archive is closed again once every trial has been read
+    with open_results(results_dir) as results:
+        if output_dir is None:
+            output_dir = results.output_dir
         
-        if not os.path.exists(trial_dir):
-            print(f"Warning: {trial_dir} not found, skipping")
-            continue
+        # Load metadata
+        if not results.exists("sweep_metadata.csv"):
+            print("Error: sweep_metadata.csv not found!")
+            print("Make sure you ran sweep.py first")
+            return
         
-        print(f"Analyzing trial_{trial_id}...")
+        with results.open_text("sweep_metadata.csv") as f:
+            reader = csv.DictReader(f)
+            metadata = list(reader)
         
-        metrics = analyze_trial(trial_dir, duration)
+        # Work out which trials there are, in order
+        trials = []
+        for meta in metadata:
+            trial_dir = results.subdir(f"trial_{meta['trial_id']}")
+            if not trial_dir.exists():
+                print(f"Warning: {trial_dir} not found, skipping")
+                continue
+            trials.append((meta, trial_dir))
+        
+        # Trials whose files haven't changed since the last run aren't read again
+        index = AnalysisIndex(os.path.join(output_dir, INDEX_FILE), duration)
+        saved = {}
+        changed = []
+        for meta, trial_dir in trials:
+            key = f"trial_{meta['trial_id']}"
+            entry = index.lookup(key, trial_dir) if incremental else None
+            if entry is not None:
+                saved[key] = entry
+            else:
+                changed.append((key, trial_dir))
+        
+        # Analyze the rest
+        if workers > 1 and len(changed) > 1:
+            # Workers reopen the results from their location string
+            locations = [str(trial_dir) for _, trial_dir in changed]
+            chunksize = max(1, len(changed) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                analyzed = list(executor.map(_analyze_trial_job, locations, [duration] * len(changed),
+                                             chunksize=chunksize))
+        else:
+            analyzed = [_analyze_trial_job(trial_dir, duration) for _, trial_dir in changed]
+        fresh = {key: job for (key, _), job in zip(changed, analyzed)}
+    
+    all_results = []
+    for meta, _ in trials:
+        trial_id = meta['trial_id']
+        key = f"trial_{trial_id}"
+        if key in saved:
+            metrics, hash_cpu_seconds = saved[key]
+        else:
+            print(f"Analyzing {key}...")
+            fingerprint, metrics, hash_cpu_seconds = fresh[key]
+            index.store(key, fingerprint, metrics, hash_cpu_seconds)
         
         # Combine metadata and metrics
         result = {
@@ -132,19 +201,24 @@ def analyze_sweep(results_dir, duration=3600):
             'block_rate': metrics['block_rate'],
             'impacted_users_pct': metrics['impacted_users_pct'],
             'throughput': metrics['throughput'],
-            'non_victim_compromised': metrics['non_victim_compromised']
+            'non_victim_compromised': metrics['non_victim_compromised'],
+            'hash_cpu_seconds': hash_cpu_seconds
         }
         
         all_results.append(result)
     
     # Save per-trial results
-    trials_file = os.path.join(results_dir, "summary.csv")
+    os.makedirs(output_dir, exist_ok=True)
+    trials_file = os.path.join(output_dir, "summary.csv")
     if all_results:
         with open(trials_file, 'w', newline='') as f:
             writer = csv.DictWriter(f, fieldnames=all_results[0].keys())
             writer.writeheader()
             writer.writerows(all_results)
         print(f"\nPer-trial results saved to: {trials_file}")
+    index.save()
+    if incremental:
+        print(f"Reused {index.hits} unchanged trials from {INDEX_FILE}, analyzed {index.misses} new or changed")
     
     # Aggregate by (defense, param_value, attacker_model)
     from collections import defaultdict
@@ -172,6 +246,9 @@ def analyze_sweep(results_dir, duration=3600):
         std_block = statistics.stdev(block_rates) if len(block_rates) > 1 else 0.0
         std_impacted = statistics.stdev(impacted) if len(impacted) > 1 else 0.0
         
+        hash_cpu = [t['hash_cpu_seconds'] for t in trials if t['hash_cpu_seconds'] is not None]
+        mean_hash_cpu = sum(hash_cpu) / len(hash_cpu) if hash_cpu else None
+        
         aggregated.append({
             'defense': defense,
             'param_name': param_name,
@@ -183,11 +260,12 @@ def analyze_sweep(results_dir, duration=3600):
             'mean_block_rate': mean_block,
             'std_block_rate': std_block,
             'mean_impacted_pct': mean_impacted,
-            'std_impacted_pct': std_impacted
+            'std_impacted_pct': std_impacted,
+            'mean_hash_cpu_seconds': mean_hash_cpu
         })
     
     # Save aggregated results
-    agg_file = os.path.join(results_dir, "summary_aggregated.csv")
+    agg_file = os.path.join(output_dir, "summary_aggregated.csv")
     if aggregated:
         with open(agg_file, 'w', newline='') as f:
             writer = csv.DictWriter(f, fieldnames=aggregated[0].keys())
@@ -202,15 +280,21 @@ def analyze_sweep(results_dir, duration=3600):
         print(f"  Compromise: {row['mean_compromise_rate']:.2%} +/- {row['std_compromise_rate']:.2%}")
         print(f"  Block rate: {row['mean_block_rate']:.2%} +/- {row['std_block_rate']:.2%}")
         print(f"  Users hit:  {row['mean_impacted_pct']:.2%} +/- {row['std_impacted_pct']:.2%}")
+        if row['mean_hash_cpu_seconds'] is not None:
+            print(f"  Hashing:    {row['mean_hash_cpu_seconds']:.2f} CPU-s per trial")
     
     print(f"\n\nNext step:")
-    print(f"  python plot_frontier.py {results_dir}")
+    print(f"  python plot_frontier.py {output_dir}")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        results_dir = sys.argv[1]
-    else:
-        results_dir = "results"
+    parser = argparse.ArgumentParser(description="Analyze a parameter sweep")
+    parser.add_argument("results_dir", nargs="?", default="results",
+                        help="Sweep results directory, or one inside a zip (default results)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes to analyze trials in (default 1)")
+    parser.add_argument("--full", action="store_true",
+                        help=f"Re-analyze every trial instead of reusing {INDEX_FILE}")
+    args = parser.parse_args()
     
-    analyze_sweep(results_dir)
\ No newline at end of file
+    analyze_sweep(args.results_dir, workers=args.workers, incremental=not args.full)
\ No newline at end of file
@@ -7,29 +7,66 @@ This is the authentication service that:
 3. Verifies the password
 4. Logs everything that happens
 """
-import csv
+from log_sink import CsvLogSink, DEFAULT_FLUSH_EVERY
+from defenses import Decision
+
+
+class FunctionDefense:
+    """
+    Wraps a plain (check, update) function pair so it looks like a
+    DefensePolicy. Each login then runs check and update separately,
+    the way AuthService always used to.
+    """
+    def __init__(self, check, update):
+        self.check = check
+        self.update = update
+    
+    def evaluate(self, username, ip):
+        allowed, reason = self.check(username, ip)
+        return Decision(allowed, reason, username, ip)
+    
+    def commit(self, decision, result):
+        self.update(decision.username, decision.ip, result)
+    
+    def blocked_until(self, username, ip):
+        blocked_until = getattr(self.check, 'blocked_until', None)
+        if blocked_until is None:
+            return None
+        return blocked_until(username, ip)
 
 
 class AuthService:
-    def __init__(self, database, clock, defense_check, defense_update, log_file=None):
+    def __init__(self, database, clock, defense_check=None, defense_update=None, log_file=None,
+                 log_flush_every=DEFAULT_FLUSH_EVERY, defense=None):
         """
         database: Where user accounts are stored
         clock: Keeps track of time
         defense_check: Function that checks if request should be blocked
         defense_update: Function that updates defense state after attempt
         log_file: Where to write logs (optional)
+        log_flush_every: How many log rows to buffer before writing them out
+        defense: A DefensePolicy (from get_defense_policy) - use this instead
+                 of defense_check/defense_update so each login reads the
+                 defense state once
         """
+        if defense is None:
+            if defense_check is None or defense_update is None:
+                raise ValueError("Need either a defense policy or defense_check and defense_update")
+            defense = FunctionDefense(defense_check, defense_update)
+        
         self.database = database
         self.clock = clock
-        self.defense_check = defense_check
-        self.defense_update = defense_update
+        self.defense = defense
         self.log_file = log_file
         
-        # Set up log file if provided
+        # Set up log file if provided (kept open until close())
+        self.log_sink = None
         if self.log_file:
-            with open(self.log_file, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['timestamp', 'username', 'ip', 'result', 'reason'])
+            self.log_sink = CsvLogSink(
+                self.log_file,
+                ['timestamp', 'username', 'ip', 'result', 'reason'],
+                flush_every=log_flush_every
+            )
     
     def login(self, username, password, ip):
         """
@@ -40,34 +77,95 @@ class AuthService:
         - reason: Why it failed (if it failed)
         - token: Login token (if successful)
         """
+        return self._login(self.clock.now(), username, password, ip, None, self._log)
+    
+    def login_batch(self, attempts):
+        """
+        Try several logins that happen at the same time
+        
+        attempts: List of (username, password, ip)
+        
+        Returns one result dict per attempt, the same as calling login()
+        for each in order.
+        """
+        return list(self.iter_login_batch(attempts))
+    
+    def iter_login_batch(self, attempts):
+        """
+        Generator version of login_batch - yields each result in order
+        
+        Every attempt is still evaluated after the one before it has
+        updated the defense, so results match login() exactly. The batch
+        saves work around that:
+        - stored password hashes are fetched with one query up front
+        - login_state updates are coalesced and written when the batch ends
+        - auth log rows are written in one go when the batch ends
+        
+        Stop iterating (and close the generator) to leave the remaining
+        attempts untried - the simulation does this when an actor has to
+        go again at the same timestamp.
+        """
         now = self.clock.now()
+        stored_hashes = None
+        if hasattr(self.database, 'stored_hashes'):
+            usernames = self.database.uncached_usernames([(u, p) for u, p, _ in attempts])
+            found = self.database.stored_hashes(usernames) if usernames else {}
+            # None marks a user that doesn't exist, so it isn't looked up again
+            stored_hashes = {username: found.get(username) for username in usernames}
         
+        rows = []
+        log = (lambda *row: rows.append(row)) if self.log_sink else self._log
+        try:
+            with self.database.deferred_writes():
+                for username, password, ip in attempts:
+                    yield self._login(now, username, password, ip, stored_hashes, log)
+        finally:
+            if rows:
+                self.log_sink.write_rows([[*row[:4], row[4] or ''] for row in rows])
+    
+    def _login(self, now, username, password, ip, stored_hashes, log):
+        """One login attempt - log is called with the row to write"""
         # Step 1: Check defense policy - should we even allow this attempt?
-        allowed, block_reason = self.defense_check(username, ip)
+        decision = self.defense.evaluate(username, ip)
         
-        if not allowed:
+        if not decision.allowed:
             # Defense blocked it
-            self._log(now, username, ip, 'blocked', block_reason)
-            return {'success': False, 'reason': block_reason}
+            log(now, username, ip, 'blocked', decision.reason)
+            return {'success': False, 'reason': decision.reason}
         
         # Step 2: Check if password is correct
-        correct = self.database.check_password(username, password)
+        if stored_hashes is None:
+            correct = self.database.check_password(username, password)
+        else:
+            correct = self.database.check_password(username, password, stored_hashes)
         
         # Step 3: Update defense policy with result
         result = 'success' if correct else 'failure'
-        self.defense_update(username, ip, result)
+        self.defense.commit(decision, result)
         
         # Step 4: Log what happened
         if correct:
-            self._log(now, username, ip, 'success', None)
+            log(now, username, ip, 'success', None)
             return {'success': True, 'token': 'fake-token-12345'}
         else:
-            self._log(now, username, ip, 'bad_password', None)
+            log(now, username, ip, 'bad_password', None)
             return {'success': False, 'reason': 'bad_password'}
     
+    def blocked_until(self, username, ip):
+        """
+        Ask the defense until when attempts for username/ip stay blocked
+        
+        Returns None if the defense can't tell.
+        """
+        return self.defense.blocked_until(username, ip)
+    
     def _log(self, timestamp, username, ip, result, reason):
         """Write to the log file"""
-        if self.log_file:
-            with open(self.log_file, 'a', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([timestamp, username, ip, result, reason or ''])
+        if self.log_sink:
+            self.log_sink.write([timestamp, username, ip, result, reason or ''])
+    
+    def close(self):
+        """Flush and close the log file"""
+        if self.log_sink:
+            self.log_sink.close()
+
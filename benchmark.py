@@ -0,0 +1,387 @@
+"""
+benchmark.py - Measure how fast the simulator runs
+
+Runs a fixed set of workloads (each defense against the baseline
+attackers, the credential stuffing attacker, and larger user counts)
+and reports:
+- events per second
+- where the time goes (defense check/update, password check, logging, rest)
+- database calls and SQL statements per event
+- peak memory (RSS) of the process that ran the workload
+
+Results are saved as JSON so two commits can be compared:
+
+    python benchmark.py --output before.json
+    (make changes)
+    python benchmark.py --output after.json --compare before.json
+"""
+import os
+import sys
+import io
+import json
+import time
+import platform
+import argparse
+import resource
+import tempfile
+import functools
+import contextlib
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import log_sink
+from clock import Clock
+from database import get_database
+from defenses import get_defense, get_defense_policy
+from auth_service import AuthService
+from actors import create_attackers, create_users
+from run_simulation import run_simulation
+from sweep import create_attackers_cred_stuffing
+from scheduler import SCHEDULERS, get_scheduler
+
+
+DEFENSES = ["lockout", "rate_limit", "backoff", "rate_limit_ip", "hybrid"]
+
+COMPONENTS = ["defense_check", "password_check", "defense_update", "logging"]
+
+# Actor counts for --scheduler-crossover
+CROSSOVER_ACTOR_COUNTS = [10, 100, 1000, 10000, 100000]
+
+
+def get_workloads(quick=False):
+    """
+    The fixed list of workloads
+
+    Each is a dict with name, defense, attacker_model and num_users.
+    """
+    user_counts = [50, 500] if quick else [50, 500, 5000]
+
+    workloads = []
+    for defense in DEFENSES:
+        workloads.append({'name': f"baseline/{defense}", 'defense': defense,
+                          'attacker_model': "baseline", 'num_users': 50})
+        workloads.append({'name': f"cred_stuffing/{defense}", 'defense': defense,
+                          'attacker_model': "cred_stuffing", 'num_users': 50})
+    for num_users in user_counts[1:]:
+        for defense in DEFENSES:
+            workloads.append({'name': f"users_{num_users}/{defense}", 'defense': defense,
+                              'attacker_model': "baseline", 'num_users': num_users})
+    return workloads
+
+
+def build_simulation(workload, log_dir, backend="sqlite", defense_api="policy"):
+    """
+    Set up clock, auth service and actors the same way run_one_trial does
+
+    defense_api: "policy" (one evaluate/commit per login) or "functions"
+                 (the older separate check and update calls)
+    """
+    clock = Clock()
+    database = get_database(backend, clock=clock)
+
+    users = create_users(num_users=workload['num_users'], shared_ip=True)
+    accounts = [("victim", "secret_password", clock.now())]
+    accounts += [(user.username, user.password, clock.now()) for user in users]
+    database.add_users(accounts)
+
+    auth_log = os.path.join(log_dir, "auth_log.csv") if log_dir else None
+    if defense_api == "functions":
+        defense_check, defense_update = get_defense(workload['defense'], database, clock, {})
+        auth_service = AuthService(database, clock, defense_check, defense_update, auth_log)
+    else:
+        defense = get_defense_policy(workload['defense'], database, clock, {})
+        auth_service = AuthService(database, clock, log_file=auth_log, defense=defense)
+
+    if workload['attacker_model'] == "cred_stuffing":
+        attackers = create_attackers_cred_stuffing(0)
+    else:
+        attackers = create_attackers()
+
+    actors = [(attacker, 'attacker') for attacker in attackers]
+    actors += [(user, 'user') for user in users]
+    return auth_service, clock, actors
+
+
+def _counted(func, counts, name):
+    """Wrap func so each call adds one to counts[name]"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        counts[name] += 1
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def _timed(func, timings, component):
+    """Wrap func so the time spent in it is added to timings[component]"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings[component] += time.perf_counter() - start
+    return wrapper
+
+
+class _ProfiledDefense:
+    """
+    Stands in for a defense policy and times its calls
+
+    Policies use __slots__, so their methods can't be swapped on the
+    instance - the auth service gets this wrapper instead.
+    """
+    def __init__(self, policy, timings):
+        self.policy = policy
+        self.evaluate = _timed(policy.evaluate, timings, "defense_check")
+        self.commit = _timed(policy.commit, timings, "defense_update")
+
+    def __getattr__(self, name):
+        return getattr(self.policy, name)
+
+
+def _run(workload, duration, log_dir, backend, defense_api, scheduler, profile):
+    """One simulation run - returns (events, seconds, timings, counts)"""
+    auth_service, clock, actors = build_simulation(workload, log_dir, backend, defense_api)
+    detail_log = os.path.join(log_dir, "detail_log.csv") if log_dir else None
+
+    timings = None
+    counts = None
+    original_write = log_sink.CsvLogSink.write
+    if profile:
+        timings = dict.fromkeys(COMPONENTS, 0.0)
+        database = auth_service.database
+        auth_service.defense = _ProfiledDefense(auth_service.defense, timings)
+        database.check_password = _timed(database.check_password, timings, "password_check")
+        log_sink.CsvLogSink.write = _timed(original_write, timings, "logging")
+
+        counts = {'db_calls': 0, 'sql_statements': 0}
+        for method in ("check_password", "get_login_state", "update_login_state"):
+            setattr(database, method, _counted(getattr(database, method), counts, 'db_calls'))
+        if hasattr(database, 'conn'):
+            def count_statement(statement):
+                counts['sql_statements'] += 1
+            database.conn.set_trace_callback(count_statement)
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            events = run_simulation(auth_service, clock, actors, duration, detail_log,
+                                    scheduler=scheduler)
+            seconds = time.perf_counter() - start
+    finally:
+        log_sink.CsvLogSink.write = original_write
+
+    cache = getattr(auth_service.database, 'password_cache', None)
+    if counts is not None and cache is not None:
+        counts['password_cache_hits'] = cache.hits
+        counts['password_cache_misses'] = cache.misses
+
+    return events, seconds, timings, counts
+
+
+def _hit_rate(counts):
+    """Share of password checks answered by the password cache (None if off)"""
+    if 'password_cache_hits' not in counts:
+        return None
+    lookups = counts['password_cache_hits'] + counts['password_cache_misses']
+    return counts['password_cache_hits'] / lookups if lookups else 0.0
+
+
+def run_workload(workload, duration, log_level="full", backend="sqlite", defense_api="policy",
+                 scheduler="heap"):
+    """
+    Run one workload twice: once plain for events/s, once instrumented
+    for the per-component split. Meant to run in its own process so the
+    peak RSS belongs to this workload only.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        log_dir = tmp if log_level == "full" else None
+
+        events, seconds, _, _ = _run(workload, duration, log_dir, backend, defense_api, scheduler,
+                                     profile=False)
+        _, profiled_seconds, timings, counts = _run(workload, duration, log_dir, backend, defense_api,
+                                                    scheduler, profile=True)
+
+    split = {name: timings[name] / profiled_seconds for name in COMPONENTS}
+    split['other'] = max(0.0, 1.0 - sum(split.values()))
+
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak_rss *= 1024
+
+    result = dict(workload)
+    result.update({
+        'events': events,
+        'seconds': seconds,
+        'events_per_second': events / seconds if seconds > 0 else 0.0,
+        'time_split': split,
+        'db_calls_per_event': counts['db_calls'] / events if events else 0.0,
+        'sql_per_event': counts['sql_statements'] / events if events else 0.0,
+        'password_cache_hit_rate': _hit_rate(counts),
+        'peak_rss_mb': peak_rss / (1024 * 1024),
+    })
+    return result
+
+
+def _time_scheduler(name, num_actors, num_events):
+    """Events/s of one scheduler with num_actors actors on fixed intervals"""
+    # Same spread as the simulation: a few fast attackers, many ~30s users
+    intervals = [0.5, 2.0, 10.0, 30.0, 30.0, 30.0, 60.0]
+    events = get_scheduler(name)
+    for i in range(num_actors):
+        events.push((i * 0.001, i, 'user'))
+
+    push = events.push
+    pop = events.pop
+    start = time.perf_counter()
+    for _ in range(num_events):
+        event_time, i, actor_type = pop()
+        push((event_time + intervals[i % len(intervals)], i, actor_type))
+    seconds = time.perf_counter() - start
+    return num_events / seconds if seconds > 0 else 0.0
+
+
+def scheduler_crossover(actor_counts=CROSSOVER_ACTOR_COUNTS, num_events=200000):
+    """
+    Events/s of each scheduler as the number of queued actors grows
+
+    Only the queue is timed (pop an event, push the actor's next one),
+    so the numbers show where one scheduler starts to beat the other.
+    Returns one dict per actor count, with 'crossover' set on the first
+    count where the calendar queue is faster than the heap.
+    """
+    rows = []
+    crossed = False
+    for num_actors in actor_counts:
+        row = {'actors': num_actors}
+        for name in SCHEDULERS:
+            row[name] = _time_scheduler(name, num_actors, num_events)
+        row['crossover'] = not crossed and row['calendar'] > row['heap']
+        crossed = crossed or row['crossover']
+        rows.append(row)
+
+        print(f"{num_actors:>8} actors  " +
+              "  ".join(f"{name} {row[name]:>10.0f} ev/s" for name in SCHEDULERS) +
+              ("  <- calendar faster from here" if row['crossover'] else ""))
+    if not crossed:
+        print("The heap was faster at every actor count")
+    return rows
+
+
+def git_commit():
+    """Current commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(duration=1800, quick=False, log_level="full", backend="sqlite", only=None,
+                   defense_api="policy", scheduler="heap"):
+    """
+    Run every workload, each in a fresh process
+
+    only: Optional substring - only run workloads whose name contains it
+    """
+    workloads = get_workloads(quick)
+    if only:
+        workloads = [w for w in workloads if only in w['name']]
+
+    results = []
+    for workload in workloads:
+        # A new single-worker pool per workload gives each one a clean process
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run_workload, workload, duration, log_level, backend,
+                                     defense_api, scheduler).result()
+        results.append(result)
+
+        split = result['time_split']
+        print(f"{result['name']:<28} {result['events']:>8} events  "
+              f"{result['events_per_second']:>10.0f} ev/s  "
+              f"check {split['defense_check']:.0%}  pwd {split['password_check']:.0%}  "
+              f"update {split['defense_update']:.0%}  log {split['logging']:.0%}  "
+              f"other {split['other']:.0%}  "
+              f"db {result['db_calls_per_event']:.2f}/ev  sql {result['sql_per_event']:.2f}/ev  "
+              f"rss {result['peak_rss_mb']:.0f} MB")
+
+    return {
+        'commit': git_commit(),
+        'created': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'duration': duration,
+        'log_level': log_level,
+        'backend': backend,
+        'defense_api': defense_api,
+        'scheduler': scheduler,
+        'results': results,
+    }
+
+
+def compare(report, baseline):
+    """Print events/s of report relative to an earlier baseline report"""
+    before = {r['name']: r for r in baseline['results']}
+
+    print(f"\nCompared to {baseline.get('commit')} ({baseline.get('created')}):")
+    for result in report['results']:
+        old = before.get(result['name'])
+        if not old or not old['events_per_second']:
+            continue
+        ratio = result['events_per_second'] / old['events_per_second']
+        line = (f"  {result['name']:<28} {old['events_per_second']:>10.0f} -> "
+                f"{result['events_per_second']:>10.0f} ev/s  ({ratio:.2f}x)")
+        if 'db_calls_per_event' in old:
+            line += (f"  db {old['db_calls_per_event']:.2f} -> {result['db_calls_per_event']:.2f}/ev"
+                     f"  sql {old['sql_per_event']:.2f} -> {result['sql_per_event']:.2f}/ev")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark simulator throughput")
+    parser.add_argument("--duration", type=float, default=1800,
+                        help="Simulated seconds per workload (default 1800)")
+    parser.add_argument("--quick", action="store_true",
+                        help="Skip the largest user count")
+    parser.add_argument("--only", default=None,
+                        help="Only run workloads whose name contains this text")
+    parser.add_argument("--log-level", choices=["full", "none"], default="full",
+                        help="Write CSV logs during the run (default full)")
+    parser.add_argument("--backend", choices=["sqlite", "memory"], default="sqlite")
+    parser.add_argument("--defense-api", choices=["policy", "functions"], default="policy",
+                        help="functions = separate check/update calls, to compare against policy")
+    parser.add_argument("--scheduler", choices=SCHEDULERS, default="heap",
+                        help="Event queue used by the simulation")
+    parser.add_argument("--scheduler-crossover", action="store_true",
+                        help="Only time the event queues against each other at growing actor counts")
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="Where to save the JSON results")
+    parser.add_argument("--compare", default=None,
+                        help="Earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    if args.scheduler_crossover:
+        rows = scheduler_crossover()
+        with open(args.output, 'w') as f:
+            json.dump({'commit': git_commit(), 'scheduler_crossover': rows}, f, indent=2)
+        print(f"\nResults saved to: {args.output}")
+        return
+
+    report = run_benchmarks(args.duration, args.quick, args.log_level, args.backend, args.only,
+                            args.defense_api, args.scheduler)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to: {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
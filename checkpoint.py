@@ -0,0 +1,94 @@
+"""
+checkpoint.py - Save a running simulation to disk and load it back
+
+A checkpoint is one pickle of everything run_simulation's event loop
+uses: the event queue, the clock, the actors (with their random number
+generators), the auth service with its defense and database, the log
+sinks, the metrics and the loop's own counters. Pickling them together
+keeps shared objects shared, so after loading the defense, database and
+auth service still point at the same clock.
+
+The objects that hold files or connections pickle themselves:
+- CsvLogSink writes out its buffer and saves its file offset. Loading
+  cuts the file back to that offset and appends from there, so rows
+  written after the checkpoint are dropped and written again.
+- Database saves its tables as rows and rebuilds them on load.
+- A database's VerifierPool isn't saved; after loading, passwords are
+  hashed in this process (the results are the same).
+
+Defenses have to be DefensePolicy objects (get_defense_policy) - the
+check/update function pairs from get_defense are closures and can't be
+pickled.
+
+A checkpoint can carry a tag saying which run it belongs to (sweep.py
+uses the trial key). The tag is stored in a small header before the
+state, so checkpoint_tag() can check it without loading the state, which
+would already truncate the logs.
+
+Checkpoints are written to a temporary file and then renamed, so an
+interruption while saving leaves the previous checkpoint in place. Only
+load checkpoints you wrote yourself: unpickling can run code.
+"""
+import os
+import pickle
+import random
+
+
+CHECKPOINT_VERSION = 2
+
+
+def save_checkpoint(path, state, tag=None):
+    """
+    Write state (a dict) to path, replacing the previous checkpoint
+
+    tag: Anything picklable identifying the run (see checkpoint_tag)
+
+    The global random module's state is saved along with it.
+    """
+    state = dict(state, random_state=random.getstate())
+
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            pickle.dump({'version': CHECKPOINT_VERSION, 'tag': tag}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        # e.g. something in state can't be pickled - don't leave half a file
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, path)
+
+
+def load_checkpoint(path):
+    """
+    Read a checkpoint written by save_checkpoint
+
+    Loading reopens the log files and truncates them to where they were
+    when the checkpoint was saved, and restores the global random state.
+    """
+    with open(path, 'rb') as f:
+        header = pickle.load(f)
+        if not isinstance(header, dict) or header.get('version') != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version: {path}")
+        state = pickle.load(f)
+
+    random.setstate(state.pop('random_state'))
+    state['tag'] = header['tag']
+    return state
+
+
+def checkpoint_tag(path):
+    """
+    The tag a checkpoint was saved with, read without loading its state
+
+    Returns None for checkpoints of another version (they can't be
+    loaded anyway).
+    """
+    with open(path, 'rb') as f:
+        header = pickle.load(f)
+    if not isinstance(header, dict) or header.get('version') != CHECKPOINT_VERSION:
+        return None
+    return header['tag']
@@ -3,7 +3,10 @@ clock.py - Keeps track of time in the simulation
 
 In real life, you'd use actual time. But we want to simulate 24 hours
 in just a few seconds, so we use "fake time" that we can speed up.
+WallClock is the real-time version, used by the login server.
 """
+import time
+
 
 class Clock:
     def __init__(self):
@@ -21,3 +24,33 @@ class Clock:
     def reset(self):
         """Set time back to zero"""
         self.current_time = 0.0
+
+
+class WallClock(Clock):
+    """
+    Real time, for running the auth service as a live server
+    
+    now() is seconds since the clock was created (or reset), so
+    timestamps start near zero like the simulation's. advance() adds a
+    fixed offset on top, which is handy in tests.
+    """
+    def __init__(self):
+        self.offset = 0.0
+        self.started = time.monotonic()
+    
+    @property
+    def current_time(self):
+        return self.now()
+    
+    def now(self):
+        """Seconds since start, plus any advance()"""
+        return time.monotonic() - self.started + self.offset
+    
+    def advance(self, seconds):
+        """Jump ahead of real time by some number of seconds"""
+        self.offset += seconds
+    
+    def reset(self):
+        """Start counting from zero again"""
+        self.offset = 0.0
+        self.started = time.monotonic()
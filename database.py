@@ -5,21 +5,284 @@ This is where we keep:
 - User passwords (hashed, not plain text)
 - How many times each user failed to login
 - When users are locked out
+
+Passwords are hashed by a PasswordHasher from passwords.py (plain
+SHA-256 unless another hasher is given).
 """
 import sqlite3
-import hashlib
+import time
+from contextlib import contextmanager
+from collections import OrderedDict
+from itertools import islice
+
+from passwords import PasswordHasher, get_hasher, sha256_hash
+
+
+# Default number of (username, password) verdicts kept by PasswordCache
+DEFAULT_PASSWORD_CACHE_SIZE = 4096
 
 
 def hash_password(password):
     """Turn a password into a hash so we don't store it directly"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    return sha256_hash(password)
+
+
+def _chunks(items, size):
+    """Yield lists of up to size items from any iterable"""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _provision_stats(count, started):
+    """Throughput report returned by add_users"""
+    seconds = time.perf_counter() - started
+    return {
+        'users_added': count,
+        'seconds': seconds,
+        'users_per_second': count / seconds if seconds > 0 else 0.0
+    }
+
+
+class PasswordCache:
+    """
+    Least recently used cache of check_password verdicts
+    
+    Attackers keep replaying the same small password lists and users
+    retry the same typo, so most guesses have been checked before. The
+    cache maps (username, password) to True/False; the database must call
+    invalidate(username) whenever that user's password changes or the
+    user is created.
+    
+    max_size: How many verdicts to keep before dropping the oldest
+    """
+    def __init__(self, max_size=DEFAULT_PASSWORD_CACHE_SIZE):
+        if max_size < 1:
+            raise ValueError("PasswordCache needs max_size >= 1")
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, username, password):
+        """Cached verdict, or None if this guess hasn't been seen"""
+        key = (username, password)
+        verdict = self.entries.get(key)
+        if verdict is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return verdict
+    
+    def __contains__(self, key):
+        """(username, password) in cache - doesn't count as a hit or miss"""
+        return key in self.entries
+    
+    def put(self, username, password, verdict):
+        """Remember a verdict, dropping the least recently used one if full"""
+        self.entries[(username, password)] = verdict
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+    
+    def invalidate(self, username):
+        """Forget every cached guess for this user"""
+        stale = [key for key in self.entries if key[0] == username]
+        for key in stale:
+            del self.entries[key]
+    
+    def clear(self):
+        """Forget everything (counters are kept)"""
+        self.entries.clear()
+    
+    def stats(self):
+        """Hit/miss counters and current size"""
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+# PasswordHasher counters kept across a checkpoint (pickling a hasher drops them)
+_HASHER_COUNTERS = ('hashes', 'hash_cpu_seconds', 'verifications', 'verify_cpu_seconds')
+
+
+def _make_password_cache(size, hasher):
+    """
+    PasswordCache of this size, or None when size is 0 (cache off)
+    
+    size None picks by hasher: off for the salted ones, whose point is to
+    charge the cost of hashing every attempt - a cache would answer most
+    repeat guesses without hashing them.
+    """
+    if size is None:
+        size = DEFAULT_PASSWORD_CACHE_SIZE if hasher.name == "sha256" else 0
+    return PasswordCache(size) if size else None
+
+
+def _make_hasher(hasher, verifier):
+    """A PasswordHasher from a hasher name, an instance, or the verifier's"""
+    if hasher is None:
+        return verifier.hasher if verifier is not None else get_hasher()
+    if isinstance(hasher, PasswordHasher):
+        return hasher
+    return get_hasher(hasher)
+
+
+class _PasswordChecks:
+    """
+    Password hashing and checking shared by both backends
+    
+    The backend provides _stored_hash(username) and
+    stored_hashes(usernames) -> {username: hash},
+    and sets hasher, verifier and password_cache.
+    """
+    def _hash_many(self, passwords):
+        """Hash new passwords, on the verifier pool if there is one"""
+        if self.verifier is not None:
+            return self.verifier.hash_many(passwords)
+        return [self.hasher.hash(password) for password in passwords]
+    
+    def check_password(self, username, password, stored_hashes=None):
+        """
+        Check if the password is correct - returns True or False
+        
+        stored_hashes: Optional {username: hash or None} already fetched,
+                       to skip the lookup for users in it
+        """
+        cache = self.password_cache
+        if cache is not None:
+            verdict = cache.get(username, password)
+            if verdict is not None:
+                return verdict
+        
+        if stored_hashes is not None and username in stored_hashes:
+            stored = stored_hashes[username]
+        else:
+            stored = self._stored_hash(username)
+        verdict = stored is not None and self.hasher.verify(password, stored)
+        if cache is not None:
+            cache.put(username, password, verdict)
+        return verdict
+    
+    def check_passwords(self, credentials):
+        """
+        Check many passwords at once
+        
+        credentials: List of (username, password)
+        
+        Returns the verdicts in the same order. Stored hashes are looked
+        up together, and the hashing runs on the verifier pool if the
+        database has one.
+        """
+        cache = self.password_cache
+        verdicts = [None] * len(credentials)
+        todo = []
+        for i, (username, password) in enumerate(credentials):
+            if cache is not None:
+                verdicts[i] = cache.get(username, password)
+            if verdicts[i] is None:
+                todo.append(i)
+        if not todo:
+            return verdicts
+        
+        stored = self.stored_hashes({credentials[i][0] for i in todo})
+        to_verify = []
+        for i in todo:
+            username = credentials[i][0]
+            if username in stored:
+                to_verify.append(i)
+            else:
+                verdicts[i] = False
+        
+        pairs = [(credentials[i][1], stored[credentials[i][0]]) for i in to_verify]
+        if self.verifier is not None:
+            results = self.verifier.verify_many(pairs)
+        else:
+            results = [self.hasher.verify(password, hashed) for password, hashed in pairs]
+        for i, verdict in zip(to_verify, results):
+            verdicts[i] = verdict
+        
+        if cache is not None:
+            for i in todo:
+                cache.put(credentials[i][0], credentials[i][1], verdicts[i])
+        return verdicts
+    
+    def uncached_usernames(self, credentials):
+        """Usernames in credentials whose (username, password) verdict isn't cached"""
+        cache = self.password_cache
+        return {username for username, password in credentials
+                if cache is None or (username, password) not in cache}
+    
+    def hashing_stats(self):
+        """CPU seconds spent hashing and verifying (see PasswordHasher.stats)"""
+        return self.hasher.stats()
+    
+    def __getstate__(self):
+        """Pickle support for checkpoints - the verifier pool isn't saved"""
+        state = self.__dict__.copy()
+        state['verifier'] = None
+        state['hasher_counters'] = {name: getattr(self.hasher, name) for name in _HASHER_COUNTERS}
+        return state
+    
+    def __setstate__(self, state):
+        counters = state.pop('hasher_counters')
+        self.__dict__.update(state)
+        for name, value in counters.items():
+            setattr(self.hasher, name, value)
 
 
-class Database:
-    def __init__(self):
-        # Use in-memory database (goes away when program ends)
-        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+class Database(_PasswordChecks):
+    # Tables saved row by row in a checkpoint
+    TABLES = ('users', 'login_state')
+    
+    def __init__(self, path=":memory:", commit_every=1, commit_window=None, clock=None,
+                 password_cache_size=None, hasher=None, verifier=None):
+        """
+        path: SQLite file to use (default is in-memory, goes away when program ends)
+        commit_every: Commit after this many writes (1 = commit every write)
+        commit_window: Also commit once this many simulated seconds have
+                       passed since the last commit (needs clock)
+        clock: Simulation clock, only used for commit_window
+        password_cache_size: How many check_password verdicts to cache
+                             (0 = always query and hash). Default:
+                             DEFAULT_PASSWORD_CACHE_SIZE with sha256,
+                             off with pbkdf2/scrypt so every check is
+                             hashed and counted in hashing_stats()
+        hasher: PasswordHasher or hasher name ("sha256", "pbkdf2", "scrypt")
+        verifier: Optional passwords.VerifierPool - check_passwords and
+                  add_users then hash on its workers
+        
+        With batching on, writes are grouped into one transaction. Reads on
+        this connection still see them right away; call flush() to make
+        sure everything is committed (e.g. before inspecting the file).
+        """
+        if commit_window is not None and clock is None:
+            raise ValueError("commit_window needs a clock")
+        
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
+        
+        self.commit_every = max(1, commit_every)
+        self.commit_window = commit_window
+        self.clock = clock
+        self.pending_writes = 0
+        self.last_commit_time = clock.now() if clock else 0.0
+        self.hasher = _make_hasher(hasher, verifier)
+        self.password_cache = _make_password_cache(password_cache_size, self.hasher)
+        self.verifier = verifier
+        # username -> login_state fields waiting to be written (see deferred_writes)
+        self._deferred = None
+        
         self._create_tables()
     
     def _create_tables(self):
@@ -53,27 +316,91 @@ class Database:
         cursor = self.conn.cursor()
         cursor.execute(
             "INSERT INTO users (username, password_hash, created_at) VALUES (?, ?, ?)",
-            (username, hash_password(password), created_at)
+            (username, self.hasher.hash(password), created_at)
         )
         # Also add entry to track their login attempts
         cursor.execute(
             "INSERT INTO login_state (username) VALUES (?)",
             (username,)
         )
+        self._write_done()
+        if self.password_cache is not None:
+            self.password_cache.invalidate(username)
+    
+    def set_password(self, username, password):
+        """Change a user's password"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "UPDATE users SET password_hash = ? WHERE username = ?",
+            (self.hasher.hash(password), username)
+        )
+        self._write_done()
+        if self.password_cache is not None:
+            self.password_cache.invalidate(username)
+    
+    def add_users(self, users, chunk_size=10000):
+        """
+        Add many user accounts in one transaction
+        
+        users: Iterable of (username, password, created_at) tuples. It is
+               read chunk_size rows at a time, so a generator works fine.
+        
+        Returns a dict with users_added, seconds and users_per_second.
+        If any row fails (e.g. duplicate username) nothing is added.
+        """
+        started = time.perf_counter()
+        
+        # Commit earlier batched writes so a rollback here only undoes this call
+        self.flush()
+        
+        count = 0
+        cursor = self.conn.cursor()
+        try:
+            for chunk in _chunks(users, chunk_size):
+                hashes = self._hash_many([row[1] for row in chunk])
+                cursor.executemany(
+                    "INSERT INTO users (username, password_hash, created_at) VALUES (?, ?, ?)",
+                    [(username, password_hash, created_at)
+                     for (username, _, created_at), password_hash in zip(chunk, hashes)]
+                )
+                cursor.executemany(
+                    "INSERT INTO login_state (username) VALUES (?)",
+                    [(row[0],) for row in chunk]
+                )
+                count += len(chunk)
+        except Exception:
+            self.conn.rollback()
+            raise
         self.conn.commit()
+        
+        # New users may have been cached as "no such user"
+        if self.password_cache is not None:
+            self.password_cache.clear()
+        
+        return _provision_stats(count, started)
     
-    def check_password(self, username, password):
-        """Check if the password is correct - returns True or False"""
+    def _stored_hash(self, username):
+        """Stored password hash, or None if there's no such user"""
         cursor = self.conn.cursor()
         result = cursor.execute(
             "SELECT password_hash FROM users WHERE username = ?",
             (username,)
         ).fetchone()
-        
-        if not result:
-            return False
-        
-        return result['password_hash'] == hash_password(password)
+        return result['password_hash'] if result else None
+    
+    def stored_hashes(self, usernames):
+        """Stored password hashes for many users - one query per 500 names"""
+        cursor = self.conn.cursor()
+        stored = {}
+        for chunk in _chunks(usernames, 500):
+            placeholders = ", ".join("?" * len(chunk))
+            rows = cursor.execute(
+                f"SELECT username, password_hash FROM users WHERE username IN ({placeholders})",
+                chunk
+            )
+            for row in rows:
+                stored[row['username']] = row['password_hash']
+        return stored
     
     def get_login_state(self, username):
         """Get info about failed logins for this user"""
@@ -84,11 +411,19 @@ class Database:
         ).fetchone()
         
         if result:
-            return dict(result)
+            state = dict(result)
+            if self._deferred and username in self._deferred:
+                state.update(self._deferred[username])
+            return state
         return None
     
     def update_login_state(self, username, **fields):
         """Update the login tracking info for a user"""
+        if self._deferred is not None:
+            if fields:
+                self._deferred.setdefault(username, {}).update(fields)
+            return
+        
         cursor = self.conn.cursor()
         
         # Build the UPDATE query
@@ -102,4 +437,227 @@ class Database:
             query = f"UPDATE login_state SET {', '.join(set_parts)} WHERE username = ?"
             values.append(username)
             cursor.execute(query, values)
-            self.conn.commit()
+            self._write_done()
+    
+    @contextmanager
+    def deferred_writes(self):
+        """
+        Hold login_state updates in memory until the block ends
+        
+        Several updates to the same user become one UPDATE, and the rows
+        are written with one executemany per set of columns. Reads inside
+        the block still see the new values.
+        """
+        if self._deferred is not None:
+            # Already deferring - the outer block writes everything
+            yield
+            return
+        
+        self._deferred = {}
+        try:
+            yield
+        finally:
+            deferred, self._deferred = self._deferred, None
+            self._write_deferred(deferred)
+    
+    def _write_deferred(self, deferred):
+        """Write the coalesced updates collected by deferred_writes"""
+        by_columns = {}
+        for username, fields in deferred.items():
+            columns = tuple(fields)
+            by_columns.setdefault(columns, []).append(
+                [fields[column] for column in columns] + [username]
+            )
+        
+        cursor = self.conn.cursor()
+        for columns, rows in by_columns.items():
+            set_parts = ", ".join(f"{column} = ?" for column in columns)
+            cursor.executemany(f"UPDATE login_state SET {set_parts} WHERE username = ?", rows)
+            self._write_done()
+    
+    def _write_done(self):
+        """Count one write and commit if the batch is full (or the window passed)"""
+        self.pending_writes += 1
+        
+        if self.pending_writes >= self.commit_every:
+            self.flush()
+        elif self.commit_window is not None:
+            if self.clock.now() - self.last_commit_time >= self.commit_window:
+                self.flush()
+    
+    def flush(self):
+        """Commit any batched writes"""
+        self.conn.commit()
+        self.pending_writes = 0
+        if self.clock:
+            self.last_commit_time = self.clock.now()
+    
+    def __getstate__(self):
+        """
+        Pickle support for checkpoints - the tables go along as rows
+        
+        Batched writes are committed first, but pending_writes and
+        last_commit_time are left alone so later commits happen at the
+        same points as in a run that was never checkpointed.
+        """
+        if self._deferred is not None:
+            raise RuntimeError("Can't save a Database in the middle of deferred_writes()")
+        self.conn.commit()
+        state = super().__getstate__()
+        del state['conn']
+        state['tables'] = {
+            table: [tuple(row) for row in self.conn.execute(f"SELECT * FROM {table} ORDER BY rowid")]
+            for table in self.TABLES
+        }
+        return state
+    
+    def __setstate__(self, state):
+        """Reconnect to path and put the saved rows back (replacing what's there)"""
+        tables = state.pop('tables')
+        super().__setstate__(state)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        
+        for table in self.TABLES:
+            self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+        self._create_tables()
+        for table, rows in tables.items():
+            if rows:
+                placeholders = ", ".join("?" * len(rows[0]))
+                self.conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+        self.conn.commit()
+
+
+class MemoryDatabase(_PasswordChecks):
+    """
+    Same interface as Database, but kept in plain Python dicts
+
+    There is no SQL here at all, so get_login_state/update_login_state
+    are just dict lookups. The defenses call these twice per attempt,
+    which makes this backend noticeably faster for big sweeps.
+    """
+    # Columns of the login_state table, in the same order as Database
+    LOGIN_STATE_FIELDS = ('username', 'failed_attempts', 'locked_until', 'last_failure_time')
+    
+    def __init__(self, password_cache_size=None, hasher=None, verifier=None):
+        """Options are the same as Database's"""
+        # username -> (password_hash, created_at)
+        self.users = {}
+        # username -> dict with the LOGIN_STATE_FIELDS columns
+        self.login_state = {}
+        self.hasher = _make_hasher(hasher, verifier)
+        self.password_cache = _make_password_cache(password_cache_size, self.hasher)
+        self.verifier = verifier
+    
+    def add_user(self, username, password, created_at):
+        """Add a new user account"""
+        if username in self.users:
+            raise ValueError(f"User already exists: {username}")
+        self.users[username] = (self.hasher.hash(password), created_at)
+        self.login_state[username] = {
+            'username': username,
+            'failed_attempts': 0,
+            'locked_until': None,
+            'last_failure_time': None
+        }
+        if self.password_cache is not None:
+            self.password_cache.invalidate(username)
+    
+    def set_password(self, username, password):
+        """Change a user's password"""
+        user = self.users.get(username)
+        if user is not None:
+            self.users[username] = (self.hasher.hash(password), user[1])
+        if self.password_cache is not None:
+            self.password_cache.invalidate(username)
+    
+    def add_users(self, users):
+        """
+        Add many user accounts at once
+        
+        Same as Database.add_users: all or nothing, returns throughput stats.
+        """
+        started = time.perf_counter()
+        
+        users = list(users)
+        new_users = {}
+        for username, _, created_at in users:
+            if username in self.users or username in new_users:
+                raise ValueError(f"User already exists: {username}")
+            new_users[username] = created_at
+        
+        hashes = self._hash_many([row[1] for row in users])
+        for (username, _, created_at), password_hash in zip(users, hashes):
+            new_users[username] = (password_hash, created_at)
+        
+        self.users.update(new_users)
+        for username in new_users:
+            self.login_state[username] = {
+                'username': username,
+                'failed_attempts': 0,
+                'locked_until': None,
+                'last_failure_time': None
+            }
+        
+        if self.password_cache is not None:
+            self.password_cache.clear()
+        
+        return _provision_stats(len(new_users), started)
+    
+    def _stored_hash(self, username):
+        """Stored password hash, or None if there's no such user"""
+        user = self.users.get(username)
+        return user[0] if user else None
+    
+    def stored_hashes(self, usernames):
+        """Stored password hashes for many users"""
+        return {username: self.users[username][0] for username in usernames if username in self.users}
+    
+    def get_login_state(self, username):
+        """Get info about failed logins for this user"""
+        state = self.login_state.get(username)
+        if state:
+            # Hand out a copy, like a row read back from SQLite
+            return dict(state)
+        return None
+    
+    def update_login_state(self, username, **fields):
+        """Update the login tracking info for a user"""
+        for field_name in fields:
+            if field_name not in self.LOGIN_STATE_FIELDS:
+                raise ValueError(f"Unknown login_state field: {field_name}")
+        
+        state = self.login_state.get(username)
+        if state is not None:
+            state.update(fields)
+    
+    @contextmanager
+    def deferred_writes(self):
+        """Updates are plain dict writes already, so there's nothing to hold back"""
+        yield
+    
+    def flush(self):
+        """Nothing to commit - here so both backends can be flushed the same way"""
+        pass
+
+
+# get_database options that MemoryDatabase understands
+MEMORY_OPTIONS = ('password_cache_size', 'hasher', 'verifier')
+
+
+def get_database(backend="sqlite", **options):
+    """
+    Pick which storage backend to use
+    
+    backend: "sqlite" (Database) or "memory" (MemoryDatabase)
+    options: Passed to Database (path, commit_every, commit_window, clock,
+             password_cache_size, hasher, verifier); the memory backend
+             only uses the last three and ignores the rest
+    """
+    if backend == "sqlite":
+        return Database(**options)
+    elif backend == "memory":
+        memory_options = {name: options[name] for name in MEMORY_OPTIONS if name in options}
+        return MemoryDatabase(**memory_options)
+    else:
+        raise ValueError(f"Unknown database backend: {backend}")
@@ -1,13 +1,210 @@
 """
 defenses.py - Different ways to defend against attackers
 
-Each defense is just a simple function that decides:
-1. Should we allow this login attempt?
-2. What should we do after the attempt (success or failure)?
+Each defense is a small policy object with two steps:
+1. evaluate() - should we allow this login attempt? (reads state once)
+2. commit() - what should we do after the attempt (success or failure)?
+
+The state read in evaluate() is kept in the Decision it returns, so
+commit() doesn't have to look it up again.
+
+Policies are registered by name (see register_defense). Names can be
+joined with "+" or "AND" to require every part to allow the attempt,
+e.g. get_defense_policy("rate_limit_ip AND lockout", ...).
 """
+import re
+from array import array
 
 
-def lockout_defense(database, clock, username, ip, result, max_failures=5, lockout_time=300):
+# name -> factory(database, clock, config) returning a DefensePolicy
+DEFENSE_REGISTRY = {}
+
+
+def register_defense(*names):
+    """
+    Decorator that registers a policy under one or more names
+    
+    Works on a DefensePolicy subclass (its from_config classmethod is
+    used) or on a plain factory function(database, clock, config).
+    """
+    def decorator(target):
+        factory = getattr(target, 'from_config', target)
+        for name in names:
+            if name in DEFENSE_REGISTRY:
+                raise ValueError(f"Defense already registered: {name}")
+            DEFENSE_REGISTRY[name] = factory
+        return target
+    return decorator
+
+
+def list_defenses():
+    """Names of every registered defense"""
+    return sorted(DEFENSE_REGISTRY)
+
+
+class TokenBucketStore:
+    """
+    Token buckets for many keys (usernames or IPs), stored compactly
+    
+    A dict of {'tokens': ..., 'last_refill': ...} dicts costs a few hundred
+    bytes per bucket, which adds up with millions of botnet IPs. Here
+    each bucket is one slot in two parallel arrays of doubles, and a
+    single dict maps key -> slot.
+    
+    sweep_interval: Every this many simulated seconds, drop buckets that
+                    have refilled to max_tokens (None = never drop any).
+                    A full bucket acts exactly like a brand new one, so
+                    this never changes a decision - it just stops the
+                    store growing forever when every attempt has a new IP.
+    """
+    __slots__ = ('index', 'keys', 'tokens', 'last_refill',
+                 'sweep_interval', 'next_sweep', 'sweeps', 'evicted')
+    
+    def __init__(self, sweep_interval=None):
+        self.index = {}
+        self.keys = []
+        self.tokens = array('d')
+        self.last_refill = array('d')
+        
+        self.sweep_interval = sweep_interval
+        self.next_sweep = None
+        self.sweeps = 0
+        self.evicted = 0
+    
+    def __len__(self):
+        return len(self.index)
+    
+    def __contains__(self, key):
+        return key in self.index
+    
+    def slot(self, key, max_tokens, now):
+        """Slot for key, creating a full bucket if there isn't one yet"""
+        slot = self.index.get(key)
+        if slot is None:
+            slot = len(self.tokens)
+            self.index[key] = slot
+            self.keys.append(key)
+            self.tokens.append(max_tokens)
+            self.last_refill.append(now)
+        return slot
+    
+    def get(self, key):
+        """(tokens, last_refill) for key, or None if it has no bucket"""
+        slot = self.index.get(key)
+        if slot is None:
+            return None
+        return self.tokens[slot], self.last_refill[slot]
+    
+    def maybe_sweep(self, now, refill_rate, max_tokens):
+        """Run evict_full() if sweep_interval has passed since the last sweep"""
+        if self.sweep_interval is None:
+            return
+        if self.next_sweep is None:
+            self.next_sweep = now + self.sweep_interval
+        elif now >= self.next_sweep:
+            self.next_sweep = now + self.sweep_interval
+            self.evict_full(now, refill_rate, max_tokens)
+    
+    def evict_full(self, now, refill_rate, max_tokens):
+        """
+        Drop every bucket that would be full at time now
+        
+        Uses the same arithmetic as the refill in rate_limit_defense, so
+        a dropped bucket is one that would have been capped at max_tokens.
+        Returns how many were dropped.
+        """
+        tokens = self.tokens
+        last_refill = self.last_refill
+        dropped = 0
+        
+        slot = 0
+        while slot < len(tokens):
+            if tokens[slot] + (now - last_refill[slot]) * refill_rate >= max_tokens:
+                self._remove(slot)
+                dropped += 1
+            else:
+                slot += 1
+        
+        self.sweeps += 1
+        self.evicted += dropped
+        return dropped
+    
+    def _remove(self, slot):
+        """Remove a slot by moving the last bucket into it"""
+        del self.index[self.keys[slot]]
+        last = len(self.keys) - 1
+        if slot != last:
+            moved_key = self.keys[last]
+            self.keys[slot] = moved_key
+            self.tokens[slot] = self.tokens[last]
+            self.last_refill[slot] = self.last_refill[last]
+            self.index[moved_key] = slot
+        self.keys.pop()
+        self.tokens.pop()
+        self.last_refill.pop()
+    
+    def stats(self):
+        """How many buckets are stored and how many have been dropped"""
+        return {'buckets': len(self.index), 'sweeps': self.sweeps, 'evicted': self.evicted}
+
+
+class Decision:
+    """What evaluate() decided, plus the state commit() needs"""
+    __slots__ = ('allowed', 'reason', 'username', 'ip', 'state')
+    
+    def __init__(self, allowed, reason, username, ip, state=None):
+        self.allowed = allowed
+        self.reason = reason
+        self.username = username
+        self.ip = ip
+        self.state = state
+
+
+class DefensePolicy:
+    """
+    Base class for defenses
+    
+    Subclasses implement evaluate() and commit(), read their config once
+    in from_config(), and list their state in __slots__. check() and
+    update() are the older two-function interface, built on top of them.
+    """
+    __slots__ = ()
+    
+    @classmethod
+    def from_config(cls, database, clock, config):
+        """Build the policy from a config dict"""
+        raise NotImplementedError
+    
+    def evaluate(self, username, ip):
+        """Decide whether to allow this attempt - returns a Decision"""
+        raise NotImplementedError
+    
+    def commit(self, decision, result):
+        """Apply the attempt's result ('success' or 'failure') to an allowed decision"""
+        raise NotImplementedError
+    
+    def check(self, username, ip):
+        """Returns (allowed, block_reason)"""
+        decision = self.evaluate(username, ip)
+        return decision.allowed, decision.reason
+    
+    def update(self, username, ip, result):
+        """Record a result without a prior evaluate()"""
+        decision = self.evaluate(username, ip)
+        if decision.allowed:
+            self.commit(decision, result)
+    
+    def blocked_until(self, username, ip):
+        """
+        Time before which every check for username/ip would be blocked
+        without changing defense state, or None if that isn't known.
+        The simulator uses it to skip over attempts that can't get through.
+        """
+        return None
+
+
+@register_defense("lockout")
+class LockoutPolicy(DefensePolicy):
     """
     LOCKOUT DEFENSE
     
@@ -18,207 +215,413 @@ def lockout_defense(database, clock, username, ip, result, max_failures=5, locko
     
     Problem: Real users who forget their password get locked out too
     """
-    state = database.get_login_state(username)
-    if not state:
-        return True, None  # Unknown user, let it through
-    
-    now = clock.now()
-    
-    # Check if user is currently locked
-    if state['locked_until'] and now < state['locked_until']:
-        return False, "locked"
-    
-    # Check if they've failed too many times
-    if state['failed_attempts'] >= max_failures:
-        # Lock them out
-        lock_until = now + lockout_time
-        database.update_login_state(username, locked_until=lock_until)
-        return False, "locked"
-    
-    # After login attempt happens, update the state
-    if result == 'success':
-        # Reset everything on successful login
-        database.update_login_state(
-            username,
-            failed_attempts=0,
-            locked_until=None,
-            last_failure_time=None
+    __slots__ = ('database', 'clock', 'max_failures', 'lockout_time')
+    
+    def __init__(self, database, clock, max_failures=5, lockout_time=300):
+        self.database = database
+        self.clock = clock
+        self.max_failures = max_failures
+        self.lockout_time = lockout_time
+    
+    @classmethod
+    def from_config(cls, database, clock, config):
+        return cls(
+            database, clock,
+            max_failures=config.get('max_failures', 5),
+            lockout_time=config.get('lockout_time', 300)
         )
-    elif result == 'failure':
-        # Increment failure count
-        new_count = state['failed_attempts'] + 1
-        database.update_login_state(
-            username,
-            failed_attempts=new_count,
-            last_failure_time=now
+    
+    def evaluate(self, username, ip):
+        state = self.database.get_login_state(username)
+        if not state:
+            return Decision(True, None, username, ip)  # Unknown user, let it through
+        
+        now = self.clock.now()
+        
+        # Check if user is currently locked
+        if state['locked_until'] and now < state['locked_until']:
+            return Decision(False, "locked", username, ip, state)
+        
+        # Check if they've failed too many times
+        if state['failed_attempts'] >= self.max_failures:
+            # Lock them out
+            lock_until = now + self.lockout_time
+            self.database.update_login_state(username, locked_until=lock_until)
+            return Decision(False, "locked", username, ip, state)
+        
+        return Decision(True, None, username, ip, state)
+    
+    def commit(self, decision, result):
+        state = decision.state
+        if state is None:
+            return  # Unknown user, nothing to track
+        
+        if result == 'success':
+            # Reset everything on successful login
+            self.database.update_login_state(
+                decision.username,
+                failed_attempts=0,
+                locked_until=None,
+                last_failure_time=None
+            )
+        elif result == 'failure':
+            # Increment failure count
+            new_count = state['failed_attempts'] + 1
+            self.database.update_login_state(
+                decision.username,
+                failed_attempts=new_count,
+                last_failure_time=self.clock.now()
+            )
+    
+    def blocked_until(self, username, ip):
+        return state_blocked_until(self.database, username)
+
+
+@register_defense("backoff")
+class BackoffPolicy(DefensePolicy):
+    """
+    EXPONENTIAL BACKOFF DEFENSE
+    
+    How it works:
+    - After each failure, make user wait before trying again
+    - Wait time doubles each time: 1 sec, 2 sec, 4 sec, 8 sec, etc.
+    - Caps out at some maximum (like 60 seconds)
+    - Reset to normal after successful login
+    
+    This slows attackers down without permanently locking accounts.
+    """
+    __slots__ = ('database', 'clock', 'base_delay', 'max_delay')
+    
+    def __init__(self, database, clock, base_delay=1.0, max_delay=60.0):
+        self.database = database
+        self.clock = clock
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+    
+    @classmethod
+    def from_config(cls, database, clock, config):
+        return cls(
+            database, clock,
+            base_delay=config.get('base_delay', 1.0),
+            max_delay=config.get('max_delay', 60.0)
         )
     
-    return True, None
+    def evaluate(self, username, ip):
+        state = self.database.get_login_state(username)
+        if not state:
+            return Decision(True, None, username, ip)
+        
+        # Check if user is in backoff period
+        if state['locked_until'] and self.clock.now() < state['locked_until']:
+            return Decision(False, "backoff", username, ip, state)
+        
+        return Decision(True, None, username, ip, state)
+    
+    def commit(self, decision, result):
+        state = decision.state
+        if state is None:
+            return
+        
+        if result == 'success':
+            # Reset on success
+            self.database.update_login_state(
+                decision.username,
+                failed_attempts=0,
+                locked_until=None,
+                last_failure_time=None
+            )
+        elif result == 'failure':
+            # Calculate exponential delay
+            # Delay = base_delay * 2^(number of failures - 1)
+            now = self.clock.now()
+            new_count = state['failed_attempts'] + 1
+            delay = self.base_delay * (2 ** (new_count - 1))
+            delay = min(delay, self.max_delay)  # Don't exceed max
+            
+            backoff_until = now + delay
+            self.database.update_login_state(
+                decision.username,
+                failed_attempts=new_count,
+                locked_until=backoff_until,
+                last_failure_time=now
+            )
+    
+    def blocked_until(self, username, ip):
+        return state_blocked_until(self.database, username)
 
 
-def rate_limit_defense(buckets, clock, username, ip, result, refill_rate=0.5, max_tokens=3):
+class RateLimitPolicy(DefensePolicy):
     """
-    RATE LIMIT DEFENSE (by account)
+    RATE LIMIT DEFENSE (by account or by IP)
     
     How it works:
-    - Give each account a "bucket" with tokens in it
+    - Give each account (or IP) a "bucket" with tokens in it
     - Each login attempt uses 1 token
     - Tokens slowly refill over time (like 0.5 per second)
     - If bucket is empty, block the attempt
     
     This slows down attackers who try many passwords quickly.
+    
+    by: "username" or "ip" - what the buckets are keyed on
+    double_charge: The original check/update pair ran the whole
+                   refill-and-consume step twice, so an allowed attempt
+                   used a second token in update when one was left. This
+                   keeps that behaviour (the published results depend on
+                   it); set it to False to charge one token per attempt.
+    
+    Registered as "rate_limit" (alias "account_rate") and "rate_limit_ip"
+    (alias "ip_rate"). Config keys: refill_rate, max_tokens,
+    bucket_sweep_interval, double_charge.
     """
-    # Get or create bucket for this username
-    if username not in buckets:
-        buckets[username] = {
-            'tokens': max_tokens,
-            'last_refill': clock.now()
-        }
+    __slots__ = ('buckets', 'clock', 'refill_rate', 'max_tokens', 'by_ip', 'double_charge')
     
-    bucket = buckets[username]
-    now = clock.now()
+    def __init__(self, buckets, clock, refill_rate=0.5, max_tokens=3, by="username", double_charge=True):
+        if by not in ("username", "ip"):
+            raise ValueError(f"Rate limit must be by username or ip, not {by}")
+        self.buckets = buckets
+        self.clock = clock
+        self.refill_rate = refill_rate
+        self.max_tokens = max_tokens
+        self.by_ip = by == "ip"
+        self.double_charge = double_charge
     
-    # Refill tokens based on time passed
-    time_passed = now - bucket['last_refill']
-    tokens_to_add = time_passed * refill_rate
-    bucket['tokens'] = min(max_tokens, bucket['tokens'] + tokens_to_add)
-    bucket['last_refill'] = now
+    def evaluate(self, username, ip):
+        key = ip if self.by_ip else username
+        allowed, slot = take_token(self.buckets, key, self.clock.now(), self.refill_rate, self.max_tokens)
+        if allowed:
+            return Decision(True, None, username, ip, slot)
+        return Decision(False, "rate_limited", username, ip, slot)
     
-    # Check if we have a token available
-    if bucket['tokens'] >= 1:
-        bucket['tokens'] -= 1
-        return True, None
-    else:
-        return False, "rate_limited"
+    def commit(self, decision, result):
+        if self.double_charge:
+            # Same clock time as evaluate(), so there's nothing to refill
+            tokens = self.buckets.tokens
+            if tokens[decision.state] >= 1:
+                tokens[decision.state] -= 1
+    
+    def update(self, username, ip, result):
+        # The old update was the refill-and-consume step on its own
+        if self.double_charge:
+            self.evaluate(username, ip)
+    
+    @classmethod
+    def from_config(cls, database, clock, config, by="username", prefix="",
+                    default_refill_rate=0.5, default_max_tokens=3):
+        """
+        prefix: Put in front of the config keys (hybrid uses "ip_" and "account_")
+        """
+        return cls(
+            TokenBucketStore(config.get('bucket_sweep_interval')), clock,
+            refill_rate=config.get(prefix + 'refill_rate', default_refill_rate),
+            max_tokens=config.get(prefix + 'max_tokens', default_max_tokens),
+            by=by,
+            double_charge=config.get('double_charge', True)
+        )
+    
+    def bucket_stats(self):
+        """How many buckets are stored and how many have been dropped"""
+        return self.buckets.stats()
 
 
-def backoff_defense(database, clock, username, ip, result, base_delay=1.0, max_delay=60.0):
+@register_defense("rate_limit", "account_rate")
+def account_rate_limit(database, clock, config):
+    """Token bucket per username"""
+    return RateLimitPolicy.from_config(database, clock, config, by="username")
+
+
+@register_defense("rate_limit_ip", "ip_rate")
+def ip_rate_limit(database, clock, config):
+    """Token bucket per source IP"""
+    return RateLimitPolicy.from_config(database, clock, config, by="ip",
+                                       default_refill_rate=1.0, default_max_tokens=5)
+
+
+class AllOfPolicy(DefensePolicy):
     """
-    EXPONENTIAL BACKOFF DEFENSE
+    Several policies that all have to allow an attempt
     
-    How it works:
-    - After each failure, make user wait before trying again
-    - Wait time doubles each time: 1 sec, 2 sec, 4 sec, 8 sec, etc.
-    - Caps out at some maximum (like 60 seconds)
-    - Reset to normal after successful login
+    Parts are evaluated in order and the first block wins - later parts
+    aren't touched. When every part allows it, commit() goes to each one.
+    The parts' bound methods are collected once up front, so a call is
+    just a loop over a tuple.
+    """
+    __slots__ = ('names', 'parts', '_evaluates', '_commits')
     
-    This slows attackers down without permanently locking accounts.
+    def __init__(self, named_parts):
+        """named_parts: List of (name, policy)"""
+        self.names = tuple(name for name, _ in named_parts)
+        self.parts = tuple(policy for _, policy in named_parts)
+        self._evaluates = tuple(policy.evaluate for policy in self.parts)
+        self._commits = tuple(policy.commit for policy in self.parts)
+    
+    def evaluate(self, username, ip):
+        decisions = []
+        for evaluate in self._evaluates:
+            decision = evaluate(username, ip)
+            if not decision.allowed:
+                return decision
+            decisions.append(decision)
+        return Decision(True, None, username, ip, decisions)
+    
+    def commit(self, decision, result):
+        for commit, part_decision in zip(self._commits, decision.state):
+            commit(part_decision, result)
+    
+    def update(self, username, ip, result):
+        for policy in self.parts:
+            policy.update(username, ip, result)
+    
+    def blocked_until(self, username, ip):
+        # Only the first part is safe: if a later part blocks, the ones
+        # before it have already been evaluated (and may have used tokens)
+        return self.parts[0].blocked_until(username, ip)
+    
+    def bucket_stats(self):
+        """bucket_stats() of each rate limit part, by part name"""
+        return {name: policy.bucket_stats()
+                for name, policy in zip(self.names, self.parts)
+                if hasattr(policy, 'bucket_stats')}
+
+
+@register_defense("hybrid")
+def hybrid(database, clock, config):
     """
-    state = database.get_login_state(username)
-    if not state:
-        return True, None
+    HYBRID DEFENSE
+    
+    An IP rate limit and an account rate limit together. The IP bucket
+    is checked first; the account bucket is only touched if it passes.
+    Config keys: ip_refill_rate, ip_max_tokens, account_refill_rate,
+    account_max_tokens.
+    """
+    return AllOfPolicy([
+        ('ip', RateLimitPolicy.from_config(database, clock, config, by="ip", prefix="ip_",
+                                           default_refill_rate=1.0, default_max_tokens=5)),
+        ('account', RateLimitPolicy.from_config(database, clock, config, by="username", prefix="account_",
+                                                default_refill_rate=0.5, default_max_tokens=3)),
+    ])
+
+
+def take_token(buckets, key, now, refill_rate, max_tokens):
+    """
+    Refill key's bucket up to now, then try to take one token
     
-    now = clock.now()
+    Returns (allowed, slot).
+    """
+    buckets.maybe_sweep(now, refill_rate, max_tokens)
     
-    # Check if user is in backoff period
-    if state['locked_until'] and now < state['locked_until']:
-        return False, "backoff"
+    # Get or create bucket for this key
+    slot = buckets.slot(key, max_tokens, now)
+    tokens = buckets.tokens
     
-    # After login attempt happens, update state
-    if result == 'success':
-        # Reset on success
-        database.update_login_state(
-            username,
-            failed_attempts=0,
-            locked_until=None,
-            last_failure_time=None
-        )
-    elif result == 'failure':
-        # Calculate exponential delay
-        # Delay = base_delay * 2^(number of failures - 1)
-        new_count = state['failed_attempts'] + 1
-        delay = base_delay * (2 ** (new_count - 1))
-        delay = min(delay, max_delay)  # Don't exceed max
-        
-        backoff_until = now + delay
-        database.update_login_state(
-            username,
-            failed_attempts=new_count,
-            locked_until=backoff_until,
-            last_failure_time=now
-        )
+    # Refill tokens based on time passed
+    time_passed = now - buckets.last_refill[slot]
+    tokens_to_add = time_passed * refill_rate
+    tokens[slot] = min(max_tokens, tokens[slot] + tokens_to_add)
+    buckets.last_refill[slot] = now
     
-    return True, None
+    # Check if we have a token available
+    if tokens[slot] >= 1:
+        tokens[slot] -= 1
+        return True, slot
+    return False, slot
 
 
-def get_defense(name, database, clock, config=None):
+def state_blocked_until(database, username):
+    """
+    When does a lockout/backoff block on this account lift?
+    
+    Returns locked_until, or None if the account isn't locked. Checks made
+    before that time are blocked without changing any state.
+    """
+    state = database.get_login_state(username)
+    if not state or not state['locked_until']:
+        return None
+    return state['locked_until']
+
+
+def _run_policy(policy, username, ip, result):
+    """Old one-function interface: evaluate, then apply result if allowed"""
+    decision = policy.evaluate(username, ip)
+    if decision.allowed and result is not None:
+        policy.commit(decision, result)
+    return decision.allowed, decision.reason
+
+
+def lockout_defense(database, clock, username, ip, result, max_failures=5, lockout_time=300):
+    """LOCKOUT DEFENSE as a single function (see LockoutPolicy)"""
+    return _run_policy(LockoutPolicy(database, clock, max_failures, lockout_time), username, ip, result)
+
+
+def rate_limit_defense(buckets, clock, username, ip, result, refill_rate=0.5, max_tokens=3):
+    """
+    RATE LIMIT DEFENSE as a single function (see RateLimitPolicy)
+    
+    buckets: A TokenBucketStore (the key is whatever is passed as username)
+    """
+    allowed, slot = take_token(buckets, username, clock.now(), refill_rate, max_tokens)
+    if allowed:
+        return True, None
+    return False, "rate_limited"
+
+
+def backoff_defense(database, clock, username, ip, result, base_delay=1.0, max_delay=60.0):
+    """EXPONENTIAL BACKOFF DEFENSE as a single function (see BackoffPolicy)"""
+    return _run_policy(BackoffPolicy(database, clock, base_delay, max_delay), username, ip, result)
+
+
+def get_defense_policy(name, database, clock, config=None):
     """
     Pick which defense to use with custom config
     
+    name: A registered defense (see list_defenses()), or several joined
+          with "+" or "AND", e.g. "ip_rate AND account_rate AND lockout"
     config: dict with defense parameters like:
         - max_failures, lockout_time (for lockout)
         - base_delay, max_delay (for backoff)
         - refill_rate, max_tokens (for rate_limit)
+        - bucket_sweep_interval (rate limits): drop full token buckets
+          this often, in simulated seconds
+        - double_charge (rate limits): see RateLimitPolicy, default True
+      For a combination, each part uses config[part_name] if that's a
+      dict, otherwise the whole config.
     
-    Returns a function you can call to check if login should be allowed
+    Returns a DefensePolicy. Rate limit policies also have bucket_stats().
     """
     if config is None:
         config = {}
     
-    # We'll keep state for rate limiting here
-    account_buckets = {}
-    ip_buckets = {}
-    
-    if name == "lockout":
-        max_failures = config.get('max_failures', 5)
-        lockout_time = config.get('lockout_time', 300)
-        
-        def check(username, ip):
-            return lockout_defense(database, clock, username, ip, None, max_failures, lockout_time)
-        def update(username, ip, result):
-            lockout_defense(database, clock, username, ip, result, max_failures, lockout_time)
-        return check, update
-    
-    elif name == "rate_limit":
-        refill_rate = config.get('refill_rate', 0.5)
-        max_tokens = config.get('max_tokens', 3)
-        
-        def check(username, ip):
-            return rate_limit_defense(account_buckets, clock, username, ip, None, refill_rate, max_tokens)
-        def update(username, ip, result):
-            rate_limit_defense(account_buckets, clock, username, ip, result, refill_rate, max_tokens)
-        return check, update
-    
-    elif name == "backoff":
-        base_delay = config.get('base_delay', 1.0)
-        max_delay = config.get('max_delay', 60.0)
-        
-        def check(username, ip):
-            return backoff_defense(database, clock, username, ip, None, base_delay, max_delay)
-        def update(username, ip, result):
-            backoff_defense(database, clock, username, ip, result, base_delay, max_delay)
-        return check, update
-    
-    elif name == "rate_limit_ip":
-        refill_rate = config.get('refill_rate', 1.0)
-        max_tokens = config.get('max_tokens', 5)
-        
-        def check(username, ip):
-            return rate_limit_defense(ip_buckets, clock, ip, username, None, refill_rate, max_tokens)
-        def update(username, ip, result):
-            rate_limit_defense(ip_buckets, clock, ip, username, result, refill_rate, max_tokens)
-        return check, update
-    
-    elif name == "hybrid":
-        ip_refill_rate = config.get('ip_refill_rate', 1.0)
-        ip_max_tokens = config.get('ip_max_tokens', 5)
-        account_refill_rate = config.get('account_refill_rate', 0.5)
-        account_max_tokens = config.get('account_max_tokens', 3)
-        
-        # Combine IP and account rate limiting
-        def check(username, ip):
-            # Check IP first
-            allowed, reason = rate_limit_defense(ip_buckets, clock, ip, username, None, ip_refill_rate, ip_max_tokens)
-            if not allowed:
-                return False, reason
-            # Then check account
-            return rate_limit_defense(account_buckets, clock, username, ip, None, account_refill_rate, account_max_tokens)
-        
-        def update(username, ip, result):
-            rate_limit_defense(ip_buckets, clock, ip, username, result, ip_refill_rate, ip_max_tokens)
-            rate_limit_defense(account_buckets, clock, username, ip, result, account_refill_rate, account_max_tokens)
-        
-        return check, update
+    names = [part for part in COMPOSITION_SPLIT.split(name.strip()) if part]
+    if len(names) == 1:
+        return _build_defense(names[0], database, clock, config)
     
-    else:
+    parts = []
+    for part in names:
+        part_config = config.get(part)
+        if not isinstance(part_config, dict):
+            part_config = config
+        parts.append((part, _build_defense(part, database, clock, part_config)))
+    return AllOfPolicy(parts)
+
+
+COMPOSITION_SPLIT = re.compile(r"\s*\+\s*|\s+AND\s+")
+
+
+def _build_defense(name, database, clock, config):
+    factory = DEFENSE_REGISTRY.get(name)
+    if factory is None:
         raise ValueError(f"Unknown defense: {name}")
+    return factory(database, clock, config)
+
+
+def get_defense(name, database, clock, config=None):
+    """
+    Older interface: returns (check, update) functions for a defense
+    
+    check(username, ip) -> (allowed, reason)
+    update(username, ip, result)
+    
+    Same config as get_defense_policy. Both functions are bound methods
+    of the policy, so check.__self__ is the policy object.
+    """
+    policy = get_defense_policy(name, database, clock, config)
+    return policy.check, policy.update
@@ -0,0 +1,355 @@
+"""
+event_log.py - Binary event log, a compact alternative to detail_log.csv
+
+detail_log.csv spells every timestamp, actor name, username and IP out
+as text, and analyze_trial has to parse all of it back. The binary log
+stores the same rows as fixed-width records instead:
+
+- float columns (timestamp) as 8-byte floats
+- every other column as a 4-byte id into that column's list of values
+  (so "normal_user_7" is written once, then referred to by number)
+
+The file is a standard NumPy .npy file holding one structured array, so
+    np.load("detail_log.npy", mmap_mode='r')['result']
+gives a whole column without reading the rest. The value lists are
+stored as JSON after the array (NumPy ignores them); load_event_log
+reads both. Writing needs only the standard library; reading uses numpy
+for memory-mapped columns when it's installed.
+
+The header's row count and the value lists are written when the sink is
+closed, so a log that was never closed can't be read.
+
+Convert to and from CSV (the round trip is byte for byte):
+    python event_log.py to-csv trial_0/detail_log.npy detail_log.csv
+    python event_log.py from-csv trial_0/detail_log.csv detail_log.npy
+"""
+import io
+import os
+import ast
+import csv
+import json
+import struct
+import argparse
+
+from log_sink import DEFAULT_FLUSH_EVERY
+from metrics import TrialMetrics
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+
+# Columns stored as floats; all others are stored as value ids
+FLOAT_COLUMNS = ('timestamp',)
+
+EVENT_LOG_VERSION = 1
+
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+
+# Header space is reserved for the largest row count up front, so the
+# real count can be written over it when the log is closed
+MAX_ROWS = 10 ** 19
+
+
+def _header_bytes(descr, rows):
+    """.npy (version 1.0) header for a structured array of rows records"""
+    def text(count):
+        return "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (descr, count)
+
+    # Magic + 2-byte length + text + newline, padded to a multiple of 64
+    size = len(NPY_MAGIC) + 2 + len(text(MAX_ROWS)) + 1
+    size += -size % 64
+    header = text(rows).ljust(size - len(NPY_MAGIC) - 2 - 1) + "\n"
+    return NPY_MAGIC + struct.pack("<H", len(header)) + header.encode('latin-1')
+
+
+class EventLogSink:
+    """
+    Writes rows to a binary event log - same interface as CsvLogSink
+
+    Rows are buffered and packed flush_every at a time. Use it as a
+    context manager (or call close()); the log is only readable once
+    it has been closed.
+    """
+    def __init__(self, path, header, flush_every=DEFAULT_FLUSH_EVERY, float_columns=FLOAT_COLUMNS):
+        """
+        path: .npy file to write (overwritten)
+        header: List of column names
+        flush_every: How many rows to buffer before writing them out
+        float_columns: Columns holding numbers; everything else is a string
+        """
+        self.path = path
+        self.header = list(header)
+        self.flush_every = max(1, flush_every)
+        self.rows_written = 0
+
+        self.float_columns = [name in float_columns for name in self.header]
+        # Per string column: value -> id, and the values in id order
+        self.ids = [None if is_float else {} for is_float in self.float_columns]
+        self.values = [None if is_float else [] for is_float in self.float_columns]
+        self.descr = [(name, '<f8' if is_float else '<i4')
+                      for name, is_float in zip(self.header, self.float_columns)]
+
+        self._buffer = []
+        self._struct = self._make_struct()
+        self._file = open(path, 'wb')
+        self._file.write(_header_bytes(self.descr, 0))
+
+    def _make_struct(self):
+        return struct.Struct("<" + "".join("d" if is_float else "i" for is_float in self.float_columns))
+
+    @property
+    def closed(self):
+        return self._file is None
+
+    def write(self, row):
+        """Add one row, writing the buffer out if it is full"""
+        self._buffer.append(row)
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def write_rows(self, rows):
+        """Add several rows at once, writing the buffer out if it is full"""
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def _encode(self, row):
+        fields = []
+        for value, ids, values in zip(row, self.ids, self.values):
+            if ids is None:
+                fields.append(float(value))
+                continue
+            # Same text the csv module would write
+            text = '' if value is None else str(value)
+            value_id = ids.get(text)
+            if value_id is None:
+                value_id = ids[text] = len(values)
+                values.append(text)
+            fields.append(value_id)
+        return self._struct.pack(*fields)
+
+    def flush(self):
+        """Write every buffered row to the file"""
+        if self._file is None:
+            return
+        if self._buffer:
+            self._file.write(b"".join(self._encode(row) for row in self._buffer))
+            self.rows_written += len(self._buffer)
+            self._buffer = []
+        self._file.flush()
+
+    def close(self):
+        """Write remaining rows, the value lists and the final header (safe to call twice)"""
+        if self._file is None:
+            return
+        try:
+            self.flush()
+            values = {name: column for name, column in zip(self.header, self.values) if column is not None}
+            self._file.write(json.dumps({'version': EVENT_LOG_VERSION, 'values': values}).encode())
+            self._file.seek(0)
+            self._file.write(_header_bytes(self.descr, self.rows_written))
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __getstate__(self):
+        """Pickle support for checkpoints - writes the buffer out and saves the file offset"""
+        self.flush()
+        state = self.__dict__.copy()
+        del state['_file'], state['_struct']
+        state['offset'] = self._file.tell() if self._file is not None else None
+        return state
+
+    def __setstate__(self, state):
+        """Cut the file back to the saved offset and append from there"""
+        offset = state.pop('offset')
+        self.__dict__.update(state)
+        self._struct = self._make_struct()
+        self._file = None
+        if offset is not None:
+            os.truncate(self.path, offset)
+            self._file = open(self.path, 'r+b')
+            self._file.seek(offset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class EventLog:
+    """
+    A binary event log opened for reading
+
+    names: Column names, in order
+    rows: Number of rows
+    values: {column: list of values} for the string columns
+
+    Give data (the file's bytes) to read a log that isn't a plain file,
+    e.g. one inside a zip archive; path is then only used in messages.
+    """
+    def __init__(self, path, data=None):
+        self.path = path
+        self.data = data
+        with self._open() as f:
+            if f.read(len(NPY_MAGIC)) != NPY_MAGIC:
+                raise ValueError(f"Not a binary event log: {path}")
+            header_length, = struct.unpack("<H", f.read(2))
+            header = ast.literal_eval(f.read(header_length).decode('latin-1'))
+            self.offset = len(NPY_MAGIC) + 2 + header_length
+
+            self.descr = [tuple(field) for field in header['descr']]
+            self.names = [name for name, _ in self.descr]
+            self.rows = header['shape'][0]
+            self.float_columns = [kind == '<f8' for _, kind in self.descr]
+            self._struct = struct.Struct("<" + "".join("d" if is_float else "i"
+                                                       for is_float in self.float_columns))
+
+            f.seek(self.offset + self.rows * self._struct.size)
+            trailer = f.read()
+        if not trailer:
+            raise ValueError(f"Event log was not closed properly: {path}")
+        self.values = json.loads(trailer)['values']
+
+    def _open(self):
+        return io.BytesIO(self.data) if self.data is not None else open(self.path, 'rb')
+
+    def records(self):
+        """The whole log as a read-only memory-mapped structured array (needs numpy)"""
+        if not HAS_NUMPY:
+            raise ImportError("Reading columns needs numpy - install it with: pip install numpy")
+        dtype = np.dtype(self.descr)
+        if not self.rows:
+            return np.zeros(0, dtype=dtype)
+        if self.data is not None:
+            return np.frombuffer(self.data, dtype=dtype, count=self.rows, offset=self.offset)
+        return np.memmap(self.path, dtype=dtype, mode='r', offset=self.offset, shape=(self.rows,))
+
+    def column(self, name):
+        """One column as a NumPy array - floats, or value ids for string columns"""
+        return self.records()[name]
+
+    def value_id(self, name, value):
+        """Id of value in a string column, or -1 if it never appears"""
+        values = self.values[name]
+        return values.index(value) if value in values else -1
+
+    def iter_rows(self, chunk_rows=65536):
+        """Rows as lists of values (floats and strings), in order"""
+        value_lists = [None if is_float else self.values[name]
+                       for name, is_float in zip(self.names, self.float_columns)]
+        with self._open() as f:
+            f.seek(self.offset)
+            remaining = self.rows
+            while remaining:
+                count = min(chunk_rows, remaining)
+                data = f.read(count * self._struct.size)
+                for fields in self._struct.iter_unpack(data):
+                    yield [field if values is None else values[field]
+                           for field, values in zip(fields, value_lists)]
+                remaining -= count
+
+    def iter_dicts(self):
+        """Rows as dicts keyed by column name, like csv.DictReader gives"""
+        names = self.names
+        for row in self.iter_rows():
+            yield dict(zip(names, row))
+
+
+def load_event_log(path, data=None):
+    """Open a binary event log for reading (see EventLog for data)"""
+    return EventLog(path, data)
+
+
+def event_log_metrics(path, data=None):
+    """
+    TrialMetrics for a binary detail log
+
+    With numpy, each metric is one vectorized filter over memory-mapped
+    columns; without it, the rows are counted one at a time. Both give
+    the same numbers as reading detail_log.csv.
+    """
+    log = load_event_log(path, data)
+    if not HAS_NUMPY:
+        metrics = TrialMetrics()
+        for row in log.iter_dicts():
+            metrics.add_row(row)
+        return metrics
+
+    records = log.records()
+    timestamps = records['timestamp']
+    actor_names = records['actor_name']
+    actor_types = records['actor_type']
+    usernames = records['username']
+    results = records['result']
+
+    def names(column, ids):
+        values = log.values[column]
+        return {values[i] for i in np.unique(ids).tolist()}
+
+    metrics = TrialMetrics()
+    metrics.total_events = log.rows
+
+    attacker = actor_types == log.value_id('actor_type', 'attacker')
+    success = results == log.value_id('result', 'success')
+    victim = usernames == log.value_id('username', 'victim')
+    metrics.attacker_events = int(np.count_nonzero(attacker))
+
+    compromises = attacker & success & victim
+    metrics.attacker_victim_successes = int(np.count_nonzero(compromises))
+    if metrics.attacker_victim_successes:
+        metrics.first_compromise_time = float(timestamps[compromises].min())
+    metrics.non_victim_compromised_users = names('username', usernames[attacker & success & ~victim])
+
+    user = actor_types == log.value_id('actor_type', 'user')
+    attempts = user & (results != log.value_id('result', ''))
+    blocked = user & (results == log.value_id('result', 'blocked'))
+    metrics.user_attempts = int(np.count_nonzero(attempts))
+    metrics.user_blocked = int(np.count_nonzero(blocked))
+    metrics.all_users = names('actor_name', actor_names[user])
+    metrics.blocked_users = names('actor_name', actor_names[blocked])
+    return metrics
+
+
+def event_log_to_csv(log_path, csv_path):
+    """Write a binary event log out as CSV (the same bytes the CSV sink would have written)"""
+    log = load_event_log(log_path)
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(log.names)
+        writer.writerows(log.iter_rows())
+    return log.rows
+
+
+def csv_to_event_log(csv_path, log_path, float_columns=FLOAT_COLUMNS):
+    """Convert a CSV log (detail_log.csv or auth_log.csv) to a binary event log"""
+    with open(csv_path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        with EventLogSink(log_path, header, float_columns=float_columns) as sink:
+            for row in reader:
+                sink.write(row)
+    return sink.rows_written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between CSV and binary event logs")
+    parser.add_argument("direction", choices=["to-csv", "from-csv"])
+    parser.add_argument("source")
+    parser.add_argument("target")
+    args = parser.parse_args()
+
+    if args.direction == "to-csv":
+        rows = event_log_to_csv(args.source, args.target)
+    else:
+        rows = csv_to_event_log(args.source, args.target)
+    print(f"Wrote {rows} rows to {args.target}")
+
+
+if __name__ == "__main__":
+    main()
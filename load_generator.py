@@ -0,0 +1,229 @@
+"""
+load_generator.py - Load test a running login server
+
+Replays the simulator's actors (the Attacker and NormalUser behaviour
+from actors.py) against login_server.py over real sockets. Actors are
+split across `concurrency` connections; each connection plays its
+actors' attempts in the order the simulation would, sending the next
+request as soon as the last answer is in (or on their schedule, with
+--time-scale). Every response is fed back to the actor with the same
+record_outcome the simulation uses, so lockouts and retries behave the
+same way.
+
+Reports requests/s, p50/p99 latency and how many attempts succeeded,
+failed or were blocked.
+
+Usage:
+    python load_generator.py --defense lockout              (starts its own server)
+    python load_generator.py --port 8000 --protocol http    (uses a running one)
+"""
+import json
+import math
+import time
+import heapq
+import asyncio
+import argparse
+
+from actors import create_attackers, create_users
+from run_simulation import record_outcome
+from sweep import create_attackers_cred_stuffing
+from login_server import LoginServer, PROTOCOLS, build_auth_service
+
+
+def percentile(values, pct):
+    """pct-th percentile (0-100) of a list of numbers, nearest rank"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class LoginClient:
+    """One connection to the login server"""
+    def __init__(self, reader, writer, protocol):
+        self.reader = reader
+        self.writer = writer
+        self.protocol = protocol
+
+    @classmethod
+    async def connect(cls, host, port, protocol):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, protocol)
+
+    async def login(self, username, password, ip):
+        """Send one login request and wait for the result dict"""
+        body = json.dumps({'username': username, 'password': password, 'ip': ip}).encode()
+        if self.protocol == "tcp":
+            self.writer.write(body + b"\n")
+            await self.writer.drain()
+            return json.loads(await self.reader.readline())
+
+        self.writer.write(
+            f"POST /login HTTP/1.1\r\n"
+            f"Host: localhost\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"\r\n".encode() + body
+        )
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection")
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode('latin-1').partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return json.loads(await self.reader.readexactly(length))
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+def create_actors(attacker_model="baseline", num_users=50, seed=0):
+    """The same actors run_one_trial uses, as (actor, actor_type) pairs"""
+    users = create_users(num_users=num_users, shared_ip=True)
+    if attacker_model == "cred_stuffing":
+        attackers = create_attackers_cred_stuffing(seed)
+    else:
+        attackers = create_attackers()
+    return [(attacker, 'attacker') for attacker in attackers] + [(user, 'user') for user in users]
+
+
+async def _run_connection(client, actors, stats, deadline, time_scale, max_requests):
+    """Play some actors' attempts over one connection, in simulated-time order"""
+    started = time.perf_counter()
+    events = []
+    for i, (actor, _) in enumerate(actors):
+        next_time = actor.next_attempt_time(0.0)
+        if next_time is not None:
+            heapq.heappush(events, (next_time, i))
+
+    while events and time.perf_counter() < deadline:
+        if max_requests is not None and len(stats['latencies']) >= max_requests:
+            break
+        event_time, i = heapq.heappop(events)
+        actor, actor_type = actors[i]
+
+        if time_scale:
+            delay = started + event_time * time_scale - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        username, password, ip = actor.get_credentials()
+        sent = time.perf_counter()
+        result = await client.login(username, password, ip)
+        stats['latencies'].append(time.perf_counter() - sent)
+
+        outcome, _ = record_outcome(actor, result)
+        stats[outcome] += 1
+
+        next_time = actor.next_attempt_time(event_time)
+        if next_time is not None:
+            heapq.heappush(events, (next_time, i))
+
+
+async def run_load(host, port, protocol="http", actors=None, concurrency=8, duration=10.0,
+                   time_scale=0.0, max_requests=None):
+    """
+    Replay actors against a login server
+
+    actors: (actor, actor_type) pairs (default: create_actors())
+    concurrency: Number of connections; actors are dealt out round-robin
+    duration: Stop after this many wall-clock seconds
+    time_scale: Wall seconds per simulated second (0 = as fast as possible)
+    max_requests: Stop once this many requests were answered
+
+    Returns a report dict (requests, requests_per_second, p50_ms, p99_ms, ...).
+    """
+    if actors is None:
+        actors = create_actors()
+    concurrency = max(1, min(concurrency, len(actors)))
+    shares = [actors[i::concurrency] for i in range(concurrency)]
+
+    stats = {'latencies': [], 'success': 0, 'failed': 0, 'blocked': 0}
+    clients = [await LoginClient.connect(host, port, protocol) for _ in shares]
+
+    started = time.perf_counter()
+    deadline = started + duration
+    try:
+        await asyncio.gather(*[
+            _run_connection(client, share, stats, deadline, time_scale, max_requests)
+            for client, share in zip(clients, shares)
+        ])
+    finally:
+        for client in clients:
+            await client.close()
+    seconds = time.perf_counter() - started
+
+    latencies = stats['latencies']
+    return {
+        'protocol': protocol,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'seconds': seconds,
+        'requests_per_second': len(latencies) / seconds if seconds > 0 else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'success': stats['success'],
+        'failed': stats['failed'],
+        'blocked': stats['blocked'],
+    }
+
+
+async def run_against_local_server(defense_name="lockout", config=None, protocol="http", attacker_model="baseline",
+                                   num_users=50, backend="sqlite", db_options=None, **load_options):
+    """Start a LoginServer on a free port in this process and load test it"""
+    auth_service = build_auth_service(defense_name, config, num_users, backend, db_options)
+    server = await LoginServer(auth_service, protocol=protocol).start()
+    try:
+        actors = create_actors(attacker_model, num_users)
+        return await run_load(server.host, server.port, protocol, actors, **load_options)
+    finally:
+        await server.close()
+
+
+def print_report(report):
+    print(f"{report['requests']} requests in {report['seconds']:.1f}s over {report['concurrency']} "
+          f"{report['protocol']} connections")
+    print(f"  {report['requests_per_second']:.0f} requests/s  "
+          f"p50 {report['p50_ms']:.2f} ms  p99 {report['p99_ms']:.2f} ms")
+    print(f"  success {report['success']}  failed {report['failed']}  blocked {report['blocked']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the login server with simulated actors")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None,
+                        help="Port of a running login_server.py (default: start one here)")
+    parser.add_argument("--protocol", choices=PROTOCOLS, default="http")
+    parser.add_argument("--defense", default="lockout", help="Defense for the local server")
+    parser.add_argument("--config", default="{}", help="Defense config as JSON, for the local server")
+    parser.add_argument("--attacker-model", choices=["baseline", "cred_stuffing"], default="baseline")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of connections")
+    parser.add_argument("--duration", type=float, default=10.0, help="Wall-clock seconds to run")
+    parser.add_argument("--time-scale", type=float, default=0.0,
+                        help="Wall seconds per simulated second (0 = as fast as possible)")
+    parser.add_argument("--max-requests", type=int, default=None)
+    args = parser.parse_args()
+
+    load_options = dict(concurrency=args.concurrency, duration=args.duration,
+                        time_scale=args.time_scale, max_requests=args.max_requests)
+    if args.port is None:
+        report = asyncio.run(run_against_local_server(args.defense, json.loads(args.config), args.protocol,
+                                                      args.attacker_model, args.users, **load_options))
+    else:
+        actors = create_actors(args.attacker_model, args.users)
+        report = asyncio.run(run_load(args.host, args.port, args.protocol, actors, **load_options))
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
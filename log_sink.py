@@ -0,0 +1,103 @@
+"""
+log_sink.py - Buffered CSV writer for simulation logs
+
+Opening a file and building a new csv.writer for every login attempt
+costs two syscalls per row. A long trial writes tens of thousands of
+rows, so instead we keep one file handle open for the whole trial,
+collect rows in memory, and write them out in batches.
+"""
+import os
+import csv
+
+from results_io import open_log_file, is_compressed
+
+
+DEFAULT_FLUSH_EVERY = 1000
+
+
+class CsvLogSink:
+    """
+    Keeps one CSV file open and buffers rows until flush_every is reached
+
+    Use it as a context manager (or call close()) so the last rows are
+    always written, even if the simulation raises.
+    """
+    def __init__(self, path, header, flush_every=DEFAULT_FLUSH_EVERY):
+        """
+        path: CSV file to write (overwritten) - ending it in .gz or .zst
+              writes it compressed
+        header: List of column names written as the first row
+        flush_every: How many rows to buffer before writing them out
+        """
+        self.path = path
+        self.flush_every = max(1, flush_every)
+        self.rows_written = 0
+
+        self._buffer = []
+        self._file = open_log_file(path)
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(header)
+
+    @property
+    def closed(self):
+        return self._file is None
+
+    def write(self, row):
+        """Add one row, writing the buffer out if it is full"""
+        self._buffer.append(row)
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def write_rows(self, rows):
+        """Add several rows at once, writing the buffer out if it is full"""
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write every buffered row to the file"""
+        if self._file is None:
+            return
+        if self._buffer:
+            self._writer.writerows(self._buffer)
+            self.rows_written += len(self._buffer)
+            self._buffer = []
+        self._file.flush()
+
+    def close(self):
+        """Flush remaining rows and close the file (safe to call twice)"""
+        if self._file is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __getstate__(self):
+        """Pickle support for checkpoints - writes the buffer out and saves the file offset"""
+        if is_compressed(self.path):
+            raise ValueError(f"Can't checkpoint a compressed log: {self.path}")
+        self.flush()
+        state = self.__dict__.copy()
+        del state['_file'], state['_writer']
+        state['offset'] = self._file.tell() if self._file is not None else None
+        return state
+
+    def __setstate__(self, state):
+        """Cut the file back to the saved offset and append from there"""
+        offset = state.pop('offset')
+        self.__dict__.update(state)
+        self._file = None
+        self._writer = None
+        if offset is not None:
+            os.truncate(self.path, offset)
+            self._file = open(self.path, 'a', newline='')
+            self._writer = csv.writer(self._file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
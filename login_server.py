@@ -0,0 +1,315 @@
+"""
+login_server.py - Run AuthService as a real login service
+
+Wraps AuthService.login in an asyncio server on localhost so a defense
+can be load tested in real time instead of simulated time. Two protocols:
+
+- "tcp":  One JSON object per line, e.g.
+          {"username": "victim", "password": "123456", "ip": "10.0.0.1"}
+          and one JSON response per line: {"success": false, "reason": "locked"}
+- "http": POST /login with the same JSON body (HTTP/1.1, keep-alive).
+          Status is 200 on success, 401 for a bad password and 429 when
+          the defense blocked the attempt.
+
+"ip" is optional; the client's address is used if it's missing. A
+request that can't be parsed gets a 400 and the connection is closed;
+a login that fails with an error gets a 500 and the connection stays
+open.
+
+Each connection reads at most max_pipelined requests ahead of the one
+being answered. Once that many are waiting the server stops reading
+from the socket, so a client that sends faster than it reads gets
+slowed down by TCP instead of filling the server's memory.
+
+AuthService isn't thread safe, so every login runs on one worker
+thread. That keeps the event loop free to accept and read connections
+while a slow password hash runs.
+
+Usage:
+    python login_server.py --defense lockout --protocol http --port 8000
+"""
+import sys
+import json
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from clock import WallClock
+from database import get_database
+from defenses import get_defense_policy, list_defenses
+from auth_service import AuthService
+from actors import create_users
+from passwords import HASHERS
+from run_simulation import BLOCK_REASONS
+
+
+PROTOCOLS = ["tcp", "http"]
+
+DEFAULT_MAX_PIPELINED = 32
+
+# Largest request line or body we accept
+MAX_REQUEST_BYTES = 64 * 1024
+
+HTTP_STATUS = {200: "OK", 400: "Bad Request", 401: "Unauthorized",
+               429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+class BadRequest(ValueError):
+    """A request that can't be parsed - answered with an error, then the connection closes"""
+
+
+class LoginServer:
+    """
+    asyncio server that answers login requests with AuthService.login
+
+    auth_service: The AuthService to use (give it a WallClock)
+    host, port: Where to listen (port 0 picks a free port, see .port)
+    protocol: "tcp" (JSON lines) or "http"
+    max_pipelined: Requests read ahead per connection before reading stops
+    """
+    def __init__(self, auth_service, host="127.0.0.1", port=0, protocol="tcp",
+                 max_pipelined=DEFAULT_MAX_PIPELINED):
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"Unknown protocol: {protocol}")
+        self.auth_service = auth_service
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.max_pipelined = max(1, max_pipelined)
+
+        self.requests = 0
+        # Requests taken off sockets, including ones still waiting for an answer
+        self.requests_read = 0
+        self.connections = 0
+        self._server = None
+        self._handlers = set()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def start(self):
+        """Start listening - returns once the port is open"""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                  limit=MAX_REQUEST_BYTES)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self, timeout=1.0):
+        """
+        Stop accepting connections and close the auth service
+        
+        Open connections get timeout seconds to finish their requests.
+        """
+        if self._server is not None:
+            self._server.close()
+        if self._handlers:
+            _, unfinished = await asyncio.wait(self._handlers, timeout=timeout)
+            for task in unfinished:
+                task.cancel()
+            await asyncio.gather(*unfinished, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+        self._executor.shutdown()
+        self.auth_service.close()
+
+    async def _handle_connection(self, reader, writer):
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        self.connections += 1
+        peer = writer.get_extra_info('peername')
+        peer_ip = peer[0] if peer else "127.0.0.1"
+
+        # Requests read but not answered yet. A full queue pauses the
+        # reader, which is what pushes back on the client.
+        pending = asyncio.Queue(maxsize=self.max_pipelined)
+        read_requests = self._read_http if self.protocol == "http" else self._read_tcp
+        reading = asyncio.ensure_future(read_requests(reader, pending))
+
+        try:
+            while True:
+                request = await pending.get()
+                if request is None:
+                    break
+                if isinstance(request, BadRequest):
+                    self._write_response(writer, 400, {'error': str(request)})
+                    await writer.drain()
+                    break
+
+                try:
+                    response, status = await self._login(request, peer_ip)
+                except Exception as e:
+                    response, status = {'error': f"Login failed: {e}"}, 500
+                self._write_response(writer, status, response)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            reading.cancel()
+            writer.close()
+            self._handlers.discard(handler)
+
+    async def _read_tcp(self, reader, pending):
+        """Put one request per JSON line on the queue, then None at EOF"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                await self._queue(pending, _parse_request(line))
+        except (ConnectionError, ValueError) as e:
+            await pending.put(BadRequest(str(e)))
+        await pending.put(None)
+
+    async def _read_http(self, reader, pending):
+        """Put one request per HTTP POST /login on the queue, then None at EOF"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                if not request_line.strip():
+                    continue
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    raise BadRequest("Malformed request line")
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > MAX_REQUEST_BYTES:
+                    raise BadRequest("Request body too large")
+                body = await reader.readexactly(length)
+
+                method, path, _ = parts
+                if method != "POST" or path != "/login":
+                    await pending.put(BadRequest(f"Only POST /login is supported, got {method} {path}"))
+                    break
+                await self._queue(pending, _parse_request(body))
+
+                if headers.get('connection', '').lower() == "close":
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError) as e:
+            await pending.put(e if isinstance(e, BadRequest) else BadRequest(str(e)))
+        await pending.put(None)
+
+    async def _queue(self, pending, request):
+        """Wait for room in the connection's queue, then add a request to it"""
+        await pending.put(request)
+        self.requests_read += 1
+
+    async def _login(self, request, peer_ip):
+        """Run one login on the worker thread - returns (response dict, HTTP status)"""
+        username = request['username']
+        password = request['password']
+        ip = request.get('ip') or peer_ip
+
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._executor, self.auth_service.login, username, password, ip)
+        self.requests += 1
+
+        response = {'success': result['success']}
+        if result['success']:
+            return response, 200
+        response['reason'] = result['reason']
+        return response, 429 if result['reason'] in BLOCK_REASONS else 401
+
+    def _write_response(self, writer, status, response):
+        body = json.dumps(response).encode()
+        if self.protocol == "tcp":
+            writer.write(body + b"\n")
+            return
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_STATUS[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"\r\n".encode() + body
+        )
+
+
+def _parse_request(data):
+    """JSON login request -> dict with username, password and maybe ip"""
+    try:
+        request = json.loads(data)
+    except ValueError:
+        return BadRequest("Request is not valid JSON")
+    if not isinstance(request, dict) or 'username' not in request or 'password' not in request:
+        return BadRequest("Request needs username and password")
+    for field in ('username', 'password', 'ip'):
+        if field in request and not isinstance(request[field], str):
+            return BadRequest(f"{field} must be a string")
+    return request
+
+
+def build_auth_service(defense_name="lockout", config=None, num_users=50, backend="sqlite",
+                       db_options=None, log_file=None):
+    """
+    AuthService on a WallClock with the simulator's accounts
+
+    Accounts are the same as run_one_trial's: "victim" plus num_users
+    normal users, so the load generator's actors can log in.
+    """
+    clock = WallClock()
+    database = get_database(backend, **(db_options or {}))
+    users = create_users(num_users=num_users, shared_ip=True)
+    accounts = [("victim", "secret_password", clock.now())]
+    accounts += [(user.username, user.password, clock.now()) for user in users]
+    database.add_users(accounts)
+
+    defense = get_defense_policy(defense_name, database, clock, config or {})
+    return AuthService(database, clock, log_file=log_file, defense=defense)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve AuthService logins on localhost")
+    parser.add_argument("--defense", default="lockout",
+                        help=f"Defense name or combination ({', '.join(list_defenses())})")
+    parser.add_argument("--config", default="{}", help="Defense config as JSON")
+    parser.add_argument("--protocol", choices=PROTOCOLS, default="http")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--users", type=int, default=50, help="Normal user accounts to create")
+    parser.add_argument("--backend", choices=["sqlite", "memory"], default="sqlite")
+    parser.add_argument("--hasher", choices=HASHERS, default="sha256")
+    parser.add_argument("--password-cache-size", type=int, default=None,
+                        help="Password verdicts to cache (default 4096 with sha256, off with pbkdf2/scrypt)")
+    parser.add_argument("--max-pipelined", type=int, default=DEFAULT_MAX_PIPELINED,
+                        help="Requests read ahead per connection before pushing back")
+    parser.add_argument("--log-file", default=None, help="Write the auth log here")
+    args = parser.parse_args()
+
+    db_options = {'hasher': args.hasher}
+    if args.password_cache_size is not None:
+        db_options['password_cache_size'] = args.password_cache_size
+    auth_service = build_auth_service(args.defense, json.loads(args.config), args.users, args.backend,
+                                      db_options, args.log_file)
+    server = LoginServer(auth_service, args.host, args.port, args.protocol, args.max_pipelined)
+
+    async def run():
+        await server.start()
+        print(f"Serving {args.defense} logins over {args.protocol} on {args.host}:{server.port}")
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print(f"\nStopped after {server.requests} requests")
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+metrics.py - Trial metrics computed one event at a time
+
+TrialMetrics keeps running counts instead of a list of events, so it
+uses the same memory for a 60 second trial as for a 24 hour one. It can
+be fed rows read back from detail_log.csv or events straight from the
+simulation.
+"""
+import json
+
+
+class TrialMetrics:
+    """Running totals for the metrics reported by analyze_trial"""
+    def __init__(self):
+        self.total_events = 0
+        self.attacker_events = 0
+        self.attacker_victim_successes = 0
+        self.first_compromise_time = None
+        self.non_victim_compromised_users = set()
+
+        self.user_attempts = 0
+        self.user_blocked = 0
+        self.blocked_users = set()
+        self.all_users = set()
+
+    def add(self, timestamp, actor_name, actor_type, username, result, count=1):
+        """Count one login event (or count identical ones at once)"""
+        self.total_events += count
+
+        if actor_type == 'attacker':
+            self.attacker_events += count
+            if result == 'success':
+                if username == 'victim':
+                    self.attacker_victim_successes += count
+                    timestamp = float(timestamp)
+                    if self.first_compromise_time is None or timestamp < self.first_compromise_time:
+                        self.first_compromise_time = timestamp
+                else:
+                    self.non_victim_compromised_users.add(username)
+
+        elif actor_type == 'user':
+            self.all_users.add(actor_name)
+            if result != '':
+                self.user_attempts += count
+                if result == 'blocked':
+                    self.user_blocked += count
+                    self.blocked_users.add(actor_name)
+
+    def add_row(self, row):
+        """Count one detail_log row (a dict keyed by the CSV header)"""
+        self.add(row['timestamp'], row['actor_name'], row['actor_type'], row['username'], row['result'])
+
+    def to_dict(self):
+        """Plain dict of the running totals (JSON friendly)"""
+        return {
+            'total_events': self.total_events,
+            'attacker_events': self.attacker_events,
+            'attacker_victim_successes': self.attacker_victim_successes,
+            'first_compromise_time': self.first_compromise_time,
+            'non_victim_compromised_users': sorted(self.non_victim_compromised_users),
+            'user_attempts': self.user_attempts,
+            'user_blocked': self.user_blocked,
+            'blocked_users': sorted(self.blocked_users),
+            'all_users': sorted(self.all_users),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild the running totals saved by to_dict()"""
+        metrics = cls()
+        for name, value in data.items():
+            if isinstance(getattr(metrics, name), set):
+                value = set(value)
+            setattr(metrics, name, value)
+        return metrics
+
+    def save(self, path):
+        """Write the running totals to a JSON file"""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """Read running totals written by save()"""
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+    def results(self, duration):
+        """The metrics dict returned by analyze_trial"""
+        if self.first_compromise_time is not None:
+            time_to_compromise = self.first_compromise_time
+        else:
+            time_to_compromise = duration  # Never compromised
+
+        if self.attacker_events > 0:
+            compromise_rate = self.attacker_victim_successes / self.attacker_events
+        else:
+            compromise_rate = 0.0
+
+        if self.user_attempts > 0:
+            block_rate = self.user_blocked / self.user_attempts
+        else:
+            block_rate = 0.0
+
+        if len(self.all_users) > 0:
+            impacted_users_pct = len(self.blocked_users) / len(self.all_users)
+        else:
+            impacted_users_pct = 0.0
+
+        if duration > 0:
+            throughput = self.total_events / duration
+        else:
+            throughput = 0.0
+
+        return {
+            'compromised': 1 if self.attacker_victim_successes > 0 else 0,
+            'compromise_rate': compromise_rate,
+            'time_to_compromise': time_to_compromise,
+            'block_rate': block_rate,
+            'impacted_users_pct': impacted_users_pct,
+            'throughput': throughput,
+            'total_events': self.total_events,
+            'non_victim_compromised': len(self.non_victim_compromised_users)
+        }
@@ -0,0 +1,247 @@
+"""
+passwords.py - Password hashing with a realistic cost
+
+A real login server spends most of its CPU on password hashing, and a
+defense that blocks an attempt before the password is checked saves all
+of it. The hashers here let the simulator charge that cost:
+
+- "sha256": One unsalted SHA-256 (the original behaviour, very cheap)
+- "pbkdf2": Salted PBKDF2-HMAC-SHA256, cost set by iterations
+- "scrypt": Salted scrypt, cost set by n, r and p
+
+Stored hashes say which scheme made them (e.g. "pbkdf2_sha256$...") so
+verify_password() can check any of them, whatever the current hasher is.
+Every hasher counts how many verifications it did and the CPU seconds
+they took.
+"""
+import os
+import hmac
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+HASHERS = ["sha256", "pbkdf2", "scrypt"]
+
+# Defaults that take a few tens of milliseconds per hash on a laptop
+DEFAULT_PBKDF2_ITERATIONS = 100000
+DEFAULT_SCRYPT_N = 2 ** 14
+DEFAULT_SCRYPT_R = 8
+DEFAULT_SCRYPT_P = 1
+
+SALT_BYTES = 16
+
+
+def sha256_hash(password):
+    """Unsalted SHA-256 hex digest (the original database.hash_password)"""
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def pbkdf2_hash(password, iterations=DEFAULT_PBKDF2_ITERATIONS, salt=None):
+    """Salted PBKDF2-HMAC-SHA256, stored as pbkdf2_sha256$iterations$salt$hash"""
+    if salt is None:
+        salt = os.urandom(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+
+def scrypt_hash(password, n=DEFAULT_SCRYPT_N, r=DEFAULT_SCRYPT_R, p=DEFAULT_SCRYPT_P, salt=None):
+    """Salted scrypt, stored as scrypt$n$r$p$salt$hash"""
+    if salt is None:
+        salt = os.urandom(SALT_BYTES)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                            maxmem=_scrypt_maxmem(n, r))
+    return f"scrypt${n}${r}${p}${salt.hex()}${digest.hex()}"
+
+
+def _scrypt_maxmem(n, r):
+    # scrypt needs about 128 * n * r bytes; OpenSSL's default limit is 32 MB
+    return 128 * n * r + 1024 * 1024
+
+
+def verify_password(password, stored):
+    """Check a password against a stored hash made by any of the hashers"""
+    if stored.startswith("pbkdf2_sha256$"):
+        _, iterations, salt, _ = stored.split("$")
+        expected = pbkdf2_hash(password, int(iterations), bytes.fromhex(salt))
+    elif stored.startswith("scrypt$"):
+        _, n, r, p, salt, _ = stored.split("$")
+        expected = scrypt_hash(password, int(n), int(r), int(p), bytes.fromhex(salt))
+    else:
+        expected = sha256_hash(password)
+    return hmac.compare_digest(expected, stored)
+
+
+def _timed_verify(password, stored):
+    """verify_password plus the CPU seconds it took in this thread"""
+    started = time.thread_time()
+    verdict = verify_password(password, stored)
+    return verdict, time.thread_time() - started
+
+
+def _timed_hash(hasher, password):
+    """hasher.make(password) plus the CPU seconds it took in this thread"""
+    started = time.thread_time()
+    stored = hasher.make(password)
+    return stored, time.thread_time() - started
+
+
+class PasswordHasher:
+    """
+    Base class for hashers
+
+    Subclasses implement make(password). hash() and verify() wrap it and
+    keep the counters that stats() reports.
+    """
+    name = None
+
+    def __init__(self):
+        self.hashes = 0
+        self.hash_cpu_seconds = 0.0
+        self.verifications = 0
+        self.verify_cpu_seconds = 0.0
+
+    def make(self, password):
+        """Stored hash for a password"""
+        raise NotImplementedError
+
+    def hash(self, password):
+        """Hash a new password"""
+        stored, seconds = _timed_hash(self, password)
+        self.record_hashes(1, seconds)
+        return stored
+
+    def verify(self, password, stored):
+        """Check a password against a stored hash"""
+        verdict, seconds = _timed_verify(password, stored)
+        self.record_verifications(1, seconds)
+        return verdict
+
+    def record_hashes(self, count, cpu_seconds):
+        self.hashes += count
+        self.hash_cpu_seconds += cpu_seconds
+
+    def record_verifications(self, count, cpu_seconds):
+        self.verifications += count
+        self.verify_cpu_seconds += cpu_seconds
+
+    def stats(self):
+        """Counts and CPU seconds spent hashing new passwords and verifying logins"""
+        return {
+            'hasher': self.name,
+            'hashes': self.hashes,
+            'hash_cpu_seconds': self.hash_cpu_seconds,
+            'verifications': self.verifications,
+            'verify_cpu_seconds': self.verify_cpu_seconds,
+        }
+
+    def __getstate__(self):
+        # Only the settings go to pool workers, not the counters
+        state = self.__dict__.copy()
+        for name in ('hashes', 'hash_cpu_seconds', 'verifications', 'verify_cpu_seconds'):
+            state[name] = 0
+        return state
+
+
+class Sha256Hasher(PasswordHasher):
+    """One unsalted SHA-256 - cheap, and what the simulator always used"""
+    name = "sha256"
+
+    def make(self, password):
+        return sha256_hash(password)
+
+
+class Pbkdf2Hasher(PasswordHasher):
+    """Salted PBKDF2-HMAC-SHA256"""
+    name = "pbkdf2"
+
+    def __init__(self, iterations=DEFAULT_PBKDF2_ITERATIONS):
+        super().__init__()
+        self.iterations = iterations
+
+    def make(self, password):
+        return pbkdf2_hash(password, self.iterations)
+
+
+class ScryptHasher(PasswordHasher):
+    """Salted scrypt"""
+    name = "scrypt"
+
+    def __init__(self, n=DEFAULT_SCRYPT_N, r=DEFAULT_SCRYPT_R, p=DEFAULT_SCRYPT_P):
+        super().__init__()
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def make(self, password):
+        return scrypt_hash(password, self.n, self.r, self.p)
+
+
+def get_hasher(name="sha256", **options):
+    """
+    Pick a password hasher
+
+    name: "sha256", "pbkdf2" or "scrypt"
+    options: iterations (pbkdf2) or n, r, p (scrypt)
+    """
+    if name == "sha256":
+        return Sha256Hasher()
+    elif name == "pbkdf2":
+        return Pbkdf2Hasher(**options)
+    elif name == "scrypt":
+        return ScryptHasher(**options)
+    else:
+        raise ValueError(f"Unknown password hasher: {name}")
+
+
+class VerifierPool:
+    """
+    Hashes and verifies many passwords at once on a pool of workers
+
+    hasher: The PasswordHasher whose counters get the work done here
+    workers: Number of threads or processes
+    kind: "thread" (hashlib releases the GIL while hashing, so threads
+          run in parallel) or "process"
+
+    Close it when done, or use it as a context manager.
+    """
+    def __init__(self, hasher, workers=4, kind="thread"):
+        if kind == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+        elif kind == "process":
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            raise ValueError(f"Unknown verifier pool kind: {kind}")
+        self.hasher = hasher
+        self.workers = workers
+        self.kind = kind
+
+    def verify_many(self, credentials):
+        """
+        credentials: List of (password, stored_hash)
+
+        Returns the verdicts in the same order.
+        """
+        if not credentials:
+            return []
+        passwords, stored = zip(*credentials)
+        results = list(self.executor.map(_timed_verify, passwords, stored))
+        self.hasher.record_verifications(len(results), sum(seconds for _, seconds in results))
+        return [verdict for verdict, _ in results]
+
+    def hash_many(self, passwords):
+        """Stored hashes for a list of new passwords, in the same order"""
+        if not passwords:
+            return []
+        results = list(self.executor.map(_timed_hash, [self.hasher] * len(passwords), passwords))
+        self.hasher.record_hashes(len(results), sum(seconds for _, seconds in results))
+        return [stored for stored, _ in results]
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
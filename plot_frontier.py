@@ -1,10 +1,15 @@
 """
 Plot security vs usability tradeoff from summary_aggregated.csv
+
+The results can be a directory or one inside a zip archive, e.g.
+    python plot_frontier.py paper_results.zip/results
 """
 import os
 import csv
 import sys
 
+from results_io import open_results
+
 try:
     import matplotlib.pyplot as plt
     import matplotlib.patches as mpatches
@@ -17,26 +22,27 @@ except ImportError:
 
 
 def load_aggregated_results(results_dir):
-    """Load summary_aggregated.csv"""
-    agg_file = os.path.join(results_dir, "summary_aggregated.csv")
-    
-    if not os.path.exists(agg_file):
-        print(f"Error: {agg_file} not found!")
-        print("Run analyze_sweep.py first")
-        return []
-    
-    results = []
-    with open(agg_file, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            results.append({
-                'defense': row['defense'],
-                'param_value': row['param_value'],
-                'mean_compromise': float(row['mean_compromise_rate']),
-                'std_compromise': float(row['std_compromise_rate']),
-                'mean_block': float(row['mean_block_rate']),
-                'std_block': float(row['std_block_rate'])
-            })
+    """Load summary_aggregated.csv (from a directory, a zip archive, or gzip/zstd compressed)"""
+    with open_results(results_dir) as source:
+        agg_file = source.find("summary_aggregated.csv")
+        
+        if agg_file is None:
+            print(f"Error: {source}/summary_aggregated.csv not found!")
+            print("Run analyze_sweep.py first")
+            return []
+        
+        results = []
+        with source.open_text(agg_file) as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                results.append({
+                    'defense': row['defense'],
+                    'param_value': row['param_value'],
+                    'mean_compromise': float(row['mean_compromise_rate']),
+                    'std_compromise': float(row['std_compromise_rate']),
+                    'mean_block': float(row['mean_block_rate']),
+                    'std_block': float(row['std_block_rate'])
+                })
     
     return results
 
@@ -133,8 +139,9 @@ def main():
     
     print(f"Found {len(results)} data points")
     
-    # Create figures directory
-    figures_dir = os.path.join(results_dir, "figures")
+    # Create figures directory (next to the archive for zipped results)
+    with open_results(results_dir) as source:
+        figures_dir = os.path.join(source.output_dir, "figures")
     
     print("Creating frontier plot...")
     plot_frontier(results, figures_dir)
@@ -0,0 +1,168 @@
+"""
+population.py - Many normal users stored as NumPy arrays
+
+A NormalUser is a Python object with its own random.Random, which is
+fine for 50 users but not for a million. UserPopulation keeps the same
+per-user state (next login time, retry count, times blocked, shared IP
+or not) in arrays, one slot per user, and draws the typo and think-time
+randoms in big vectorized batches.
+
+To the event loop the whole population is one actor. It keeps a small
+heap of the users due soonest (refilled with np.argpartition when it
+runs dry) and hands them out one at a time in time order, so it slots
+into run_simulation next to the attackers without any changes there.
+
+The behaviour per user is the same as NormalUser (60% typos, up to 4
+immediate retries, +60s after a block, ~30s between logins, +1 hour
+after giving up), but the random numbers come from one NumPy generator,
+so a population run is statistically the same as one with NormalUser
+objects rather than identical to it.
+
+Needs numpy (pip install numpy).
+"""
+import heapq
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+
+# NormalUser's behaviour, in one place
+TYPO_RATE = 0.60
+MAX_RETRIES = 4
+FIRST_LOGIN_WINDOW = 60.0
+THINK_TIME = 30.0
+THINK_JITTER = 10.0
+BLOCK_DELAY = 60.0
+GIVE_UP_DELAY = 3600.0
+
+# Users sharing one IP when shared_ip is on (same as create_users)
+SHARED_IP_USERS = 15
+SHARED_IP = "192.168.1.100"
+
+
+class UserPopulation:
+    """
+    All normal users of a trial, as one actor
+
+    num_users: How many users (user0 .. user{n-1}, password pass{i})
+    shared_ip: First 15 users share one IP, like create_users
+    seed: Seed for the population's random generator
+    chunk_size: How many soonest-due users to keep in the heap at once
+    draw_batch: How many random numbers to draw per vectorized call
+    """
+    def __init__(self, num_users, shared_ip=True, seed=0, chunk_size=4096, draw_batch=65536):
+        if not HAS_NUMPY:
+            raise ImportError("UserPopulation needs numpy - install it with: pip install numpy")
+
+        self.num_users = num_users
+        self.chunk_size = max(1, chunk_size)
+        self.draw_batch = max(1, draw_batch)
+        self.rng = np.random.default_rng(seed)
+
+        self.next_login = self.rng.uniform(0, FIRST_LOGIN_WINDOW, num_users)
+        self.retry_count = np.zeros(num_users, dtype=np.int8)
+        self.times_blocked = np.zeros(num_users, dtype=np.int32)
+        self.shared_ip = np.zeros(num_users, dtype=bool)
+        if shared_ip:
+            self.shared_ip[:SHARED_IP_USERS] = True
+
+        # Heap of (next_login, user) for the users due soonest. Every user
+        # whose next_login is below horizon is in it.
+        self._due = []
+        self._horizon = float('-inf')
+        self._uniforms = []
+        self._next_uniform = 0
+
+        # The user whose attempt is in progress (set by get_credentials)
+        self.current = None
+
+    @property
+    def name(self):
+        """Actor name of the current user, as NormalUser would have it"""
+        return f"normal_user_{self.current}"
+
+    def _refill(self):
+        """Load the chunk_size soonest-due users into the heap"""
+        count = min(self.chunk_size, self.num_users)
+        if count == self.num_users:
+            users = np.arange(self.num_users)
+        else:
+            users = np.argpartition(self.next_login, count - 1)[:count]
+        times = self.next_login[users]
+
+        self._due = list(zip(times.tolist(), users.tolist()))
+        heapq.heapify(self._due)
+        self._horizon = float(times.max())
+
+    def _uniform(self):
+        """Next U(0, 1) from the current batch, drawing a new batch when used up"""
+        if self._next_uniform >= len(self._uniforms):
+            self._uniforms = self.rng.random(self.draw_batch).tolist()
+            self._next_uniform = 0
+        value = self._uniforms[self._next_uniform]
+        self._next_uniform += 1
+        return value
+
+    def ip(self, user):
+        """IP address of a user (same scheme as create_users)"""
+        if self.shared_ip[user]:
+            return SHARED_IP
+        return f"192.168.{user // 256}.{user % 256}"
+
+    def next_attempt_time(self, current_time):
+        """When the next user wants to log in (None if there are no users)"""
+        if not self._due:
+            if not self.num_users:
+                return None
+            self._refill()
+        return self._due[0][0]
+
+    def get_credentials(self):
+        """Username and password (maybe with a typo) of the next user due"""
+        _, user = self._due[0]
+        self.current = user
+
+        password = f"pass{user}"
+        if self._uniform() < TYPO_RATE:
+            password += "X"  # Typo!
+        return f"user{user}", password, self.ip(user)
+
+    def record_result(self, success, blocked=False):
+        """Record what happened to the current user's attempt"""
+        _, user = heapq.heappop(self._due)
+        next_login = float(self.next_login[user])
+
+        if blocked:
+            self.times_blocked[user] += 1
+            next_login += BLOCK_DELAY
+            self.retry_count[user] = 0
+        elif success:
+            next_login += THINK_TIME + (2 * self._uniform() - 1) * THINK_JITTER
+            self.retry_count[user] = 0
+        elif self.retry_count[user] < MAX_RETRIES:
+            # Try again immediately
+            self.retry_count[user] += 1
+        else:
+            # Give up, try later
+            next_login += GIVE_UP_DELAY
+            self.retry_count[user] = 0
+
+        self.next_login[user] = next_login
+        if next_login <= self._horizon:
+            heapq.heappush(self._due, (next_login, user))
+
+    def accounts(self, created_at=0.0):
+        """(username, password, created_at) for every user, for Database.add_users"""
+        for user in range(self.num_users):
+            yield f"user{user}", f"pass{user}", created_at
+
+    def stats(self):
+        """How many users were ever blocked, and the total number of blocks"""
+        return {
+            'users': self.num_users,
+            'users_blocked': int(np.count_nonzero(self.times_blocked)),
+            'times_blocked': int(self.times_blocked.sum()),
+        }
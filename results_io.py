@@ -0,0 +1,251 @@
+"""
+results_io.py - Read sweep results from directories, zip archives and compressed logs
+
+Finished sweeps get archived (paper_results.zip), and big trials can
+write their logs compressed. Instead of unzipping everything first,
+analyze_sweep and plot_frontier open results through open_results(),
+which takes any of:
+
+    results                          a results directory
+    paper_results.zip/results        a directory inside a zip archive
+    paper_results.zip                the archive itself, if it holds one sweep
+
+Inside, any file can also be stored compressed as name.gz (gzip) or
+name.zst (zstd, needs pip install zstandard); find() picks whichever is
+there and open() decompresses while reading. Zip members are streamed
+straight from the archive, nothing is extracted to disk.
+
+open_log_file() is the writing side: it opens a log for writing,
+compressed according to its suffix.
+"""
+import io
+import os
+import gzip
+import hashlib
+import zipfile
+from contextlib import contextmanager, ExitStack
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+
+# Compression for trial logs, and the suffix each adds to file names
+COMPRESSIONS = ["none", "gzip", "zstd"]
+COMPRESSION_SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+# gzip's default (9) is much slower for little gain on CSV logs
+GZIP_LEVEL = 6
+
+
+def _require_zstd():
+    if not HAS_ZSTD:
+        raise ImportError("zstd compression needs zstandard - install it with: pip install zstandard")
+
+
+def open_log_file(path):
+    """Text file to write a CSV log to - gzip for .gz, zstd for .zst, plain otherwise"""
+    if path.endswith(".gz"):
+        return gzip.open(path, 'wt', newline='', compresslevel=GZIP_LEVEL)
+    if path.endswith(".zst"):
+        _require_zstd()
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(path, 'wb')), newline='')
+    return open(path, 'w', newline='')
+
+
+def is_compressed(path):
+    return path.endswith(".gz") or path.endswith(".zst")
+
+
+def _decompressed(raw, name, stack):
+    """Binary stream reading raw, decompressed according to name's suffix"""
+    if name.endswith(".gz"):
+        return stack.enter_context(gzip.GzipFile(fileobj=raw, mode='rb'))
+    if name.endswith(".zst"):
+        _require_zstd()
+        return stack.enter_context(zstandard.ZstdDecompressor().stream_reader(raw))
+    return raw
+
+
+class _Results:
+    """What both kinds of results location share - subclasses provide _exists and _open_raw"""
+
+    def find(self, name):
+        """name, name.gz or name.zst - whichever exists (None if none do)"""
+        for suffix in COMPRESSION_SUFFIXES.values():
+            if self._exists(name + suffix):
+                return name + suffix
+        return None
+
+    @contextmanager
+    def open(self, name):
+        """Read a file as bytes, decompressing .gz/.zst on the fly"""
+        with ExitStack() as stack:
+            raw = stack.enter_context(self._open_raw(name))
+            yield _decompressed(raw, name, stack)
+
+    @contextmanager
+    def open_text(self, name):
+        """Read a file as text (for csv), decompressing .gz/.zst on the fly"""
+        with self.open(name) as f:
+            yield io.TextIOWrapper(f, encoding='utf-8', newline='')
+
+    def read_bytes(self, name):
+        with self.open(name) as f:
+            return f.read()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class ResultsDir(_Results):
+    """Results in a plain directory"""
+    def __init__(self, path):
+        self.path = path
+        # Where analysis output goes
+        self.output_dir = path
+
+    def __str__(self):
+        return self.path
+
+    def exists(self, name=""):
+        return os.path.exists(os.path.join(self.path, name))
+
+    _exists = exists
+
+    def _open_raw(self, name):
+        return open(os.path.join(self.path, name), 'rb')
+
+    def local_path(self, name):
+        """Path of an uncompressed file (it can be memory-mapped), else None"""
+        return None if is_compressed(name) else os.path.join(self.path, name)
+
+    def stat(self, name):
+        """(size in bytes, modification time in ns) of a file as stored"""
+        st = os.stat(os.path.join(self.path, name))
+        return st.st_size, st.st_mtime_ns
+
+    def content_hash(self, name):
+        """SHA-256 of a file as stored"""
+        digest = hashlib.sha256()
+        with self._open_raw(name) as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def subdir(self, name):
+        return ResultsDir(os.path.join(self.path, name))
+
+
+class ResultsZip(_Results):
+    """
+    Results inside a zip archive
+
+    zip_path: The .zip file
+    prefix: Directory inside the archive ("" = the top)
+
+    Member names written on Windows use backslashes; both kinds of
+    separator work here.
+    """
+    def __init__(self, zip_path, prefix="", archive=None, members=None):
+        self.zip_path = zip_path
+        self.prefix = prefix.replace("\\", "/").strip("/")
+        self.archive = archive if archive is not None else zipfile.ZipFile(zip_path)
+        if members is None:
+            members = {info.filename.replace("\\", "/"): info for info in self.archive.infolist()}
+        self.members = members
+        # Analysis output goes next to the archive, e.g. paper_results/results
+        self.output_dir = os.path.join(os.path.splitext(zip_path)[0], *self.prefix.split("/"))
+
+    def __str__(self):
+        return "/".join(part for part in (self.zip_path, self.prefix) if part)
+
+    def _key(self, name):
+        return "/".join(part for part in (self.prefix, name.replace("\\", "/")) if part)
+
+    def _exists(self, name):
+        return self._key(name) in self.members
+
+    def exists(self, name=""):
+        """True for a file, or a directory anything is stored under"""
+        key = self._key(name)
+        if key in self.members:
+            return True
+        directory = key + "/" if key else ""
+        return any(member.startswith(directory) for member in self.members)
+
+    def _open_raw(self, name):
+        return self.archive.open(self.members[self._key(name)])
+
+    def local_path(self, name):
+        return None
+
+    def stat(self, name):
+        """(size in bytes, modification time) of a member, from the archive directory"""
+        info = self.members[self._key(name)]
+        return info.file_size, list(info.date_time)
+
+    def content_hash(self, name):
+        """The member's CRC-32 from the archive directory - nothing is read"""
+        return "crc32:%08x" % self.members[self._key(name)].CRC
+
+    def subdir(self, name):
+        return ResultsZip(self.zip_path, self._key(name), self.archive, self.members)
+
+    def sweeps(self):
+        """Directories in the archive that hold a sweep (have sweep_metadata.csv)"""
+        suffix = "sweep_metadata.csv"
+        return sorted(member[:-len(suffix)].rstrip("/") for member in self.members
+                      if member == suffix or member.endswith("/" + suffix))
+
+    def close(self):
+        """Close the archive - subdir() results share it, so they're closed too"""
+        self.archive.close()
+
+
+def _split_zip(location):
+    """(zip file, path inside it) if location goes through a .zip file, else None"""
+    parts = os.path.normpath(location).split(os.sep)
+    for i in range(1, len(parts) + 1):
+        candidate = os.sep.join(parts[:i])
+        if candidate.lower().endswith(".zip") and os.path.isfile(candidate):
+            return candidate, "/".join(parts[i:])
+    return None
+
+
+def open_results(location):
+    """
+    ResultsDir or ResultsZip for a location (see the top of this file)
+
+    Close it when done (or use it in a with block) so an archive doesn't
+    stay open.
+
+    A bare archive that holds exactly one sweep opens that sweep; one
+    with several needs the directory, e.g. paper_results.zip/results.
+    """
+    if os.path.isdir(location):
+        return ResultsDir(location)
+    split = _split_zip(location)
+    if split is None:
+        return ResultsDir(location)
+
+    zip_path, prefix = split
+    results = ResultsZip(zip_path, prefix)
+    if not prefix and not results.exists("sweep_metadata.csv"):
+        sweeps = results.sweeps()
+        if len(sweeps) == 1:
+            results = results.subdir(sweeps[0])
+        elif sweeps:
+            choices = ", ".join(os.path.join(zip_path, sweep) for sweep in sweeps)
+            results.close()
+            raise ValueError(f"{zip_path} holds several sweeps, pick one: {choices}")
+    return results
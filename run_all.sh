@@ -6,6 +6,9 @@ echo "Full Reproducibility Pipeline"
 echo "=========================================="
 echo ""
 
+# Processes for analysis (e.g. WORKERS=8 ./run_all.sh)
+WORKERS=${WORKERS:-1}
+
 # Run sweep
 echo "Step 1: Running parameter sweep..."
 python3 sweep.py
@@ -17,7 +20,7 @@ echo ""
 
 # Analyze
 echo "Step 2: Analyzing results..."
-python3 analyze_sweep.py results
+python3 analyze_sweep.py results --workers "$WORKERS"
 if [ $? -ne 0 ]; then
     echo "Error analyzing results"
     exit 1
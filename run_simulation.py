@@ -5,11 +5,21 @@ This simulates attackers and users trying to login over time.
 We use an "event queue" which is just a list of things that will happen,
 sorted by when they happen.
 """
-import heapq
-import csv
+from log_sink import CsvLogSink, DEFAULT_FLUSH_EVERY
+from event_log import EventLogSink
+from scheduler import get_scheduler
+from checkpoint import save_checkpoint, load_checkpoint
 
 
-def run_simulation(auth_service, clock, actors, duration, detail_log):
+DETAIL_LOG_HEADER = ['timestamp', 'actor_name', 'actor_type', 'username', 'ip', 'result', 'reason']
+
+# AuthService.login reasons that mean the defense blocked the attempt
+BLOCK_REASONS = ('locked', 'rate_limited', 'backoff')
+
+
+def run_simulation(auth_service, clock, actors, duration, detail_log, log_flush_every=DEFAULT_FLUSH_EVERY,
+                   metrics=None, fast_forward_blocked=False, record_skipped=True, batch_logins=True,
+                   scheduler="heap", checkpoint_every=None, checkpoint_path=None, checkpoint_tag=None):
     """
     Run the simulation for a certain amount of time
     
@@ -17,28 +27,187 @@ def run_simulation(auth_service, clock, actors, duration, detail_log):
     clock: Time tracker
     actors: List of attackers and users
     duration: How long to simulate (in seconds)
-    detail_log: Where to write detailed logs
+    detail_log: Where to write detailed logs (None = don't write one) - a
+                .csv file, or a .npy file for the binary event log (see
+                event_log.py)
+    log_flush_every: How many detail rows to buffer before writing them out
+    metrics: Optional TrialMetrics that gets every event as it happens
+    fast_forward_blocked: When an attacker is blocked, skip straight past
+                          the attempts the defense would block anyway
+                          (see _skip_blocked_attempts)
+    record_skipped: Count skipped attempts in metrics as blocked attempts,
+                    so the metrics come out the same as without skipping
+    batch_logins: Send attempts that happen at the same time to
+                  auth_service.login_batch together (same results as one
+                  at a time, fewer database round trips)
+    scheduler: Event queue - "heap", "calendar" (see scheduler.py) or a
+               scheduler object. All of them give the same event order.
+    checkpoint_every: Save the whole simulation to checkpoint_path every
+                      this many simulated seconds (None = never). See
+                      resume_simulation and checkpoint.py.
+    checkpoint_path: Where to save checkpoints (each replaces the last)
+    checkpoint_tag: Saved with each checkpoint to say which run it is
+                    (see checkpoint.checkpoint_tag)
+    
+    The detail log (and the auth service's log) are flushed and closed
+    when the simulation ends, even if it stops with an exception.
+    """
+    sink = None
+    try:
+        if detail_log:
+            sink_class = EventLogSink if detail_log.endswith(".npy") else CsvLogSink
+            sink = sink_class(detail_log, DETAIL_LOG_HEADER, flush_every=log_flush_every)
+        if isinstance(scheduler, str):
+            scheduler = get_scheduler(scheduler)
+        if checkpoint_every and not checkpoint_path:
+            raise ValueError("checkpoint_every needs a checkpoint_path")
+        return _run_events(auth_service, clock, actors, duration, sink, metrics,
+                           fast_forward_blocked, record_skipped, batch_logins, scheduler,
+                           checkpoint_every, checkpoint_path, checkpoint_tag)
+    finally:
+        if sink:
+            sink.close()
+        auth_service.close()
+
+
+def resume_simulation(checkpoint):
     """
-    # Set up detailed log file
-    with open(detail_log, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(['timestamp', 'actor_name', 'actor_type', 'username', 'ip', 'result', 'reason'])
+    Carry on a run_simulation from its last checkpoint
     
-    # Event queue: list of (time, actor_index, actor_type)
-    # We use a heap so the next event is always first
-    events = []
+    checkpoint: Path of the checkpoint file, or the dict load_checkpoint
+                returned for it
     
-    # Schedule first event for each actor
-    for i, (actor, actor_type) in enumerate(actors):
-        next_time = actor.next_attempt_time(clock.now())
-        if next_time is not None:
-            heapq.heappush(events, (next_time, i, actor_type))
+    The logs are cut back to where they were at the checkpoint and
+    continue from there, so they come out byte for byte the same as a
+    run that was never interrupted. Checkpoints keep being saved to the
+    same path. Returns the total number of events, like run_simulation.
+    """
+    if isinstance(checkpoint, str):
+        checkpoint = load_checkpoint(checkpoint)
+    auth_service = checkpoint['auth_service']
+    sink = checkpoint['sink']
+    try:
+        return _run_events(auth_service, checkpoint['clock'], checkpoint['actors'], checkpoint['duration'],
+                           sink, checkpoint['metrics'], checkpoint['fast_forward_blocked'],
+                           checkpoint['record_skipped'], checkpoint['batch_logins'], checkpoint['events'],
+                           checkpoint['checkpoint_every'], checkpoint['checkpoint_path'], checkpoint['tag'],
+                           checkpoint)
+    finally:
+        if sink:
+            sink.close()
+        auth_service.close()
+
+
+def _record_blocked(actor):
+    """Tell an actor its attempt was blocked"""
+    if hasattr(actor, 'times_blocked'):  # It's a user
+        actor.record_result(success=False, blocked=True)
+    else:  # It's an attacker
+        actor.record_result(success=False)
+
+
+def record_outcome(actor, result):
+    """
+    Tell an actor how its login went
+    
+    result: The dict returned by AuthService.login
+    
+    Returns (outcome, reason) as written to the detail log - outcome is
+    'success', 'blocked' or 'failed'.
+    """
+    if result['success']:
+        actor.record_result(success=True, blocked=False)
+        return 'success', ''
+    elif result['reason'] in BLOCK_REASONS:
+        if hasattr(actor, 'record_result'):
+            _record_blocked(actor)
+        return 'blocked', result['reason']
+    else:
+        actor.record_result(success=False, blocked=False)
+        return 'failed', result['reason']
+
+
+def _skip_blocked_attempts(auth_service, actor, current_time, duration):
+    """
+    Fast-forward an attacker past attempts that would just be blocked
+    
+    Walks the attacker's own schedule from current_time. Each attempt
+    whose time is before the defense's blocked_until for its credentials
+    is recorded as blocked without calling the defense or writing logs;
+    those checks would not have changed any defense state. Attackers pick
+    credentials without randomness, so peeking at them is safe.
+    
+    Returns (next_time, skipped) - the first attempt that has to really
+    happen (or None), and how many attempts were skipped.
+    """
+    skipped = 0
+    next_time = actor.next_attempt_time(current_time)
+    
+    while next_time is not None and next_time <= duration:
+        username, password, ip = actor.get_credentials()
+        lift_time = auth_service.blocked_until(username, ip)
+        if lift_time is None or next_time >= lift_time:
+            break
+        
+        _record_blocked(actor)
+        skipped += 1
+        next_time = actor.next_attempt_time(next_time)
+    
+    return next_time, skipped
+
+
+def _run_events(auth_service, clock, actors, duration, sink, metrics, fast_forward_blocked, record_skipped,
+                batch_logins, events, checkpoint_every=None, checkpoint_path=None, checkpoint_tag=None,
+                resume=None):
+    """
+    The event loop itself - reports each login attempt to the sink and metrics
+    
+    resume: A loaded checkpoint to carry on from, instead of starting
+            every actor off
+    """
+    # Event queue of (time, actor_index, actor_type) - the scheduler
+    # always hands back the earliest one next
+    push = events.push
+    pop = events.pop
+    
+    if resume is None:
+        # Schedule first event for each actor
+        for i, (actor, actor_type) in enumerate(actors):
+            next_time = actor.next_attempt_time(clock.now())
+            if next_time is not None:
+                push((next_time, i, actor_type))
+        
+        # Credentials already fetched for events that were put back on the
+        # queue when a batch was cut short (actor_index -> credentials)
+        pending_credentials = {}
+        event_count = 0
+        skipped_count = 0
+        next_checkpoint = checkpoint_every
+    else:
+        pending_credentials = resume['pending_credentials']
+        event_count = resume['event_count']
+        skipped_count = resume['skipped_count']
+        next_checkpoint = resume['next_checkpoint']
     
     # Process events until we run out or hit time limit
-    event_count = 0
     while events:
+        # Save a checkpoint before the first event of each new interval
+        if next_checkpoint is not None and events.peek_time() >= next_checkpoint:
+            next_time = events.peek_time()
+            next_checkpoint = (next_time // checkpoint_every + 1) * checkpoint_every
+            if next_time <= duration:
+                save_checkpoint(checkpoint_path, {
+                    'auth_service': auth_service, 'clock': clock, 'actors': actors, 'duration': duration,
+                    'sink': sink, 'metrics': metrics, 'fast_forward_blocked': fast_forward_blocked,
+                    'record_skipped': record_skipped, 'batch_logins': batch_logins, 'events': events,
+                    'checkpoint_every': checkpoint_every, 'checkpoint_path': checkpoint_path,
+                    'pending_credentials': pending_credentials, 'event_count': event_count,
+                    'skipped_count': skipped_count, 'next_checkpoint': next_checkpoint,
+                }, checkpoint_tag)
+                print(f"  Checkpoint saved at {next_time:.0f}s")
+        
         # Get next event
-        event_time, actor_index, actor_type = heapq.heappop(events)
+        event_time, actor_index, actor_type = pop()
         
         # Check if we're past the time limit
         if event_time > duration:
@@ -47,54 +216,94 @@ def run_simulation(auth_service, clock, actors, duration, detail_log):
         # Move time forward
         clock.current_time = event_time
         
-        # Get the actor
-        actor, _ = actors[actor_index]
+        # Everything else happening at this exact time goes in the same batch
+        batch = [(actor_index, actor_type)]
+        if batch_logins:
+            while events and events.peek_time() == event_time:
+                _, other_index, other_type = pop()
+                batch.append((other_index, other_type))
         
         # Get their login credentials
-        username, password, ip = actor.get_credentials()
+        credentials = []
+        for i, _ in batch:
+            attempt = pending_credentials.pop(i, None) if pending_credentials else None
+            credentials.append(attempt or actors[i][0].get_credentials())
         
         # Try to login
-        result = auth_service.login(username, password, ip)
-        
-        # Figure out what happened
-        if result['success']:
-            outcome = 'success'
-            reason = ''
-            actor.record_result(success=True, blocked=False)
-        elif result['reason'] in ['locked', 'rate_limited', 'backoff']:
-            outcome = 'blocked'
-            reason = result['reason']
-            if hasattr(actor, 'record_result'):
-                if hasattr(actor, 'times_blocked'):  # It's a user
-                    actor.record_result(success=False, blocked=True)
-                else:  # It's an attacker
-                    actor.record_result(success=False)
+        if len(batch) == 1:
+            results = (auth_service.login(*credentials[0]),)
         else:
-            outcome = 'failed'
-            reason = result['reason']
-            actor.record_result(success=False, blocked=False)
-        
-        # Write to detailed log
-        with open(detail_log, 'a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                clock.now(),
-                actor.name,
-                actor_type,
-                username,
-                ip,
-                outcome,
-                reason
-            ])
+            results = auth_service.iter_login_batch(credentials)
         
-        # Schedule next event for this actor
-        next_time = actor.next_attempt_time(clock.now())
-        if next_time is not None and next_time <= duration:
-            heapq.heappush(events, (next_time, actor_index, actor_type))
+        done = 0
+        try:
+            for (actor_index, actor_type), (username, _, ip), result in zip(batch, credentials, results):
+                done += 1
+                actor, _ = actors[actor_index]
+                skipped, next_time = _handle_result(auth_service, clock, actor, actor_type, username, ip,
+                                                    result, duration, sink, metrics, fast_forward_blocked,
+                                                    record_skipped)
+                skipped_count += skipped
+                
+                # Schedule next event for this actor
+                if next_time is not None and next_time <= duration:
+                    push((next_time, actor_index, actor_type))
+                
+                event_count += 1
+                if event_count % 500 == 0:
+                    print(f"  Processed {event_count} events (time: {clock.now():.0f}s)")
+                
+                # An actor going again right away (e.g. a user retrying) has
+                # to log in before the rest of the batch, as it would one
+                # event at a time - put the rest back on the queue
+                if next_time == event_time and done < len(batch):
+                    break
+        finally:
+            if len(batch) > 1:
+                results.close()
         
-        event_count += 1
-        if event_count % 500 == 0:
-            print(f"  Processed {event_count} events (time: {clock.now():.0f}s)")
+        for (actor_index, actor_type), attempt in zip(batch[done:], credentials[done:]):
+            pending_credentials[actor_index] = attempt
+            push((event_time, actor_index, actor_type))
     
-    print(f"Simulation complete: {event_count} total events")
+    if skipped_count:
+        print(f"Simulation complete: {event_count} total events ({skipped_count} blocked attempts skipped)")
+    else:
+        print(f"Simulation complete: {event_count} total events")
     return event_count
+
+
+def _handle_result(auth_service, clock, actor, actor_type, username, ip, result, duration, sink, metrics,
+                   fast_forward_blocked, record_skipped):
+    """
+    Tell the actor how its attempt went and report it
+    
+    Returns (skipped, next_time) - how many blocked attempts were
+    fast-forwarded and when the actor wants to go next.
+    """
+    # Figure out what happened
+    outcome, reason = record_outcome(actor, result)
+    
+    # Write to detailed log
+    if sink:
+        sink.write([
+            clock.now(),
+            actor.name,
+            actor_type,
+            username,
+            ip,
+            outcome,
+            reason
+        ])
+    
+    if metrics:
+        metrics.add(clock.now(), actor.name, actor_type, username, outcome)
+    
+    skipped = 0
+    if fast_forward_blocked and outcome == 'blocked' and actor_type == 'attacker':
+        next_time, skipped = _skip_blocked_attempts(auth_service, actor, clock.now(), duration)
+        if skipped and metrics and record_skipped:
+            metrics.add(clock.now(), actor.name, actor_type, username, 'blocked', count=skipped)
+    else:
+        next_time = actor.next_attempt_time(clock.now())
+    return skipped, next_time
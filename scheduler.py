@@ -0,0 +1,154 @@
+"""
+scheduler.py - Event queues for run_simulation
+
+The simulation keeps every actor's next attempt as a
+(time, actor_index, actor_type) tuple and always handles the smallest
+one next, so ties on time go to the lower actor index. Two queues give
+exactly that order:
+
+- HeapScheduler: heapq, O(log n) per push/pop. The default.
+- CalendarQueue: R. Brown's calendar queue, O(1) amortized when events
+  are spread evenly in time (e.g. many actors on fixed intervals).
+
+Both have push(event), pop(), peek_time() and len().
+"""
+import heapq
+from bisect import insort
+from functools import partial
+
+
+SCHEDULERS = ["heap", "calendar"]
+
+
+class HeapScheduler:
+    """Binary heap of event tuples"""
+    def __init__(self):
+        self.events = []
+        # heapq's C functions bound to our list - no Python call per event
+        self.push = partial(heapq.heappush, self.events)
+        self.pop = partial(heapq.heappop, self.events)
+
+    def peek_time(self):
+        """Time of the next event (the queue must not be empty)"""
+        return self.events[0][0]
+
+    def __len__(self):
+        return len(self.events)
+
+
+class CalendarQueue:
+    """
+    Calendar queue of event tuples
+
+    Time is cut into slots of bucket_width seconds, and slot k lives in
+    bucket k % num_buckets like days on a calendar. Each bucket is a
+    sorted list, so popping means walking forward from the current slot
+    until a bucket's first event falls in the slot being looked at.
+    Buckets double or halve as the queue grows or shrinks, and the
+    width is re-estimated from the gaps between the next few events.
+
+    Slots are always computed as int(time / bucket_width), the same way
+    on push and pop, so float rounding can't put an event in the wrong
+    year and change the order.
+    """
+    MIN_BUCKETS = 2
+    # How many upcoming events to sample when picking a new width
+    WIDTH_SAMPLE = 25
+
+    def __init__(self, bucket_width=1.0, num_buckets=MIN_BUCKETS):
+        self.size = 0
+        self._setup(max(self.MIN_BUCKETS, num_buckets), bucket_width, [])
+        self.resizes = 0
+
+    def _setup(self, num_buckets, bucket_width, events):
+        self.num_buckets = num_buckets
+        self.bucket_width = bucket_width
+        self.buckets = [[] for _ in range(num_buckets)]
+        # Slot the search starts from; no event is in an earlier slot
+        self.current_slot = 0
+        self.grow_at = 2 * num_buckets
+        self.shrink_at = num_buckets // 2 - 2
+
+        for event in events:
+            self._insert(event)
+        if events:
+            self.current_slot = int(min(events)[0] / bucket_width)
+
+    def _insert(self, event):
+        slot = int(event[0] / self.bucket_width)
+        insort(self.buckets[slot % self.num_buckets], event)
+        return slot
+
+    def push(self, event):
+        slot = self._insert(event)
+        if slot < self.current_slot:
+            self.current_slot = slot
+        self.size += 1
+        if self.size > self.grow_at:
+            self._resize(2 * self.num_buckets)
+
+    def _find(self):
+        """Index of the bucket holding the next event"""
+        width = self.bucket_width
+        num_buckets = self.num_buckets
+        buckets = self.buckets
+        slot = self.current_slot
+
+        # Walk one year of days from the current slot
+        for _ in range(num_buckets):
+            bucket = buckets[slot % num_buckets]
+            if bucket and int(bucket[0][0] / width) <= slot:
+                self.current_slot = slot
+                return slot % num_buckets
+            slot += 1
+
+        # Nothing this year - jump straight to the earliest event
+        first = min(bucket[0] for bucket in buckets if bucket)
+        slot = int(first[0] / width)
+        self.current_slot = slot
+        return slot % num_buckets
+
+    def pop(self):
+        if not self.size:
+            raise IndexError("pop from an empty CalendarQueue")
+        event = self.buckets[self._find()].pop(0)
+        self.size -= 1
+        if self.size < self.shrink_at:
+            self._resize(self.num_buckets // 2)
+        return event
+
+    def peek_time(self):
+        """Time of the next event (the queue must not be empty)"""
+        return self.buckets[self._find()][0][0]
+
+    def __len__(self):
+        return self.size
+
+    def _resize(self, num_buckets):
+        """Rebuild with num_buckets buckets and a width fitted to the next events"""
+        num_buckets = max(self.MIN_BUCKETS, num_buckets)
+        events = [event for bucket in self.buckets for event in bucket]
+        events.sort()
+
+        # Average gap between the next few distinct times, times three
+        # (Brown's rule of thumb: about three events per bucket)
+        sample = events[:self.WIDTH_SAMPLE]
+        gaps = [b[0] - a[0] for a, b in zip(sample, sample[1:]) if b[0] > a[0]]
+        width = 3 * sum(gaps) / len(gaps) if gaps else self.bucket_width
+
+        self._setup(num_buckets, width, events)
+        self.resizes += 1
+
+
+def get_scheduler(name="heap"):
+    """
+    Pick an event queue for run_simulation
+
+    name: "heap" (HeapScheduler) or "calendar" (CalendarQueue)
+    """
+    if name == "heap":
+        return HeapScheduler()
+    elif name == "calendar":
+        return CalendarQueue()
+    else:
+        raise ValueError(f"Unknown scheduler: {name}")
@@ -3,45 +3,227 @@ sweep.py - Run parameter sweeps across different defense configurations
 """
 import os
 import sys
+import json
 import random
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 from clock import Clock
-from database import Database
-from defenses import get_defense
+from database import get_database
+from defenses import get_defense_policy
 from auth_service import AuthService
 from actors import create_attackers, create_users
-from run_simulation import run_simulation
+from run_simulation import run_simulation, resume_simulation
+from checkpoint import load_checkpoint, checkpoint_tag
+from trial_cache import TrialCache, code_version, trial_key
+from metrics import TrialMetrics
+from passwords import HASHERS
+from population import UserPopulation
+from scheduler import SCHEDULERS
+from results_io import COMPRESSIONS, COMPRESSION_SUFFIXES, HAS_ZSTD
 import csv
 
 
-def run_one_trial(defense_name, config, trial_number, output_dir, duration=86400, attacker_model="baseline"):
-    """Run one trial with specific defense config"""
+LOG_LEVELS = ["full", "summary", "none"]
+
+# detail_log.csv, or detail_log.npy (binary, see event_log.py)
+LOG_FORMATS = ["csv", "npy"]
+
+USER_MODELS = ["objects", "population"]
+
+# Written in the trial directory while a checkpointed trial runs
+CHECKPOINT_FILE = "checkpoint.pkl"
+
+# Logs a trial can write, each possibly with a compression suffix
+LOG_FILES = ["auth_log.csv", "detail_log.csv", "detail_log.npy"]
+
+
+def run_one_trial(defense_name, config, trial_number, output_dir, duration=86400, attacker_model="baseline",
+                  backend="sqlite", db_options=None, log_level="full", fast_forward_blocked=False,
+                  num_users=50, user_model="objects", scheduler="heap", checkpoint_every=None,
+                  log_format="csv", compression="none"):
+    """
+    Run one trial with specific defense config
+    
+    backend: Storage for accounts and login state - "sqlite" or "memory"
+             (both produce identical logs, "memory" is faster)
+    db_options: Extra settings for the database, e.g.
+                {'path': 'trial.db', 'commit_every': 500} (sqlite) or
+                {'hasher': 'pbkdf2'} (either backend)
+    log_level: What to write to the trial directory
+               - "full": auth_log.csv and detail_log.csv (one row per attempt)
+               - "summary": only metrics.json, collected while the trial runs
+               - "none": nothing at all
+               Both "full" and "summary" also write hashing.json with the
+               CPU seconds spent hashing passwords.
+    fast_forward_blocked: Skip attacker attempts the defense would block
+                          anyway. They don't appear in the CSV logs, but
+                          metrics.json still counts them.
+    num_users: How many normal users to simulate
+    user_model: "objects" (one NormalUser each) or "population" (one
+                UserPopulation holding every user in NumPy arrays - for
+                very large num_users; statistically the same, not the
+                same random draws)
+    scheduler: Event queue for the simulation - "heap" or "calendar"
+               (same output, see scheduler.py)
+    checkpoint_every: Save the trial to trial_N/checkpoint.pkl every this
+                      many simulated seconds. If that file is already
+                      there (the trial was interrupted), the trial resumes
+                      from it instead of starting over - unless it was
+                      saved by a trial with other settings or older code,
+                      then it's deleted. The file is removed once the
+                      trial finishes.
+    log_format: "csv" (detail_log.csv) or "npy" (detail_log.npy, a binary
+                log analyze_sweep reads much faster - see event_log.py).
+                auth_log.csv is CSV either way. Logs an earlier run of
+                the trial wrote in another format or at another
+                log_level are deleted first.
+    compression: "none", "gzip" or "zstd" (needs zstandard) - write the
+                 CSV logs compressed, e.g. detail_log.csv.gz. analyze_sweep
+                 reads them as they are. Can't be used with checkpoints.
+    """
+    if log_level not in LOG_LEVELS:
+        raise ValueError(f"Unknown log level: {log_level}")
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format: {log_format}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    if compression == "zstd" and not HAS_ZSTD:
+        raise ImportError("zstd compression needs zstandard - install it with: pip install zstandard")
+    if compression != "none" and checkpoint_every:
+        raise ValueError("Compressed logs can't be checkpointed - use compression='none'")
+    if user_model not in USER_MODELS:
+        raise ValueError(f"Unknown user model: {user_model}")
+    
+    trial_dir = os.path.join(output_dir, f"trial_{trial_number}")
+    checkpoint_path = None
+    if checkpoint_every:
+        os.makedirs(trial_dir, exist_ok=True)
+        checkpoint_path = os.path.join(trial_dir, CHECKPOINT_FILE)
+    
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        # Trial ids are positions in the sweep, so the checkpoint may be another trial's
+        key = _trial_key(defense_name, config, trial_number, duration, attacker_model, backend, db_options,
+                         log_level, fast_forward_blocked, num_users, user_model, log_format, compression)
+        if checkpoint_tag(checkpoint_path) != key:
+            print(f"  {checkpoint_path} is from a different trial, starting over")
+            os.remove(checkpoint_path)
+    
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        # Pick up an interrupted trial where its last checkpoint left off
+        checkpoint = load_checkpoint(checkpoint_path)
+        database = checkpoint['auth_service'].database
+        metrics = checkpoint['metrics']
+        try:
+            resume_simulation(checkpoint)
+        finally:
+            database.flush()
+    else:
+        _remove_stale_outputs(trial_dir, log_level, log_format, compression)
+        database, metrics = _start_trial(defense_name, config, trial_number, trial_dir, duration, attacker_model,
+                                         backend, db_options, log_level, fast_forward_blocked, num_users,
+                                         user_model, scheduler, checkpoint_every, checkpoint_path, log_format,
+                                         compression)
+    
+    if checkpoint_path:
+        os.remove(checkpoint_path)
+    
+    if metrics:
+        metrics.save(os.path.join(trial_dir, "metrics.json"))
+    if log_level != "none":
+        with open(os.path.join(trial_dir, "hashing.json"), 'w') as f:
+            json.dump(database.hashing_stats(), f, indent=2)
+    
+    return trial_dir
+
+
+def _trial_key(defense_name, config, trial_number, duration, attacker_model, backend, db_options, log_level,
+               fast_forward_blocked, num_users, user_model, log_format, compression, version=None):
+    """
+    trial_key for run_one_trial's arguments - identifies a trial in the
+    cache and in its checkpoints. The scheduler and checkpoints don't
+    change the output, so they aren't part of it.
+    """
+    return trial_key(defense_name, config, trial_number, duration, attacker_model, version,
+                     backend=backend, db_options=db_options, log_level=log_level,
+                     fast_forward_blocked=fast_forward_blocked, num_users=num_users, user_model=user_model,
+                     log_format=log_format, compression=compression)
+
+
+def _trial_outputs(log_level, log_format, compression):
+    """Names of the files run_one_trial writes in the trial directory"""
+    outputs = set()
+    if log_level == "full":
+        suffix = COMPRESSION_SUFFIXES[compression]
+        outputs.add("auth_log.csv" + suffix)
+        outputs.add("detail_log.npy" if log_format == "npy" else "detail_log.csv" + suffix)
+    elif log_level == "summary":
+        outputs.add("metrics.json")
+    if log_level != "none":
+        outputs.add("hashing.json")
+    return outputs
+
+
+def _remove_stale_outputs(trial_dir, log_level, log_format, compression):
+    """
+    Delete files an earlier run of this trial left that this run won't
+    overwrite - analyze_trial uses whatever logs it finds, so e.g. an old
+    detail_log.csv would be analyzed instead of a new run's metrics.json
+    """
+    keep = _trial_outputs(log_level, log_format, compression)
+    names = [name + suffix for name in LOG_FILES for suffix in COMPRESSION_SUFFIXES.values()]
+    for name in names + ["metrics.json", "hashing.json"]:
+        path = os.path.join(trial_dir, name)
+        if name not in keep and os.path.exists(path):
+            os.remove(path)
+
+
+def _start_trial(defense_name, config, trial_number, trial_dir, duration, attacker_model, backend, db_options,
+                 log_level, fast_forward_blocked, num_users, user_model, scheduler, checkpoint_every,
+                 checkpoint_path, log_format, compression):
+    """Set up a new trial and run its simulation - returns (database, metrics)"""
     # Set seed for reproducibility
     random.seed(trial_number)
     
     # Set up
     clock = Clock()
-    database = Database()
-    
-    # Add victim account
-    database.add_user("victim", "secret_password", clock.now())
+    database = get_database(backend, clock=clock, **(db_options or {}))
     
-    # Add normal users
-    users = create_users(num_users=50, shared_ip=True)
-    for user in users:
-        database.add_user(user.username, user.password, clock.now())
+    # Add victim account and normal users in one go
+    if user_model == "population":
+        population = UserPopulation(num_users, shared_ip=True, seed=trial_number)
+        users = [population]
+        accounts = itertools.chain([("victim", "secret_password", clock.now())],
+                                   population.accounts(clock.now()))
+    else:
+        users = create_users(num_users=num_users, shared_ip=True)
+        accounts = [("victim", "secret_password", clock.now())]
+        accounts += [(user.username, user.password, clock.now()) for user in users]
+    database.add_users(accounts)
     
     # Get defense with config
-    defense_check, defense_update = get_defense(defense_name, database, clock, config)
+    defense = get_defense_policy(defense_name, database, clock, config)
     
     # Create log files
-    trial_dir = os.path.join(output_dir, f"trial_{trial_number}")
-    os.makedirs(trial_dir, exist_ok=True)
+    auth_log = None
+    detail_log = None
+    metrics = None
     
-    auth_log = os.path.join(trial_dir, "auth_log.csv")
-    detail_log = os.path.join(trial_dir, "detail_log.csv")
+    if log_level != "none":
+        os.makedirs(trial_dir, exist_ok=True)
+    if log_level == "full":
+        # The binary log is compact already, so only CSV logs get compressed
+        suffix = COMPRESSION_SUFFIXES[compression]
+        auth_log = os.path.join(trial_dir, "auth_log.csv" + suffix)
+        if log_format == "npy":
+            detail_log = os.path.join(trial_dir, "detail_log.npy")
+        else:
+            detail_log = os.path.join(trial_dir, "detail_log.csv" + suffix)
+    elif log_level == "summary":
+        metrics = TrialMetrics()
     
     # Create auth service
-    auth_service = AuthService(database, clock, defense_check, defense_update, auth_log)
+    auth_service = AuthService(database, clock, log_file=auth_log, defense=defense)
     
     # Create attackers based on model
     if attacker_model == "cred_stuffing":
@@ -56,16 +238,61 @@ def run_one_trial(defense_name, config, trial_number, output_dir, duration=86400
     for user in users:
         actors.append((user, 'user'))
     
+    # Checkpoints say which trial they belong to, so another trial never resumes them
+    tag = None
+    if checkpoint_path:
+        tag = _trial_key(defense_name, config, trial_number, duration, attacker_model, backend, db_options,
+                         log_level, fast_forward_blocked, num_users, user_model, log_format, compression)
+    
     # Run simulation
-    run_simulation(auth_service, clock, actors, duration, detail_log)
+    try:
+        run_simulation(auth_service, clock, actors, duration, detail_log, metrics=metrics,
+                       fast_forward_blocked=fast_forward_blocked, scheduler=scheduler,
+                       checkpoint_every=checkpoint_every, checkpoint_path=checkpoint_path, checkpoint_tag=tag)
+    finally:
+        # Commit anything still batched so file-backed databases are complete
+        database.flush()
     
-    return trial_dir
+    return database, metrics
+
+
+class CredStuffingAttacker:
+    """
+    Attacker cycling through leaked (username, password) pairs, one per
+    second from a new IP each time (see create_attackers_cred_stuffing).
+    Module level so checkpoints can pickle it.
+    """
+    def __init__(self, credentials):
+        self.name = "cred_stuffer"
+        self.credentials = credentials
+        self.current = 0
+        self.succeeded = False
+        self.blocked_count = 0
+        self.guesses_per_second = 1.0
+    
+    def next_attempt_time(self, current_time):
+        if self.current >= len(self.credentials):
+            return None
+        return current_time + (1.0 / self.guesses_per_second)
+    
+    def get_credentials(self):
+        username, password = self.credentials[self.current]
+        # Return (username, password, ip) - use different IP for each attempt
+        ip = f"10.1.{self.current // 256}.{self.current % 256}"
+        return username, password, ip
+    
+    def record_result(self, success, blocked=False):
+        if blocked:
+            self.blocked_count += 1
+            return  # don't consume a credential attempt when blocked
+        
+        # Always move to the next credential pair.
+        # IMPORTANT: do NOT stop after a success, or you won't stress the defense.
+        self.current += 1
 
 
 def create_attackers_cred_stuffing(seed):
     """Create credential stuffing attackers (spread across many accounts)"""
-    from actors import Attacker
-    
     # Use seeded RNG for reproducibility
     rng = random.Random(seed)
     
@@ -92,46 +319,17 @@ def create_attackers_cred_stuffing(seed):
     credential_pairs.append(("victim", "secret_password"))  # Leaked correct one
     
     # Create one attacker cycling through all credential pairs
-    class CredStuffingAttacker:
-        def __init__(self):
-            self.name = "cred_stuffer"
-            self.credentials = credential_pairs
-            self.current = 0
-            self.succeeded = False
-            self.blocked_count = 0
-            self.guesses_per_second = 1.0
-        
-        def next_attempt_time(self, current_time):
-            if self.current >= len(self.credentials):
-                return None
-            return current_time + (1.0 / self.guesses_per_second)
+    return [CredStuffingAttacker(credential_pairs)]
 
 
-        
-        def get_credentials(self):
-            username, password = self.credentials[self.current]
-            # Return (username, password, ip) - use different IP for each attempt
-            ip = f"10.1.{self.current // 256}.{self.current % 256}"
-            return username, password, ip
-        
-        def record_result(self, success, blocked=False):
-            if blocked:
-                self.blocked_count += 1
-                return  # don't consume a credential attempt when blocked
-            
-            # Always move to the next credential pair.
-            # IMPORTANT: do NOT stop after a success, or you won't stress the defense.
-            self.current += 1
-
-
-    
-    return [CredStuffingAttacker()]
-
-
-def get_sweep_configs():
+def get_sweep_configs(include_compositions=False):
     """
     Define parameter values to sweep for each defense
     
+    include_compositions: Also sweep combined defenses. Any name that
+                          get_defense_policy accepts works here, including
+                          "a+b" combinations.
+    
     Returns dict: defense_name -> list of (param_name, param_value, config_dict)
     """
     configs = {}
@@ -166,10 +364,53 @@ def get_sweep_configs():
         ('tokens', '10_2.0', {'refill_rate': 2.0, 'max_tokens': 10}),
     ]
     
+    if include_compositions:
+        # IP rate limit in front of account lockout: sweep max_failures
+        configs['rate_limit_ip+lockout'] = [
+            ('max_failures', n, {'rate_limit_ip': {'refill_rate': 1.0, 'max_tokens': 5},
+                                 'lockout': {'max_failures': n, 'lockout_time': 300}})
+            for n in (3, 5, 10)
+        ]
+    
     return configs
 
 
-def run_sweep(output_base="results", seeds=3, duration=3600, attacker_model="baseline"):
+def _run_trial_job(job, cache_dir=None, version=None):
+    """
+    Run one job (a tuple of run_one_trial arguments), using the trial
+    cache if there is one. Top-level so the process pool can pickle it.
+    
+    Returns True if the trial came from the cache.
+    """
+    (defense_name, config, trial_number, output_dir, duration, attacker_model,
+     backend, db_options, log_level, fast_forward_blocked, num_users, user_model, scheduler,
+     checkpoint_every, log_format, compression) = job
+    
+    # With log_level "none" there are no files to cache
+    if cache_dir is None or log_level == "none":
+        run_one_trial(*job)
+        return False
+    
+    cache = TrialCache(cache_dir)
+    key = _trial_key(defense_name, config, trial_number, duration, attacker_model, backend, db_options,
+                     log_level, fast_forward_blocked, num_users, user_model, log_format, compression, version)
+    trial_dir = os.path.join(output_dir, f"trial_{trial_number}")
+    
+    # Clear out what an earlier run with other settings left before restoring
+    _remove_stale_outputs(trial_dir, log_level, log_format, compression)
+    if cache.restore(key, trial_dir):
+        return True
+    
+    run_one_trial(*job)
+    cache.store(key, trial_dir, spec=job)
+    return False
+
+
+def run_sweep(output_base="results", seeds=3, duration=3600, attacker_model="baseline", backend="sqlite",
+              workers=1, cache_dir=None, cache_max_age=None, cache_max_bytes=None, log_level="full",
+              fast_forward_blocked=False, include_compositions=False, db_options=None,
+              num_users=50, user_model="objects", scheduler="heap", checkpoint_every=None,
+              log_format="csv", compression="none"):
     """
     Run parameter sweep across all defenses
     
@@ -177,6 +418,26 @@ def run_sweep(output_base="results", seeds=3, duration=3600, attacker_model="bas
     seeds: Number of trials per configuration
     duration: Simulation duration (default 1 hour)
     attacker_model: "baseline" or "cred_stuffing"
+    backend: Database backend for each trial - "sqlite" or "memory"
+    workers: How many processes to run trials in (1 = run them in this process)
+    cache_dir: Reuse trials already run with the same inputs and code (None = off)
+    cache_max_age, cache_max_bytes: Eviction limits applied after the sweep
+    log_level: "full" (CSV logs), "summary" (metrics.json only) or "none"
+    fast_forward_blocked: Skip attacker attempts that would just be blocked
+                          (use with log_level="summary" to keep metrics exact)
+    include_compositions: Also sweep combined defenses (see get_sweep_configs)
+    db_options: Database settings for every trial (see run_one_trial)
+    num_users, user_model: Normal users per trial and how they're
+                           simulated (see run_one_trial)
+    scheduler: Event queue for every trial - "heap" or "calendar"
+    checkpoint_every: Checkpoint each trial every this many simulated
+                      seconds, so re-running an interrupted sweep resumes
+                      its unfinished trials (see run_one_trial)
+    log_format: "csv" or "npy" detail logs (see run_one_trial)
+    compression: "none", "gzip" or "zstd" for the CSV logs (see run_one_trial)
+    
+    Every trial builds its own clock, database and actors and is seeded by
+    its trial id, so running them in parallel gives the same output files.
     """
     # Check if running in CI - use minimal config
     if os.environ.get("CI"):
@@ -186,26 +447,23 @@ def run_sweep(output_base="results", seeds=3, duration=3600, attacker_model="bas
     
     os.makedirs(output_base, exist_ok=True)
     
-    sweep_configs = get_sweep_configs()
+    sweep_configs = get_sweep_configs(include_compositions)
     
     # In CI mode, only test one defense with one param
     if os.environ.get("CI"):
         sweep_configs = {'lockout': sweep_configs['lockout'][:1]}
     
+    # First work out every trial, in order
     all_results = []
+    jobs = []
     trial_id = 0
     
     for defense_name, param_configs in sweep_configs.items():
-        print(f"\nDefense: {defense_name}")
-        
         for param_name, param_value, config in param_configs:
-            print(f"  Parameter: {param_name}={param_value}")
-            
             for seed in range(seeds):
-                print(f"    Seed {seed}...")
-                
-                trial_dir = os.path.join(output_base, f"trial_{trial_id}")
-                run_one_trial(defense_name, config, trial_id, output_base, duration, attacker_model)
+                jobs.append((defense_name, config, trial_id, output_base, duration, attacker_model, backend,
+                             db_options, log_level, fast_forward_blocked, num_users, user_model, scheduler,
+                             checkpoint_every, log_format, compression))
                 
                 # Record metadata
                 all_results.append({
@@ -220,6 +478,32 @@ def run_sweep(output_base="results", seeds=3, duration=3600, attacker_model="bas
                 
                 trial_id += 1
     
+    # Then run them
+    version = code_version() if cache_dir else None
+    cache_args = [cache_dir] * len(jobs), [version] * len(jobs)
+    cache_hits = 0
+    
+    if workers > 1:
+        print(f"\nRunning {len(jobs)} trials on {workers} workers")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map() hands results back in submission order
+            for meta, cached in zip(all_results, executor.map(_run_trial_job, jobs, *cache_args)):
+                cache_hits += cached
+                print(f"  Finished trial_{meta['trial_id']}: {meta['defense']} "
+                      f"{meta['param_name']}={meta['param_value']} seed {meta['seed']}"
+                      f"{' (cached)' if cached else ''}")
+    else:
+        for meta, job in zip(all_results, jobs):
+            print(f"\nTrial {meta['trial_id']}: {meta['defense']} "
+                  f"{meta['param_name']}={meta['param_value']} seed {meta['seed']}")
+            if _run_trial_job(job, cache_dir, version):
+                cache_hits += 1
+                print("  (cached)")
+    
+    if cache_dir:
+        removed = TrialCache(cache_dir, cache_max_age, cache_max_bytes).evict()
+        print(f"\nTrial cache: {cache_hits} hits, {len(jobs) - cache_hits} misses, {removed} evicted")
+    
     # Save metadata
     metadata_file = os.path.join(output_base, "sweep_metadata.csv")
     with open(metadata_file, 'w', newline='') as f:
@@ -234,5 +518,46 @@ def run_sweep(output_base="results", seeds=3, duration=3600, attacker_model="bas
 
 
 if __name__ == "__main__":
-    run_sweep(output_base="results", attacker_model="baseline", duration=7200)
-    run_sweep(output_base="results_credstuff", attacker_model="cred_stuffing", duration=7200)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the baseline and credential-stuffing sweeps")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes to run trials in (default 1)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Reuse unchanged trials from this cache directory")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default="full",
+                        help="full = per-event CSV logs, summary = metrics.json only")
+    parser.add_argument("--fast-forward-blocked", action="store_true",
+                        help="Skip attacker attempts that would just be blocked")
+    parser.add_argument("--compositions", action="store_true",
+                        help="Also sweep combined defenses like rate_limit_ip+lockout")
+    parser.add_argument("--hasher", choices=HASHERS, default="sha256",
+                        help="Password hashing for every trial (pbkdf2/scrypt are realistically slow)")
+    parser.add_argument("--password-cache-size", type=int, default=None,
+                        help="Password verdicts to cache (default 4096 with sha256, off with pbkdf2/scrypt)")
+    parser.add_argument("--users", type=int, default=50, help="Normal users per trial")
+    parser.add_argument("--user-model", choices=USER_MODELS, default="objects",
+                        help="population = all users in NumPy arrays (for large --users)")
+    parser.add_argument("--scheduler", choices=SCHEDULERS, default="heap",
+                        help="Event queue (same results, calendar can be faster with many actors)")
+    parser.add_argument("--checkpoint-every", type=float, default=None,
+                        help="Checkpoint trials every this many simulated seconds (re-run to resume)")
+    parser.add_argument("--log-format", choices=LOG_FORMATS, default="csv",
+                        help="npy = binary detail logs, smaller and faster to analyze")
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="none",
+                        help="Write CSV logs gzip or zstd compressed")
+    args = parser.parse_args()
+    
+    db_options = {}
+    if args.hasher != "sha256":
+        db_options['hasher'] = args.hasher
+    if args.password_cache_size is not None:
+        db_options['password_cache_size'] = args.password_cache_size
+    
+    options = dict(workers=args.workers, cache_dir=args.cache_dir, log_level=args.log_level,
+                   fast_forward_blocked=args.fast_forward_blocked,
+                   include_compositions=args.compositions,
+                   db_options=db_options or None,
+                   num_users=args.users, user_model=args.user_model, scheduler=args.scheduler,
+                   checkpoint_every=args.checkpoint_every, log_format=args.log_format,
+                   compression=args.compression)
+    run_sweep(output_base="results", attacker_model="baseline", duration=7200, **options)
+    run_sweep(output_base="results_credstuff", attacker_model="cred_stuffing", duration=7200, **options)
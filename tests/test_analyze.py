@@ -0,0 +1,192 @@
+"""
+test_analyze.py - Tests for trial analysis
+"""
+import sys
+import os
+import csv
+import filecmp
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analyze_sweep import analyze_events, analyze_trial, analyze_sweep
+from analysis_index import AnalysisIndex, INDEX_FILE
+from results_io import open_results
+from sweep import run_one_trial
+
+
+HEADER = ['timestamp', 'actor_name', 'actor_type', 'username', 'ip', 'result', 'reason']
+
+EVENTS = [
+    [0.5, 'brute_force', 'attacker', 'victim', '10.0.0.1', 'failed', 'bad_password'],
+    [1.0, 'normal_user_0', 'user', 'user0', '192.168.1.100', 'blocked', 'locked'],
+    [1.5, 'brute_force', 'attacker', 'victim', '10.0.0.1', 'success', ''],
+    [2.0, 'cred_stuffer', 'attacker', 'user3', '10.1.0.3', 'success', ''],
+    [2.5, 'normal_user_1', 'user', 'user1', '192.168.1.100', 'success', ''],
+    [3.0, 'brute_force', 'attacker', 'victim', '10.0.0.1', 'success', ''],
+]
+
+
+def test_analyze_events_metrics():
+    """Test the metrics computed from a known list of events"""
+    events = [dict(zip(HEADER, row)) for row in EVENTS]
+    metrics = analyze_events(iter(events), duration=60)
+
+    assert metrics['compromised'] == 1
+    assert metrics['compromise_rate'] == 2 / 4
+    assert metrics['time_to_compromise'] == 1.5
+    assert metrics['block_rate'] == 1 / 2
+    assert metrics['impacted_users_pct'] == 1 / 2
+    assert metrics['throughput'] == 6 / 60
+    assert metrics['total_events'] == 6
+    assert metrics['non_victim_compromised'] == 1
+
+    print("PASS: analyze_events metrics")
+
+
+def test_analyze_trial_matches_events():
+    """Test that reading the CSV gives the same metrics as the in-process events"""
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "detail_log.csv"), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(HEADER)
+            writer.writerows(EVENTS)
+
+        from_file = analyze_trial(tmp, duration=60)
+        from_events = analyze_events((dict(zip(HEADER, row)) for row in EVENTS), duration=60)
+        assert from_file == from_events
+
+    print("PASS: analyze_trial matches events")
+
+
+def test_summary_log_level_matches_full():
+    """Test that metrics collected during the run match analysis of the full log"""
+    with tempfile.TemporaryDirectory() as tmp:
+        full_dir = run_one_trial("lockout", {'max_failures': 3}, 0, os.path.join(tmp, "full"),
+                                 duration=300, log_level="full")
+        summary_dir = run_one_trial("lockout", {'max_failures': 3}, 0, os.path.join(tmp, "summary"),
+                                    duration=300, log_level="summary")
+
+        assert not os.path.exists(os.path.join(summary_dir, "detail_log.csv"))
+        assert analyze_trial(full_dir, 300) == analyze_trial(summary_dir, 300)
+
+    print("PASS: Summary log level matches full")
+
+
+def test_log_level_switch_in_same_dir():
+    """Test that re-running a trial at another log level doesn't leave the old logs behind"""
+    with tempfile.TemporaryDirectory() as tmp:
+        fresh_dir = run_one_trial("lockout", {'max_failures': 50}, 0, os.path.join(tmp, "fresh"),
+                                  duration=300, log_level="summary")
+
+        trial_dir = run_one_trial("lockout", {'max_failures': 3}, 0, os.path.join(tmp, "reused"),
+                                  duration=300, log_level="full")
+        run_one_trial("lockout", {'max_failures': 50}, 0, os.path.join(tmp, "reused"),
+                      duration=300, log_level="summary")
+        assert sorted(os.listdir(trial_dir)) == ["hashing.json", "metrics.json"]
+        assert analyze_trial(trial_dir, 300) == analyze_trial(fresh_dir, 300)
+
+        run_one_trial("lockout", {'max_failures': 50}, 0, os.path.join(tmp, "reused"),
+                      duration=300, log_level="none")
+        assert os.listdir(trial_dir) == []
+
+    print("PASS: Log level switch in same dir")
+
+
+def test_fast_forward_keeps_metrics():
+    """Test that skipping blocked attacker attempts doesn't change the metrics"""
+    with tempfile.TemporaryDirectory() as tmp:
+        normal_dir = run_one_trial("lockout", {'max_failures': 3}, 0, os.path.join(tmp, "normal"),
+                                   duration=900, log_level="summary")
+        skipped_dir = run_one_trial("lockout", {'max_failures': 3}, 0, os.path.join(tmp, "skipped"),
+                                    duration=900, log_level="summary", fast_forward_blocked=True)
+
+        assert analyze_trial(normal_dir, 900) == analyze_trial(skipped_dir, 900)
+
+    print("PASS: Fast-forward keeps metrics")
+
+
+def _small_sweep(results_dir, trials=6):
+    """Run a few short lockout trials (csv and npy logs) with their sweep_metadata.csv"""
+    os.makedirs(results_dir)
+    with open(os.path.join(results_dir, "sweep_metadata.csv"), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['trial_id', 'defense', 'param_name', 'param_value', 'seed', 'attacker_model',
+                         'config'])
+        for trial_id in range(trials):
+            max_failures = [3, 10][trial_id * 2 // trials]
+            run_one_trial("lockout", {'max_failures': max_failures}, trial_id, results_dir, duration=600,
+                          log_format=["csv", "npy"][trial_id % 2])
+            writer.writerow([trial_id, "lockout", "max_failures", max_failures, trial_id % 3, "baseline",
+                             {'max_failures': max_failures}])
+
+
+def test_parallel_analysis_matches_serial():
+    """Test that analyzing trials in worker processes writes the same summaries"""
+    with tempfile.TemporaryDirectory() as tmp:
+        results_dir = os.path.join(tmp, "results")
+        _small_sweep(results_dir)
+
+        analyze_sweep(results_dir, 600, output_dir=os.path.join(tmp, "serial"))
+        analyze_sweep(results_dir, 600, output_dir=os.path.join(tmp, "parallel"), workers=3)
+
+        for name in ["summary.csv", "summary_aggregated.csv"]:
+            assert filecmp.cmp(os.path.join(tmp, "serial", name), os.path.join(tmp, "parallel", name),
+                               shallow=False), f"{name} differs with workers"
+
+    print("PASS: Parallel analysis matches serial")
+
+
+def test_incremental_analysis():
+    """Test that re-runs only re-analyze changed trials and still write the same summaries"""
+    with tempfile.TemporaryDirectory() as tmp:
+        results_dir = os.path.join(tmp, "results")
+        _small_sweep(results_dir, trials=4)
+        analyze_sweep(results_dir, 600)
+        index_path = os.path.join(results_dir, INDEX_FILE)
+        assert os.path.exists(index_path)
+
+        # Touched but identical: matched by content hash
+        os.utime(os.path.join(results_dir, "trial_0", "detail_log.csv"), ns=(0, 0))
+        # Re-run with another setting: really changed
+        run_one_trial("lockout", {'max_failures': 5}, 1, results_dir, duration=600, log_format="npy")
+
+        index = AnalysisIndex(index_path, 600)
+        found = [index.lookup(f"trial_{i}", open_results(results_dir).subdir(f"trial_{i}")) is not None
+                 for i in range(4)]
+        assert found == [True, False, True, True], found
+        assert (index.hits, index.misses) == (3, 1)
+        # Another duration matches nothing
+        other = AnalysisIndex(index_path, 300)
+        assert other.lookup("trial_2", open_results(results_dir).subdir("trial_2")) is None
+
+        analyze_sweep(results_dir, 600)
+        analyze_sweep(results_dir, 600, output_dir=os.path.join(tmp, "full"), incremental=False)
+        for name in ["summary.csv", "summary_aggregated.csv"]:
+            assert filecmp.cmp(os.path.join(results_dir, name), os.path.join(tmp, "full", name),
+                               shallow=False), f"{name} differs from a full analysis"
+
+        # Everything is in the index now
+        index = AnalysisIndex(index_path, 600)
+        for i in range(4):
+            assert index.lookup(f"trial_{i}", open_results(results_dir).subdir(f"trial_{i}")) is not None
+
+    print("PASS: Incremental analysis")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("\nRunning analysis tests...")
+
+    test_analyze_events_metrics()
+    test_analyze_trial_matches_events()
+    test_summary_log_level_matches_full()
+    test_log_level_switch_in_same_dir()
+    test_fast_forward_keeps_metrics()
+    test_parallel_analysis_matches_serial()
+    test_incremental_analysis()
+
+    print("\nAll tests passed")
+
+
+if __name__ == "__main__":
+    run_all_tests()
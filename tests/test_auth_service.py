@@ -0,0 +1,97 @@
+"""
+test_auth_service.py - Tests for the login service and event loop
+
+Batched logins must give exactly the same results as one at a time.
+"""
+import sys
+import os
+import random
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clock import Clock
+from database import get_database
+from defenses import get_defense_policy
+from auth_service import AuthService
+from actors import create_attackers, create_users
+from run_simulation import run_simulation
+
+
+ATTEMPTS = [
+    ("testuser", "wrong", "10.0.0.1"),
+    ("testuser", "wrong", "10.0.0.1"),
+    ("nobody", "wrong", "10.0.0.2"),
+    ("testuser", "password123", "10.0.0.1"),
+    ("testuser", "wrong", "10.0.0.1"),
+    ("testuser", "password123", "10.0.0.1"),
+]
+
+
+def test_login_batch_matches_login():
+    """Test that login_batch returns and logs the same as calling login in order"""
+    for backend in ["sqlite", "memory"]:
+        with tempfile.TemporaryDirectory() as tmp:
+            outputs = []
+            for batched in [False, True]:
+                clock = Clock()
+                database = get_database(backend)
+                database.add_user("testuser", "password123", clock.now())
+                defense = get_defense_policy("lockout", database, clock, {'max_failures': 2})
+                log_file = os.path.join(tmp, f"auth_{batched}.csv")
+                auth_service = AuthService(database, clock, log_file=log_file, defense=defense)
+                
+                if batched:
+                    results = auth_service.login_batch(ATTEMPTS)
+                else:
+                    results = [auth_service.login(*attempt) for attempt in ATTEMPTS]
+                auth_service.close()
+                
+                with open(log_file) as f:
+                    outputs.append((results, f.read(), database.get_login_state("testuser")))
+            
+            assert outputs[0] == outputs[1], f"Batched logins differ on {backend}"
+            assert [r['success'] for r in outputs[1][0]] == [False, False, False, False, False, False]
+    
+    print("PASS: login_batch matches login")
+
+
+def test_batched_simulation_matches():
+    """Test that the event loop writes the same logs with and without batching"""
+    with tempfile.TemporaryDirectory() as tmp:
+        logs = []
+        for batched in [False, True]:
+            random.seed(0)
+            clock = Clock()
+            database = get_database("sqlite")
+            users = create_users(num_users=20, shared_ip=True)
+            database.add_users([("victim", "secret_password", 0.0)] +
+                               [(user.username, user.password, 0.0) for user in users])
+            defense = get_defense_policy("rate_limit_ip", database, clock, {})
+            auth_log = os.path.join(tmp, f"auth_{batched}.csv")
+            detail_log = os.path.join(tmp, f"detail_{batched}.csv")
+            auth_service = AuthService(database, clock, log_file=auth_log, defense=defense)
+            
+            actors = [(attacker, 'attacker') for attacker in create_attackers()]
+            actors += [(user, 'user') for user in users]
+            run_simulation(auth_service, clock, actors, 600, detail_log, batch_logins=batched)
+            
+            with open(auth_log) as f, open(detail_log) as g:
+                logs.append((f.read(), g.read()))
+        
+        assert logs[0] == logs[1], "Batching changed the simulation logs"
+    
+    print("PASS: Batched simulation matches")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("\nRunning auth service tests...")
+    
+    test_login_batch_matches_login()
+    test_batched_simulation_matches()
+    
+    print("\nAll tests passed")
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,152 @@
+"""
+test_checkpoint.py - Tests for checkpointing and resuming a simulation
+
+A trial that is resumed from a checkpoint has to write exactly the same
+logs as one that ran straight through.
+"""
+import sys
+import os
+import pickle
+import shutil
+import filecmp
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sweep import run_one_trial, _start_trial, CHECKPOINT_FILE
+from checkpoint import save_checkpoint
+
+
+LOG_FILES = ["auth_log.csv", "detail_log.csv"]
+
+
+def _interrupted_trial(defense_name, config, trial_dir, duration, **options):
+    """
+    Run a trial with checkpoints, then pretend it crashed at the end
+    
+    The last checkpoint is left behind and the logs already hold rows
+    written after it, like a trial killed partway through.
+    """
+    options = dict({'attacker_model': "baseline", 'backend': "sqlite", 'db_options': None, 'log_level': "full",
+                    'fast_forward_blocked': False, 'num_users': 50, 'user_model': "objects",
+                    'scheduler': "heap", 'log_format': "csv", 'compression': "none"}, **options)
+    os.makedirs(trial_dir)
+    _start_trial(defense_name, config, 0, trial_dir, duration, options['attacker_model'], options['backend'],
+                 options['db_options'], options['log_level'], options['fast_forward_blocked'],
+                 options['num_users'], options['user_model'], options['scheduler'], 500,
+                 os.path.join(trial_dir, CHECKPOINT_FILE), options['log_format'], options['compression'])
+
+
+def test_resume_identical_logs():
+    """Test that resuming from a checkpoint writes the same logs as an uninterrupted run"""
+    config = {'rate_limit_ip': {'refill_rate': 0.5, 'max_tokens': 3}, 'lockout': {'max_failures': 5}}
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        straight = run_one_trial("rate_limit_ip+lockout", config, 0, os.path.join(tmp, "straight"), duration=1800)
+        
+        resumed = os.path.join(tmp, "resumed", "trial_0")
+        _interrupted_trial("rate_limit_ip+lockout", config, resumed, 1800,
+                           db_options={'path': os.path.join(tmp, "trial.db")})
+        assert os.path.exists(os.path.join(resumed, CHECKPOINT_FILE))
+        
+        run_one_trial("rate_limit_ip+lockout", config, 0, os.path.join(tmp, "resumed"), duration=1800,
+                      db_options={'path': os.path.join(tmp, "trial.db")}, checkpoint_every=500)
+        
+        assert not os.path.exists(os.path.join(resumed, CHECKPOINT_FILE)), "Checkpoint should be removed"
+        for name in LOG_FILES:
+            assert filecmp.cmp(os.path.join(straight, name), os.path.join(resumed, name), shallow=False), \
+                f"{name} differs after resuming"
+    
+    print("PASS: Resume identical logs")
+
+
+def test_resume_summary_metrics():
+    """Test that a resumed summary trial (memory backend, calendar queue) gets the same metrics"""
+    options = {'backend': "memory", 'log_level': "summary", 'fast_forward_blocked': True, 'scheduler': "calendar"}
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        straight = run_one_trial("backoff", {}, 0, os.path.join(tmp, "straight"), duration=1800, **options)
+        
+        resumed = os.path.join(tmp, "resumed", "trial_0")
+        _interrupted_trial("backoff", {}, resumed, 1800, **options)
+        # Keep a copy of the checkpoint to resume from twice
+        shutil.copy(os.path.join(resumed, CHECKPOINT_FILE), os.path.join(tmp, "saved.pkl"))
+        
+        for _ in range(2):
+            shutil.copy(os.path.join(tmp, "saved.pkl"), os.path.join(resumed, CHECKPOINT_FILE))
+            run_one_trial("backoff", {}, 0, os.path.join(tmp, "resumed"), duration=1800, checkpoint_every=500,
+                          **options)
+            assert filecmp.cmp(os.path.join(straight, "metrics.json"), os.path.join(resumed, "metrics.json"),
+                               shallow=False), "metrics.json differs after resuming"
+    
+    print("PASS: Resume summary metrics")
+
+
+def test_checkpoint_from_other_trial_discarded():
+    """Test that a checkpoint saved with another config is thrown away instead of resumed"""
+    with tempfile.TemporaryDirectory() as tmp:
+        straight = run_one_trial("lockout", {'max_failures': 50}, 0, os.path.join(tmp, "straight"), duration=1800)
+        
+        rerun = os.path.join(tmp, "rerun", "trial_0")
+        _interrupted_trial("lockout", {'max_failures': 3}, rerun, 1800)
+        assert os.path.exists(os.path.join(rerun, CHECKPOINT_FILE))
+        
+        run_one_trial("lockout", {'max_failures': 50}, 0, os.path.join(tmp, "rerun"), duration=1800,
+                      checkpoint_every=500)
+        
+        assert not os.path.exists(os.path.join(rerun, CHECKPOINT_FILE))
+        for name in LOG_FILES:
+            assert filecmp.cmp(os.path.join(straight, name), os.path.join(rerun, name), shallow=False), \
+                f"{name} came from the old trial's checkpoint"
+    
+    print("PASS: Checkpoint from other trial discarded")
+
+
+def test_resume_cred_stuffing():
+    """Test that a credential stuffing trial checkpoints and resumes to the same logs"""
+    with tempfile.TemporaryDirectory() as tmp:
+        straight = run_one_trial("lockout", {}, 0, os.path.join(tmp, "straight"), duration=1800,
+                                 attacker_model="cred_stuffing")
+        
+        resumed = os.path.join(tmp, "resumed", "trial_0")
+        _interrupted_trial("lockout", {}, resumed, 1800, attacker_model="cred_stuffing")
+        assert os.path.exists(os.path.join(resumed, CHECKPOINT_FILE))
+        
+        run_one_trial("lockout", {}, 0, os.path.join(tmp, "resumed"), duration=1800,
+                      attacker_model="cred_stuffing", checkpoint_every=500)
+        
+        for name in LOG_FILES:
+            assert filecmp.cmp(os.path.join(straight, name), os.path.join(resumed, name), shallow=False), \
+                f"{name} differs after resuming"
+    
+    print("PASS: Resume cred stuffing")
+
+
+def test_failed_save_leaves_no_temp_file():
+    """Test that a checkpoint that can't be pickled leaves neither a checkpoint nor its temp file"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, CHECKPOINT_FILE)
+        try:
+            save_checkpoint(path, {'actors': [lambda: None]})
+            assert False, "Expected the save to fail"
+        except (AttributeError, TypeError, pickle.PicklingError):
+            pass
+        assert os.listdir(tmp) == []
+    
+    print("PASS: Failed save leaves no temp file")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("\nRunning checkpoint tests...")
+    
+    test_resume_identical_logs()
+    test_resume_summary_metrics()
+    test_checkpoint_from_other_trial_discarded()
+    test_resume_cred_stuffing()
+    test_failed_save_leaves_no_temp_file()
+    
+    print("\nAll tests passed")
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,166 @@
+"""
+test_database.py - Tests for the storage backends
+
+Both backends should behave exactly the same.
+"""
+import sys
+import os
+import sqlite3
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clock import Clock
+from database import Database, MemoryDatabase, get_database
+from defenses import get_defense
+
+
+def test_memory_backend_matches_sqlite():
+    """Test that MemoryDatabase returns the same login state as Database"""
+    for database in [Database(), MemoryDatabase()]:
+        database.add_user("testuser", "password123", 0.0)
+
+        assert database.check_password("testuser", "password123") == True
+        assert database.check_password("testuser", "wrong") == False
+        assert database.check_password("nobody", "password123") == False
+        assert database.get_login_state("nobody") is None
+
+        database.update_login_state("testuser", failed_attempts=2, locked_until=10.5)
+        state = database.get_login_state("testuser")
+        assert state == {
+            'username': 'testuser',
+            'failed_attempts': 2,
+            'locked_until': 10.5,
+            'last_failure_time': None
+        }, f"Unexpected state from {type(database).__name__}: {state}"
+
+    print("PASS: Memory backend matches SQLite")
+
+
+def test_memory_backend_lockout():
+    """Test that lockout works on the memory backend"""
+    clock = Clock()
+    database = get_database("memory")
+    database.add_user("testuser", "password123", clock.now())
+
+    check, update = get_defense("lockout", database, clock, {'max_failures': 3})
+    for i in range(3):
+        allowed, reason = check("testuser", "10.0.0.1")
+        assert allowed == True
+        update("testuser", "10.0.0.1", "failure")
+
+    allowed, reason = check("testuser", "10.0.0.1")
+    assert allowed == False
+    assert reason == "locked"
+
+    print("PASS: Memory backend lockout")
+
+
+def test_batched_commits():
+    """Test that writes are only committed once the batch is full or flushed"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "trial.db")
+        database = Database(path=path, commit_every=3)
+        database.add_user("testuser", "password123", 0.0)
+        database.update_login_state("testuser", failed_attempts=1)
+        assert database.pending_writes == 2
+
+        # A second connection can't see the batched writes yet
+        other = sqlite3.connect(path)
+        assert other.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+
+        # But this connection can
+        assert database.get_login_state("testuser")['failed_attempts'] == 1
+
+        database.update_login_state("testuser", failed_attempts=2)
+        assert database.pending_writes == 0, "Third write should commit the batch"
+        assert other.execute("SELECT failed_attempts FROM login_state").fetchone()[0] == 2
+
+        database.update_login_state("testuser", failed_attempts=3)
+        database.flush()
+        assert other.execute("SELECT failed_attempts FROM login_state").fetchone()[0] == 3
+
+        other.close()
+        database.conn.close()
+
+    print("PASS: Batched commits")
+
+
+def test_commit_window():
+    """Test that batched writes commit once the simulated-time window passes"""
+    clock = Clock()
+    database = Database(commit_every=1000, commit_window=10.0, clock=clock)
+    database.add_user("testuser", "password123", clock.now())
+    assert database.pending_writes == 1
+
+    clock.advance(10.0)
+    database.update_login_state("testuser", failed_attempts=1)
+    assert database.pending_writes == 0, "Window passed, batch should be committed"
+
+    print("PASS: Commit window")
+
+
+def test_add_users_bulk():
+    """Test that add_users adds everything, or nothing if a row is bad"""
+    for database in [Database(), MemoryDatabase()]:
+        users = ((f"user{i}", f"pass{i}", 0.0) for i in range(25))
+        stats = database.add_users(users)
+        assert stats['users_added'] == 25
+        assert database.check_password("user24", "pass24") == True
+        assert database.get_login_state("user24")['failed_attempts'] == 0
+
+        # Duplicate username - the whole batch should be rejected
+        try:
+            database.add_users([("new_user", "pw", 0.0), ("user0", "pw", 0.0)])
+            assert False, "Duplicate username should raise"
+        except (ValueError, sqlite3.IntegrityError):
+            pass
+        assert database.get_login_state("new_user") is None
+
+    print("PASS: Bulk add_users")
+
+
+def test_password_cache():
+    """Test that repeat guesses hit the cache and a password change invalidates it"""
+    for database in [Database(password_cache_size=2), MemoryDatabase(password_cache_size=2)]:
+        database.add_user("testuser", "password123", 0.0)
+        cache = database.password_cache
+        
+        assert database.check_password("testuser", "wrong") == False
+        assert database.check_password("testuser", "wrong") == False
+        assert cache.hits == 1 and cache.misses == 1
+        
+        database.set_password("testuser", "wrong")
+        assert database.check_password("testuser", "wrong") == True, "Stale verdict after password change"
+        assert database.check_password("testuser", "password123") == False
+        
+        # Size 2 - the oldest guess is dropped
+        database.check_password("testuser", "third")
+        assert cache.stats()['size'] == 2
+        assert cache.evictions == 1
+        
+        # A user added later must not keep a cached "no such user"
+        assert database.check_password("later", "pw") == False
+        database.add_user("later", "pw", 0.0)
+        assert database.check_password("later", "pw") == True
+    
+    assert Database(password_cache_size=0).password_cache is None
+    
+    print("PASS: Password cache")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("\nRunning database tests...")
+
+    test_memory_backend_matches_sqlite()
+    test_memory_backend_lockout()
+    test_batched_commits()
+    test_commit_window()
+    test_add_users_bulk()
+    test_password_cache()
+
+    print("\nAll tests passed")
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -9,7 +9,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from clock import Clock
 from database import Database
-from defenses import get_defense
+from defenses import get_defense, get_defense_policy, rate_limit_defense, TokenBucketStore
 
 
 def test_lockout_triggers_at_threshold():
@@ -178,6 +178,130 @@ def test_hybrid_checks_ip_then_account():
     print("PASS: Hybrid checks IP then account")
 
 
+def test_bucket_store_tracks_each_key():
+    """Test that the bucket store keeps separate state per key"""
+    clock = Clock()
+    buckets = TokenBucketStore()
+    
+    # Two attempts from IP A, one from IP B
+    rate_limit_defense(buckets, clock, "10.0.0.1", None, None, 1.0, 2)
+    rate_limit_defense(buckets, clock, "10.0.0.1", None, None, 1.0, 2)
+    rate_limit_defense(buckets, clock, "10.0.0.2", None, None, 1.0, 2)
+    
+    assert len(buckets) == 2
+    assert buckets.get("10.0.0.1") == (0.0, 0.0)
+    assert buckets.get("10.0.0.2") == (1.0, 0.0)
+    assert buckets.get("10.0.0.3") is None
+    
+    # A is empty, B still has a token
+    allowed, reason = rate_limit_defense(buckets, clock, "10.0.0.1", None, None, 1.0, 2)
+    assert allowed == False
+    allowed, reason = rate_limit_defense(buckets, clock, "10.0.0.2", None, None, 1.0, 2)
+    assert allowed == True
+    
+    print("PASS: Bucket store tracks each key")
+
+
+def test_bucket_sweep_keeps_decisions():
+    """Test that dropping full buckets doesn't change any decision"""
+    import random
+    rng = random.Random(7)
+    
+    clock_a, clock_b = Clock(), Clock()
+    policy_a = get_defense_policy("rate_limit_ip", Database(), clock_a, {'refill_rate': 0.3, 'max_tokens': 2})
+    policy_b = get_defense_policy("rate_limit_ip", Database(), clock_b,
+                                  {'refill_rate': 0.3, 'max_tokens': 2, 'bucket_sweep_interval': 5.0})
+    
+    for i in range(3000):
+        step = rng.choice([0.0, 0.1, 0.5, 1.0])
+        clock_a.advance(step)
+        clock_b.advance(step)
+        ip = f"10.0.0.{rng.randrange(20)}"
+        assert policy_a.check("user", ip) == policy_b.check("user", ip), f"Decision differs at attempt {i}"
+    
+    stats = policy_b.bucket_stats()
+    assert stats['evicted'] > 0, "Some full buckets should have been dropped"
+    assert stats['buckets'] + stats['evicted'] > policy_a.bucket_stats()['buckets']
+    
+    print("PASS: Bucket sweep keeps decisions")
+
+
+def test_policy_reads_state_once():
+    """Test that evaluate + commit gives the same lockout as check + update, with fewer reads"""
+    clock = Clock()
+    database = Database()
+    database.add_user("testuser", "password123", clock.now())
+    
+    reads = []
+    get_login_state = database.get_login_state
+    def counting_get(username):
+        reads.append(username)
+        return get_login_state(username)
+    database.get_login_state = counting_get
+    
+    policy = get_defense_policy("lockout", database, clock, {'max_failures': 3})
+    for i in range(3):
+        decision = policy.evaluate("testuser", "10.0.0.1")
+        assert decision.allowed == True
+        policy.commit(decision, "failure")
+    
+    assert len(reads) == 3, "One state read per attempt"
+    
+    decision = policy.evaluate("testuser", "10.0.0.1")
+    assert decision.allowed == False
+    assert decision.reason == "locked"
+    
+    print("PASS: Policy reads state once")
+
+
+def test_rate_limit_single_charge():
+    """Test that double_charge=False uses exactly one token per allowed attempt"""
+    clock = Clock()
+    database = Database()
+    
+    for double_charge, expected_allowed in [(True, 2), (False, 4)]:
+        policy = get_defense_policy("rate_limit", database, clock,
+                                    {'refill_rate': 0.0, 'max_tokens': 4, 'double_charge': double_charge})
+        allowed = 0
+        for i in range(6):
+            decision = policy.evaluate("testuser", "10.0.0.1")
+            if decision.allowed:
+                allowed += 1
+                policy.commit(decision, "failure")
+        assert allowed == expected_allowed, f"double_charge={double_charge}: {allowed} allowed"
+    
+    print("PASS: Rate limit single charge")
+
+
+def test_composed_defense():
+    """Test that "a AND b" blocks when any part blocks, and per-part config works"""
+    clock = Clock()
+    database = Database()
+    database.add_user("testuser", "password123", clock.now())
+    
+    config = {'ip_rate': {'refill_rate': 0.1, 'max_tokens': 10},
+              'lockout': {'max_failures': 2, 'lockout_time': 300}}
+    policy = get_defense_policy("ip_rate AND lockout", database, clock, config)
+    assert get_defense_policy("rate_limit_ip+lockout", database, clock, config).names == ('rate_limit_ip', 'lockout')
+    
+    for i in range(2):
+        decision = policy.evaluate("testuser", "10.0.0.1")
+        assert decision.allowed == True
+        policy.commit(decision, "failure")
+    
+    decision = policy.evaluate("testuser", "10.0.0.1")
+    assert decision.allowed == False
+    assert decision.reason == "locked"
+    
+    try:
+        get_defense_policy("lockout AND nonsense", database, clock, config)
+        assert False, "Unknown part should raise"
+    except ValueError:
+        pass
+    
+    print("PASS: Composed defense")
+
+
 def run_all_tests():
     """Run all tests"""
     print("\nRunning defense tests...")
@@ -188,6 +312,11 @@ def run_all_tests():
     test_token_bucket_blocks_when_empty()
     test_token_bucket_refills()
     test_hybrid_checks_ip_then_account()
+    test_bucket_store_tracks_each_key()
+    test_bucket_sweep_keeps_decisions()
+    test_policy_reads_state_once()
+    test_rate_limit_single_charge()
+    test_composed_defense()
     
     print("\nAll tests passed")
 
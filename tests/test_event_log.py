@@ -0,0 +1,104 @@
+"""
+test_event_log.py - Tests for the binary event log
+
+The binary log has to hold exactly what detail_log.csv holds, and give
+analyze_trial exactly the same metrics.
+"""
+import sys
+import os
+import filecmp
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import event_log
+from event_log import csv_to_event_log, event_log_to_csv, event_log_metrics, load_event_log
+from analyze_sweep import analyze_trial
+from sweep import run_one_trial
+
+
+def test_csv_round_trip():
+    """Test that CSV -> binary -> CSV gives back the same bytes and the same metrics"""
+    with tempfile.TemporaryDirectory() as tmp:
+        trial_dir = run_one_trial("lockout", {'max_failures': 5, 'lockout_duration': 300}, 0, tmp,
+                                  duration=1800, attacker_model="cred_stuffing")
+        csv_log = os.path.join(trial_dir, "detail_log.csv")
+        binary_log = os.path.join(tmp, "detail_log.npy")
+        round_trip = os.path.join(tmp, "round_trip.csv")
+        
+        rows = csv_to_event_log(csv_log, binary_log)
+        assert event_log_to_csv(binary_log, round_trip) == rows
+        assert filecmp.cmp(csv_log, round_trip, shallow=False), "Round trip changed the CSV"
+        
+        expected = analyze_trial(trial_dir, 1800)
+        assert expected['non_victim_compromised'] > 0, "Trial should compromise other users"
+        
+        # Vectorized with numpy, and row by row without it
+        paths = [True, False] if event_log.HAS_NUMPY else [False]
+        for use_numpy in paths:
+            event_log.HAS_NUMPY = use_numpy
+            try:
+                assert event_log_metrics(binary_log).results(1800) == expected
+            finally:
+                event_log.HAS_NUMPY = paths[0]
+        
+        if event_log.HAS_NUMPY:
+            import numpy as np
+            results = np.load(binary_log, mmap_mode='r')['result']
+            assert len(results) == rows
+            log = load_event_log(binary_log)
+            assert (results == log.value_id('result', 'success')).any()
+    
+    print("PASS: CSV round trip")
+
+
+def test_npy_trial_matches_csv():
+    """Test that a trial written as npy analyzes the same as one written as CSV"""
+    config = {'refill_rate': 0.5, 'max_tokens': 3}
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_trial = run_one_trial("rate_limit", config, 0, os.path.join(tmp, "csv"), duration=1800)
+        npy_trial = run_one_trial("rate_limit", config, 0, os.path.join(tmp, "npy"), duration=1800,
+                                  log_format="npy")
+        
+        assert not os.path.exists(os.path.join(npy_trial, "detail_log.csv"))
+        assert analyze_trial(npy_trial, 1800) == analyze_trial(csv_trial, 1800)
+        
+        converted = os.path.join(tmp, "converted.csv")
+        event_log_to_csv(os.path.join(npy_trial, "detail_log.npy"), converted)
+        assert filecmp.cmp(os.path.join(csv_trial, "detail_log.csv"), converted, shallow=False)
+        assert os.path.getsize(os.path.join(npy_trial, "detail_log.npy")) < \
+            os.path.getsize(os.path.join(csv_trial, "detail_log.csv"))
+    
+    print("PASS: npy trial matches CSV")
+
+
+def test_log_format_switch_in_same_dir():
+    """Test that re-running a trial in the other log format replaces the old detail log"""
+    with tempfile.TemporaryDirectory() as tmp:
+        for first, second in [("npy", "csv"), ("csv", "npy")]:
+            fresh = run_one_trial("lockout", {'max_failures': 50}, 0, os.path.join(tmp, f"fresh_{second}"),
+                                  duration=600, log_format=second)
+            
+            output_dir = os.path.join(tmp, f"{first}_then_{second}")
+            run_one_trial("lockout", {'max_failures': 3}, 0, output_dir, duration=600, log_format=first)
+            trial_dir = run_one_trial("lockout", {'max_failures': 50}, 0, output_dir, duration=600,
+                                      log_format=second)
+            
+            assert not os.path.exists(os.path.join(trial_dir, f"detail_log.{first}"))
+            assert analyze_trial(trial_dir, 600) == analyze_trial(fresh, 600)
+    
+    print("PASS: Log format switch in same dir")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("\nRunning event log tests...")
+    
+    test_csv_round_trip()
+    test_npy_trial_matches_csv()
+    test_log_format_switch_in_same_dir()
+    
+    print("\nAll tests passed")
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,67 @@
+"""
+test_log_sink.py - Tests for the buffered CSV log writer
+"""
+import sys
+import os
+import csv
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_sink import CsvLogSink
+
+
+def read_rows(path):
+    with open(path, 'r', newline='') as f:
+        return list(csv.reader(f))
+
+
+def test_sink_buffers_until_threshold():
+    """Test that rows stay in memory until flush_every is reached"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "log.csv")
+        sink = CsvLogSink(path, ['a', 'b'], flush_every=3)
+
+        sink.write([1, 2])
+        sink.write([3, 4])
+        assert sink.rows_written == 0, "Rows should still be buffered"
+
+        sink.write([5, 6])
+        assert sink.rows_written == 3, "Third row should trigger a flush"
+
+        sink.write([7, 8])
+        sink.close()
+
+        assert read_rows(path) == [['a', 'b'], ['1', '2'], ['3', '4'], ['5', '6'], ['7', '8']]
+        assert sink.closed
+
+    print("PASS: Sink buffers until threshold")
+
+
+def test_sink_flushes_on_exception():
+    """Test that buffered rows are written when the with-block raises"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "log.csv")
+        try:
+            with CsvLogSink(path, ['a'], flush_every=100) as sink:
+                sink.write(['x'])
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+
+        assert read_rows(path) == [['a'], ['x']]
+
+    print("PASS: Sink flushes on exception")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("\nRunning log sink tests...")
+
+    test_sink_buffers_until_threshold()
+    test_sink_flushes_on_exception()
+
+    print("\nAll tests passed")
+
+
+if __name__ == "__main__":
+    run_all_tests()
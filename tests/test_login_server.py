@@ -0,0 +1,177 @@
+"""
+test_login_server.py - Tests for the asyncio login server and load generator
+"""
+import sys
+import os
+import json
+import asyncio
+import threading
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clock import WallClock
+from login_server import LoginServer, build_auth_service
+from load_generator import run_against_local_server, percentile
+
+
+def test_load_generator_both_protocols():
+    """Test that the load generator gets answers over TCP and HTTP and reports latency"""
+    for protocol in ["tcp", "http"]:
+        report = asyncio.run(run_against_local_server("lockout", protocol=protocol, num_users=10,
+                                                      concurrency=4, duration=10.0, max_requests=200))
+        assert report['requests'] >= 200
+        assert report['success'] + report['failed'] + report['blocked'] == report['requests']
+        assert report['blocked'] > 0, "Lockout should block the brute force attacker"
+        assert 0 < report['p50_ms'] <= report['p99_ms']
+    
+    print("PASS: Load generator over TCP and HTTP")
+
+
+def test_percentile():
+    """Test percentile on an unsorted list"""
+    assert percentile([5, 1, 3, 2, 4], 50) == 3
+    assert percentile([5, 1, 3, 2, 4], 100) == 5
+    
+    print("PASS: percentile")
+
+
+def test_wall_clock():
+    """Test that WallClock.advance moves the clock forward"""
+    clock = WallClock()
+    clock.advance(100)
+    assert clock.now() >= 100
+    
+    print("PASS: WallClock")
+
+
+def test_server_rejects_bad_request():
+    """Test that a bad line gets a 400-style error after the good ones are answered"""
+    async def exchange():
+        server = await LoginServer(build_auth_service("lockout", num_users=1), protocol="tcp").start()
+        try:
+            reader, writer = await asyncio.open_connection(server.host, server.port)
+            writer.write(b'{"username": "victim", "password": "secret_password"}\nnot json\n')
+            await writer.drain()
+            answers = [json.loads(await reader.readline()) for _ in range(2)]
+            closed = await reader.read() == b""
+            writer.close()
+            return answers, closed
+        finally:
+            await server.close()
+    
+    answers, closed = asyncio.run(exchange())
+    assert answers[0] == {'success': True}
+    assert 'error' in answers[1]
+    assert closed, "Server should close the connection after a bad request"
+    
+    print("PASS: Server rejects bad request")
+
+
+def test_server_rejects_wrong_types():
+    """Test that non-string fields get a 400-style error instead of reaching the database"""
+    async def exchange(line):
+        server = await LoginServer(build_auth_service("lockout", num_users=1), protocol="tcp").start()
+        try:
+            reader, writer = await asyncio.open_connection(server.host, server.port)
+            writer.write(line + b"\n")
+            await writer.drain()
+            answer = json.loads(await reader.readline())
+            writer.close()
+            return answer
+        finally:
+            await server.close()
+    
+    for line in [b'{"username": ["x"], "password": "a"}', b'{"username": "victim", "password": 1}',
+                 b'{"username": "victim", "password": "a", "ip": {}}']:
+        answer = asyncio.run(exchange(line))
+        assert 'must be a string' in answer['error'], answer
+    
+    print("PASS: Server rejects wrong types")
+
+
+def test_server_answers_login_errors():
+    """Test that a login raising an exception gets an error answer and the connection stays usable"""
+    async def exchange():
+        auth_service = build_auth_service("lockout", num_users=1)
+        login = auth_service.login
+        
+        def failing_login(username, password, ip):
+            if username == "boom":
+                raise RuntimeError("database went away")
+            return login(username, password, ip)
+        
+        auth_service.login = failing_login
+        server = await LoginServer(auth_service, protocol="tcp").start()
+        try:
+            reader, writer = await asyncio.open_connection(server.host, server.port)
+            writer.write(b'{"username": "boom", "password": "a"}\n'
+                         b'{"username": "victim", "password": "secret_password"}\n')
+            await writer.drain()
+            answers = [json.loads(await reader.readline()) for _ in range(2)]
+            writer.close()
+            return answers
+        finally:
+            await server.close()
+    
+    answers = asyncio.run(exchange())
+    assert 'database went away' in answers[0]['error']
+    assert answers[1] == {'success': True}
+    
+    print("PASS: Server answers login errors")
+
+
+def test_server_backpressure():
+    """Test that a connection stops being read once max_pipelined requests are waiting"""
+    max_pipelined = 4
+    sent = 20
+    
+    async def exchange():
+        auth_service = build_auth_service("lockout", num_users=1)
+        release = threading.Event()
+        
+        def slow_login(username, password, ip):
+            release.wait()
+            return {'success': False, 'reason': username}
+        
+        auth_service.login = slow_login
+        server = await LoginServer(auth_service, protocol="tcp", max_pipelined=max_pipelined).start()
+        try:
+            reader, writer = await asyncio.open_connection(server.host, server.port)
+            writer.write(b"".join(b'{"username": "user%d", "password": "a"}\n' % i for i in range(sent)))
+            await writer.drain()
+            
+            # The first login is stuck, so only the queue's worth more get read
+            await asyncio.sleep(0.2)
+            read_while_stuck = server.requests_read
+            release.set()
+            
+            answers = [json.loads(await reader.readline()) for _ in range(sent)]
+            writer.close()
+            return read_while_stuck, answers
+        finally:
+            release.set()
+            await server.close()
+    
+    read_while_stuck, answers = asyncio.run(exchange())
+    assert read_while_stuck == max_pipelined + 1, read_while_stuck
+    assert [answer['reason'] for answer in answers] == [f"user{i}" for i in range(sent)]
+    
+    print("PASS: Server backpressure")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("\nRunning login server tests...")
+    
+    test_load_generator_both_protocols()
+    test_percentile()
+    test_wall_clock()
+    test_server_rejects_bad_request()
+    test_server_rejects_wrong_types()
+    test_server_answers_login_errors()
+    test_server_backpressure()
+    
+    print("\nAll tests passed")
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,84 @@
+"""
+test_passwords.py - Tests for password hashing
+
+Every hasher should accept the right password and nothing else.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database, MemoryDatabase
+from passwords import get_hasher, verify_password, VerifierPool
+
+
+def test_hashers_verify():
+    """Test that each hasher verifies its own hashes, salted ones differently each time"""
+    hashers = [get_hasher("sha256"), get_hasher("pbkdf2", iterations=1000),
+               get_hasher("scrypt", n=16, r=1, p=1)]
+    for hasher in hashers:
+        stored = hasher.hash("password123")
+        assert hasher.verify("password123", stored) == True
+        assert hasher.verify("password124", stored) == False
+        assert verify_password("password123", stored) == True
+        
+        if hasher.name != "sha256":
+            assert hasher.hash("password123") != stored, "Salted hashes should differ"
+        
+        stats = hasher.stats()
+        assert stats['verifications'] == 2
+        assert stats['verify_cpu_seconds'] >= 0.0
+    
+    print("PASS: Hashers verify")
+
+
+def test_verifier_pool():
+    """Test that check_passwords on a pool gives the same verdicts as check_password"""
+    hasher = get_hasher("pbkdf2", iterations=1000)
+    credentials = [("user1", "pass1"), ("user1", "wrong"), ("nobody", "pass1"), ("user2", "pass2")]
+    
+    for kind in ["thread", "process"]:
+        with VerifierPool(hasher, workers=2, kind=kind) as pool:
+            for database in [Database(verifier=pool, password_cache_size=0),
+                             MemoryDatabase(verifier=pool, password_cache_size=0)]:
+                database.add_users([("user1", "pass1", 0.0), ("user2", "pass2", 0.0)])
+                expected = [database.check_password(u, p) for u, p in credentials]
+                assert expected == [True, False, False, True]
+                assert database.check_passwords(credentials) == expected
+    
+    # Pool work is counted on the shared hasher ("nobody" is never hashed)
+    assert hasher.stats()['verifications'] == 2 * 2 * (3 + 3)
+    
+    print("PASS: Verifier pool")
+
+
+def test_salted_hasher_counts_every_check():
+    """Test that the verdict cache is off with a salted hasher, so repeat guesses are all hashed"""
+    for database_class in [Database, MemoryDatabase]:
+        assert database_class().password_cache is not None
+        
+        database = database_class(hasher=get_hasher("pbkdf2", iterations=1000))
+        assert database.password_cache is None
+        database.add_users([("user1", "pass1", 0.0)])
+        for _ in range(5):
+            assert not database.check_password("user1", "wrong")
+        assert database.hashing_stats()['verifications'] == 5
+        
+        # Still on when asked for
+        assert database_class(hasher="pbkdf2", password_cache_size=16).password_cache is not None
+    
+    print("PASS: Salted hasher counts every check")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("\nRunning password tests...")
+    
+    test_hashers_verify()
+    test_verifier_pool()
+    test_salted_hasher_counts_every_check()
+    
+    print("\nAll tests passed")
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,79 @@
+"""
+test_population.py - Tests for the NumPy user population
+
+UserPopulation should behave like the same number of NormalUser objects.
+These tests are skipped when numpy isn't installed.
+"""
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from population import HAS_NUMPY
+from analyze_sweep import analyze_trial
+from sweep import run_one_trial
+
+
+def test_population_matches_objects():
+    """Test that a population trial has about the same user metrics as NormalUser objects"""
+    if not HAS_NUMPY:
+        print("SKIP: numpy not installed")
+        return
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for user_model in ["objects", "population"]:
+            totals = {'total_events': 0, 'block_rate': 0.0, 'impacted_users_pct': 0.0}
+            for seed in range(3):
+                trial_dir = run_one_trial("rate_limit_ip", {'refill_rate': 0.5, 'max_tokens': 3}, seed,
+                                          os.path.join(tmp, user_model), duration=1800, num_users=200,
+                                          user_model=user_model)
+                metrics = analyze_trial(trial_dir, 1800)
+                totals['total_events'] += metrics['total_events']
+                totals['block_rate'] += metrics['block_rate'] / 3
+                totals['impacted_users_pct'] += metrics['impacted_users_pct'] / 3
+            results[user_model] = totals
+        
+        objects, population = results['objects'], results['population']
+        assert abs(population['total_events'] / objects['total_events'] - 1) < 0.1, results
+        assert abs(population['block_rate'] - objects['block_rate']) < 0.05, results
+        assert abs(population['impacted_users_pct'] - objects['impacted_users_pct']) < 0.1, results
+    
+    print("PASS: Population matches objects")
+
+
+def test_population_events_in_order():
+    """Test that the population hands out users in time order across heap refills"""
+    if not HAS_NUMPY:
+        print("SKIP: numpy not installed")
+        return
+    from population import UserPopulation
+    
+    population = UserPopulation(1000, seed=1, chunk_size=16)
+    last_time = 0.0
+    seen = set()
+    for i in range(5000):
+        next_time = population.next_attempt_time(last_time)
+        assert next_time >= last_time, f"Event {i} went back in time"
+        username, password, ip = population.get_credentials()
+        seen.add(username)
+        population.record_result(success=not password.endswith("X"))
+        last_time = next_time
+    
+    assert len(seen) == 1000, "Every user should log in within the first minute"
+    
+    print("PASS: Population events in order")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("\nRunning population tests...")
+    
+    test_population_matches_objects()
+    test_population_events_in_order()
+    
+    print("\nAll tests passed")
+
+
+if __name__ == "__main__":
+    run_all_tests()
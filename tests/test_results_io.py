@@ -0,0 +1,115 @@
+"""
+test_results_io.py - Tests for reading results from zip archives and compressed logs
+
+Analysis has to give the same numbers whether the logs are plain files,
+compressed, or still inside a zip archive.
+"""
+import sys
+import os
+import csv
+import gzip
+import filecmp
+import zipfile
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analyze_sweep import analyze_sweep, analyze_trial
+from results_io import open_results, HAS_ZSTD
+from sweep import run_one_trial
+
+
+def _make_sweep(results_dir, compression="none"):
+    """Two trials and their sweep_metadata.csv, like run_sweep writes"""
+    configs = [{'max_failures': 3}, {'max_failures': 10}]
+    with open(os.path.join(results_dir, "sweep_metadata.csv"), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['trial_id', 'defense', 'param_name', 'param_value', 'seed', 'attacker_model', 'config'])
+        for trial_id, config in enumerate(configs):
+            run_one_trial("lockout", config, trial_id, results_dir, duration=600, attacker_model="cred_stuffing",
+                          compression=compression)
+            writer.writerow([trial_id, "lockout", "max_failures", config['max_failures'], 0, "cred_stuffing",
+                             config])
+
+
+def test_compressed_trial():
+    """Test that a gzip trial writes the same rows and analyzes the same as a plain one"""
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = run_one_trial("lockout", {'max_failures': 3}, 0, os.path.join(tmp, "plain"), duration=900)
+        packed = run_one_trial("lockout", {'max_failures': 3}, 0, os.path.join(tmp, "gzip"), duration=900,
+                               compression="gzip")
+        
+        assert sorted(os.listdir(packed)) == ["auth_log.csv.gz", "detail_log.csv.gz", "hashing.json"]
+        for name in ["auth_log.csv", "detail_log.csv"]:
+            with open(os.path.join(plain, name), 'rb') as f, gzip.open(os.path.join(packed, name + ".gz")) as g:
+                assert f.read() == g.read(), f"{name} differs when compressed"
+        assert analyze_trial(packed, 900) == analyze_trial(plain, 900)
+    
+    print("PASS: Compressed trial")
+
+
+def test_zstd_trial():
+    """Test that a zstd trial writes the same rows and analyzes the same as a plain one"""
+    if not HAS_ZSTD:
+        print("SKIP: zstandard not installed")
+        return
+    import zstandard
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = run_one_trial("lockout", {'max_failures': 3}, 0, os.path.join(tmp, "plain"), duration=900)
+        packed = run_one_trial("lockout", {'max_failures': 3}, 0, os.path.join(tmp, "zstd"), duration=900,
+                               compression="zstd")
+        
+        assert sorted(os.listdir(packed)) == ["auth_log.csv.zst", "detail_log.csv.zst", "hashing.json"]
+        for name in ["auth_log.csv", "detail_log.csv"]:
+            with open(os.path.join(plain, name), 'rb') as f, open(os.path.join(packed, name + ".zst"), 'rb') as z:
+                assert f.read() == zstandard.ZstdDecompressor().stream_reader(z).read(), \
+                    f"{name} differs when compressed"
+        assert analyze_trial(packed, 900) == analyze_trial(plain, 900)
+    
+    print("PASS: zstd trial")
+
+
+def test_analyze_zip_archive():
+    """Test that a sweep analyzed inside a zip (Windows paths, gzip members) matches the directory"""
+    with tempfile.TemporaryDirectory() as tmp:
+        results_dir = os.path.join(tmp, "results")
+        os.makedirs(results_dir)
+        _make_sweep(results_dir, compression="gzip")
+        analyze_sweep(results_dir, 600)
+        
+        # Archive it the way paper_results.zip was made, with backslashes
+        archive = os.path.join(tmp, "archive.zip")
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as z:
+            for root, _, files in os.walk(results_dir):
+                for name in files:
+                    path = os.path.join(root, name)
+                    z.write(path, "\\".join(["results"] + os.path.relpath(path, results_dir).split(os.sep)))
+        
+        # One sweep in the archive, so the bare archive name finds it
+        with open_results(archive) as results:
+            assert str(results) == archive + "/results"
+        assert results.archive.fp is None, "Archive should be closed"
+        analyze_sweep(archive, 600, output_dir=os.path.join(tmp, "from_zip"))
+        for name in ["summary.csv", "summary_aggregated.csv"]:
+            assert filecmp.cmp(os.path.join(results_dir, name), os.path.join(tmp, "from_zip", name),
+                               shallow=False), f"{name} differs when read from the zip"
+        
+        trial = os.path.join(archive, "results", "trial_1")
+        assert analyze_trial(trial, 600) == analyze_trial(os.path.join(results_dir, "trial_1"), 600)
+    
+    print("PASS: Analyze zip archive")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("\nRunning results I/O tests...")
+    
+    test_compressed_trial()
+    test_zstd_trial()
+    test_analyze_zip_archive()
+    
+    print("\nAll tests passed")
+
+
+if __name__ == "__main__":
+    run_all_tests()
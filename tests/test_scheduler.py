@@ -0,0 +1,75 @@
+"""
+test_scheduler.py - Tests for the event schedulers
+
+Every scheduler has to hand events back in exactly the order heapq
+would, or simulation logs would change with the scheduler.
+"""
+import sys
+import os
+import random
+import filecmp
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import HeapScheduler, CalendarQueue
+from sweep import run_one_trial
+
+
+def test_calendar_matches_heap():
+    """Test that the calendar queue pops the same events as the heap, ties and resizes included"""
+    rng = random.Random(0)
+    heap = HeapScheduler()
+    calendar = CalendarQueue()
+    
+    now = 0.0
+    for step in range(20000):
+        # Grow to a few thousand events, then drain, so buckets resize both ways
+        if step < 12000 and rng.random() < 0.7 or not heap:
+            # Coarse times give lots of ties on time, broken by actor index
+            event = (now + rng.choice([0.0, 0.5, 1.0, rng.random() * 100]), rng.randrange(50), 'user')
+            heap.push(event)
+            calendar.push(event)
+        else:
+            assert calendar.peek_time() == heap.peek_time()
+            event = heap.pop()
+            assert calendar.pop() == event, f"Step {step}: calendar queue out of order"
+            now = event[0]
+        assert len(calendar) == len(heap)
+    
+    while heap:
+        assert calendar.pop() == heap.pop()
+    assert len(calendar) == 0
+    assert calendar.resizes > 2, "Queue should have resized while growing and shrinking"
+    
+    print("PASS: Calendar queue matches heap")
+
+
+def test_calendar_trial_identical():
+    """Test that a trial writes the same logs with either scheduler"""
+    with tempfile.TemporaryDirectory() as tmp:
+        trial_dirs = {}
+        for scheduler in ["heap", "calendar"]:
+            trial_dirs[scheduler] = run_one_trial("lockout", {'max_failures': 5, 'lockout_duration': 300}, 0,
+                                                  os.path.join(tmp, scheduler), duration=1800,
+                                                  scheduler=scheduler)
+        
+        for name in ["auth_log.csv", "detail_log.csv"]:
+            assert filecmp.cmp(os.path.join(trial_dirs['heap'], name),
+                               os.path.join(trial_dirs['calendar'], name), shallow=False), \
+                f"{name} differs between schedulers"
+    
+    print("PASS: Calendar trial identical")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("\nRunning scheduler tests...")
+    
+    test_calendar_matches_heap()
+    test_calendar_trial_identical()
+    
+    print("\nAll tests passed")
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,67 @@
+"""
+test_trial_cache.py - Tests for the sweep trial cache
+"""
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trial_cache import TrialCache, trial_key
+
+
+def make_trial(trial_dir, text):
+    """Write fake trial log files"""
+    os.makedirs(trial_dir, exist_ok=True)
+    for name in ['auth_log.csv', 'detail_log.csv']:
+        with open(os.path.join(trial_dir, name), 'w') as f:
+            f.write(text)
+
+
+def test_key_changes_with_inputs():
+    """Test that any input change gives a different key"""
+    base = trial_key("lockout", {'max_failures': 3}, 0, 60, "baseline", version="v1")
+    assert base == trial_key("lockout", {'max_failures': 3}, 0, 60, "baseline", version="v1")
+    assert base != trial_key("lockout", {'max_failures': 5}, 0, 60, "baseline", version="v1")
+    assert base != trial_key("lockout", {'max_failures': 3}, 1, 60, "baseline", version="v1")
+    assert base != trial_key("lockout", {'max_failures': 3}, 0, 60, "baseline", version="v2")
+
+    print("PASS: Key changes with inputs")
+
+
+def test_store_restore_and_evict():
+    """Test that a stored trial comes back, and eviction respects max_bytes"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = TrialCache(os.path.join(tmp, "cache"))
+        make_trial(os.path.join(tmp, "trial_0"), "abc")
+
+        assert cache.restore("k0", os.path.join(tmp, "restored")) == False
+        cache.store("k0", os.path.join(tmp, "trial_0"))
+        assert cache.restore("k0", os.path.join(tmp, "restored")) == True
+        with open(os.path.join(tmp, "restored", "detail_log.csv")) as f:
+            assert f.read() == "abc"
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        cache.store("k1", os.path.join(tmp, "trial_0"))
+        os.utime(os.path.join(tmp, "cache", "k0", "cache_meta.json"), (0, 0))
+
+        # Only room for one entry - the least recently used (k0) goes
+        cache.max_bytes = 60
+        assert cache.evict() == 1
+        assert not os.path.exists(os.path.join(tmp, "cache", "k0"))
+        assert os.path.exists(os.path.join(tmp, "cache", "k1"))
+
+    print("PASS: Store, restore and evict")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("\nRunning trial cache tests...")
+
+    test_key_changes_with_inputs()
+    test_store_restore_and_evict()
+
+    print("\nAll tests passed")
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,156 @@
+"""
+trial_cache.py - Skip sweep trials that have already been run
+
+A trial's outputs only depend on its inputs (defense, config, seed,
+duration, attacker model and run options) and on the simulator code.
+We hash all of those into a key and keep a copy of whatever files the
+trial wrote under that key. Next time the same trial comes up we just
+copy them back.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+
+
+# Source files that decide what a trial produces. Editing any of them
+# changes the code version, so old cache entries stop matching.
+SIMULATOR_FILES = [
+    'actors.py',
+    'auth_service.py',
+    'clock.py',
+    'database.py',
+    'defenses.py',
+    'event_log.py',
+    'log_sink.py',
+    'metrics.py',
+    'passwords.py',
+    'population.py',
+    'results_io.py',
+    'run_simulation.py',
+    'scheduler.py',
+    'sweep.py',
+]
+
+META_FILE = 'cache_meta.json'
+
+
+def code_version():
+    """Hash of the simulator source files"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for name in SIMULATOR_FILES:
+        path = os.path.join(here, name)
+        if os.path.exists(path):
+            digest.update(name.encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def trial_key(defense_name, config, seed, duration, attacker_model, version=None, **options):
+    """
+    Content hash identifying one trial
+    
+    options: Any other run_one_trial settings that change its output
+             (backend, log_level, ...)
+    """
+    if version is None:
+        version = code_version()
+    spec = {
+        'defense': defense_name,
+        'config': config,
+        'seed': seed,
+        'duration': duration,
+        'attacker_model': attacker_model,
+        'options': options,
+        'code_version': version,
+    }
+    blob = json.dumps(spec, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class TrialCache:
+    """
+    Directory of cached trial outputs, one subdirectory per key
+
+    max_age: Drop entries not used for this many seconds (None = keep)
+    max_bytes: Drop least recently used entries above this size (None = no limit)
+    """
+    def __init__(self, cache_dir, max_age=None, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def restore(self, key, trial_dir):
+        """Copy a cached trial into trial_dir - returns False on a miss"""
+        entry = self._entry_dir(key)
+        if not os.path.exists(os.path.join(entry, META_FILE)):
+            self.misses += 1
+            return False
+
+        os.makedirs(trial_dir, exist_ok=True)
+        for name in os.listdir(entry):
+            if name != META_FILE:
+                shutil.copyfile(os.path.join(entry, name), os.path.join(trial_dir, name))
+
+        # Mark as recently used for eviction
+        os.utime(os.path.join(entry, META_FILE))
+        self.hits += 1
+        return True
+
+    def store(self, key, trial_dir, spec=None):
+        """Save the files a finished trial wrote under key"""
+        entry = self._entry_dir(key)
+        # Write to a temp dir first so a crash never leaves half an entry
+        tmp = f"{entry}.tmp{os.getpid()}"
+        os.makedirs(tmp, exist_ok=True)
+        for name in os.listdir(trial_dir):
+            path = os.path.join(trial_dir, name)
+            if os.path.isfile(path):
+                shutil.copyfile(path, os.path.join(tmp, name))
+        with open(os.path.join(tmp, META_FILE), 'w') as f:
+            json.dump({'created': time.time(), 'spec': spec}, f, default=str)
+
+        if os.path.exists(entry):
+            shutil.rmtree(tmp)
+        else:
+            os.rename(tmp, entry)
+
+    def evict(self):
+        """
+        Remove old entries, then the least recently used ones until the
+        cache fits in max_bytes. Returns how many entries were removed.
+        """
+        now = time.time()
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry = self._entry_dir(key)
+            meta = os.path.join(entry, META_FILE)
+            if not os.path.exists(meta):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+            entries.append((os.path.getmtime(meta), size, entry))
+
+        # Oldest first
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+
+        for last_used, size, entry in entries:
+            too_old = self.max_age is not None and now - last_used > self.max_age
+            too_big = self.max_bytes is not None and total > self.max_bytes
+            if not (too_old or too_big):
+                continue
+            shutil.rmtree(entry)
+            total -= size
+            removed += 1
+
+        return removed